@@ -1,5 +1,7 @@
 import indextuning_utility_k8s as idx_utility
+import indextuning_paths
 import os
+import sys
 import shutil
 import logging
 from pathlib import Path
@@ -27,12 +29,20 @@ logging.basicConfig(
 
 utility = idx_utility.utility()
 
-base_dir = Path("/opt/splunk/var/lib/splunk")
+# Read the indexes.conf files directly rather than running btool, run indextuning_confresolver.py -verify to confirm
+# the resolved settings match btool on this host before enabling
+NATIVE_RESOLVER = False
+# The parsed index list is re-used while the indexes.conf files are unchanged
+CATALOG_CACHE_FILE = "/opt/splunk/var/run/splunk/dead_index_remover_catalog.json"
+
+# $SPLUNK_DB as used when resolving the index paths (/opt/splunk/var/lib/splunk by default)
+base_dir = Path(indextuning_paths.default_splunk_db())
+base_dir_realpath = os.path.realpath(base_dir)
 
 logging.info("Begin script")
 
 # Determine the index/volume list we are working with
-index_list, vol_list = utility.parse_btool_output()
+index_list, vol_list = utility.parse_btool_output(native_resolver=NATIVE_RESOLVER, cache_file=CATALOG_CACHE_FILE)
 
 # List of files/directories that must be retained
 keep_list = {
@@ -48,22 +58,41 @@ keep_list = {
     "persistentstorage"
 }
 
+# The directory within base_dir of a resolved path, for example _internaldb, None if the path is not within base_dir
+# the parent directories are compared after resolving symbolic links so a different spelling of base_dir still matches
+def base_dir_entry(path):
+   if path is None:
+       return None
+   path = os.path.normpath(path)
+   while True:
+       parent = os.path.dirname(path)
+       if parent == path:
+           return None
+       if parent == str(base_dir) or os.path.realpath(parent) == base_dir_realpath:
+           return os.path.basename(path)
+       path = parent
+
+mapped_index_count = 0
+
 for index in index_list:
-   home_path = index_list[index].home_path
-   if "$SPLUNK_DB" in home_path:
-       home_path = home_path.replace("$SPLUNK_DB/","")
-       home_path = home_path.replace("$_index_name", index)
-   thawed_path = index_list[index].thawed_path
-   home_path = home_path.replace("/db","").lower()
-   thawed_path = thawed_path.replace("/thaweddb","")
-   thawed_path = thawed_path.replace("$SPLUNK_DB/","")
-   thawed_path = thawed_path.replace("/opt/splunk/var/lib/splunk/","")
-   logging.debug(f"Adding {index} to keep list, along with path {home_path} and thawed_path={thawed_path}")
-   keep_list.add(home_path)
-   # thawed path can use mixed case, all others default to lowercase
-   keep_list.add(thawed_path)
+   # the resolved paths have volume:, $SPLUNK_DB and $_index_name expanded (the thawed path can use mixed case, all others are lowercase)
+   home_path = base_dir_entry(index_list[index].home_path_resolved)
+   cold_path = base_dir_entry(index_list[index].cold_path_resolved)
+   tstats_home_path = base_dir_entry(index_list[index].tstats_home_path_resolved)
+   thawed_path = base_dir_entry(index_list[index].thawed_path_resolved)
+   logging.debug(f"Adding {index} to keep list, along with path {home_path}, cold_path={cold_path}, tstats_home_path={tstats_home_path} and thawed_path={thawed_path}")
+   for path in (home_path, cold_path, tstats_home_path, thawed_path):
+       if path is not None:
+           keep_list.add(path)
+   if home_path is not None or cold_path is not None or tstats_home_path is not None or thawed_path is not None:
+       mapped_index_count = mapped_index_count + 1
    keep_list.add(index.lower() + ".dat")
 
+# If no index is stored within base_dir the paths are not resolving as expected, deleting would remove live indexes
+if mapped_index_count == 0:
+    logging.warning("No index paths were found within base_dir=%s (index_count=%s), aborting without deleting anything", base_dir, len(index_list))
+    sys.exit(1)
+
 AGE_DAYS = 30
 cutoff_time = datetime.now() - timedelta(days=AGE_DAYS)
 
@@ -1,6 +1,8 @@
 import logging
 import datetime
 
+import indextuning_sizing
+
 logger = logging.getLogger()
 
 
@@ -9,6 +11,8 @@ def run_bucket_sizing(utility, index_list, index_name_restriction, index_limit,
     min_size_to_calculate, num_of_indexers, rep_factor_multiplier, do_not_lose_data_flag):
 
     todays_date = datetime.datetime.now().strftime("%Y-%m-%d")
+    # the hours may come from the command line or a snapshot/scenario as a string
+    num_hours_per_bucket = float(num_hours_per_bucket)
 
     counter = 0
     auto_high_volume_sizeMB = 10240
@@ -18,6 +22,12 @@ def run_bucket_sizing(utility, index_list, index_name_restriction, index_limit,
         index_count = index_limit
 
     logger.info("Running queries to determine bucket sizing, licensing, et cetera")
+    # Unless we are restricted to a single index, run one dbinspect across all indexes and lookup each index
+    bucket_sizes = False
+    if not index_name_restriction:
+        logger.info("Running determine_recommended_bucket_size_bulk")
+        bucket_sizes = utility.determine_recommended_bucket_size_bulk(num_hours_per_bucket)
+
     # Actually run the various Splunk query functions to find bucket sizing, compression ratios and license usage
     for index_name in list(index_list.keys()):
         # If we have a restriction on which indexes to look at, skip the loop until we hit our specific index name
@@ -30,10 +40,14 @@ def run_bucket_sizing(utility, index_list, index_name_restriction, index_limit,
         # If we're performing a limited run quit the loop early when we reach the limit
         if counter > index_limit:
             break
-        # function returns a float for recommended_bucket_size
-        logger.info("index=%s, running determine_recommended_bucket_size" % (index_name))
-
-        index_list[index_name].recommended_bucket_size = utility.determine_recommended_bucket_size(index_name, num_hours_per_bucket)
+        # function returns a float for recommended_bucket_size, no dbinspect results is recorded as zero
+        if bucket_sizes != False:
+            index_list[index_name].recommended_bucket_size = bucket_sizes.get(index_name, float(0))
+        else:
+            logger.info("index=%s, running determine_recommended_bucket_size" % (index_name))
+            index_list[index_name].recommended_bucket_size = utility.determine_recommended_bucket_size(index_name, num_hours_per_bucket)
+        if num_hours_per_bucket > 0:
+            index_list[index_name].bucket_size_per_hour = index_list[index_name].recommended_bucket_size / num_hours_per_bucket
         # Add % bucket_contingency to bucket sizing
         index_list[index_name].recommended_bucket_size = index_list[index_name].recommended_bucket_size * bucket_contingency
 
@@ -46,7 +60,7 @@ def run_bucket_sizing(utility, index_list, index_name_restriction, index_limit,
     conf_files_requiring_changes = []
 
     counter = 0
-    logger.info("Now running bucket sizing calculations")
+    index_names = []
     for index_name in list(index_list.keys()):
         logger.debug("Working on index=%s with counter=%s" % (index_name, counter))
         # If we have a restriction on which indexes to look at, skip the loop until we hit our specific index name
@@ -59,31 +73,29 @@ def run_bucket_sizing(utility, index_list, index_name_restriction, index_limit,
         if counter > index_limit:
             break
 
+        index_list[index_name].number_recommended_bucket_size = index_list[index_name].recommended_bucket_size
+        if index_list[index_name].index_comp_ratio is None:
+            logger.warn("index=%s has no data on disk so unable to do any bucket sizing calculations" % (index_name))
+            continue
+        index_names.append(index_name)
+
+    # The calculations run across all indexes at once, the results are applied per index below
+    logger.info("Now running bucket sizing calculations")
+    sizing = indextuning_sizing.bucket_sizing(index_list, index_names, num_of_indexers, rep_factor_multiplier, bucket_contingency,
+        min_size_to_calculate, do_not_lose_data_flag, upper_comp_ratio_level)
+
+    for position, index_name in enumerate(index_names):
         # Shorter names to the various index attributes
         max_hot_buckets = index_list[index_name].max_hot_buckets
         bucket_size = index_list[index_name].max_data_size
         conf_file = index_list[index_name].conf_file
         recommended_bucket_size = index_list[index_name].recommended_bucket_size
-        index_list[index_name].number_recommended_bucket_size = index_list[index_name].recommended_bucket_size
 
         frozen_time_period_in_days = int(index_list[index_name].frozen_time_period_in_secs)/60/60/24
-        avg_license_usage_per_day = index_list[index_name].avg_license_usage_per_day
-
-        summary_index = index_list[index_name].summary_index
-
-        # Company specific field here, the commented size per day in the indexes.conf file
-        sizing_comment = -1
-        if hasattr(index_list[index_name],"size_per_day_in_mb"):
-            sizing_comment = int(index_list[index_name].size_per_day_in_mb)
-
-        if not hasattr(index_list[index_name], "index_comp_ratio"):
-            logger.warn("index=%s has no data on disk so unable to do any bucket sizing calculations" % (index_name))
-            continue
-        index_comp_ratio = index_list[index_name].index_comp_ratio
         splunk_max_disk_usage_mb = index_list[index_name].splunk_max_disk_usage_mb
         oldest_data_found = index_list[index_name].oldest_data_found
-        max_total_data_size_mb = float(index_list[index_name].max_total_data_size_mb)
 
+        index_comp_ratio = index_list[index_name].index_comp_ratio
         # If the compression ratio is unusually large warn but continue for now
         if index_comp_ratio > upper_comp_ratio_level:
             logger.info("index=%s, returned index_compression_ratio=%s, this is above the expected max_index_compression_ratio=%s, "\
@@ -93,19 +105,15 @@ def run_bucket_sizing(utility, index_list, index_name_restriction, index_limit,
         # If we have a really, really small amount of data such as hundreds of kilobytes the metadata can be larger than the raw data resulting in a compression ratio of 500
         # (i.e. the stored size is 500 times larger on disk than it is in raw data, resulting in other calculations such as bucket sizing getting broken
         # the alternative size calculation is used for this reason, and if the data is too small to calculate we use an upper bound on the ratio as a safety
-        if splunk_max_disk_usage_mb > min_size_to_calculate:
-            # If the data is poorly parsed (e.g. dates go well into the past) then the MB/day might be greater than what appears via dbinspect
-            # and therefore we might need to sanity check this based on license usage * storage ratio / number of indexers / (potential hot buckets)
-            # we add contingency to this as well
-            alt_bucket_size_calc = ((index_list[index_name].max_license_usage_per_day * index_comp_ratio * rep_factor_multiplier) / num_of_indexers) / max_hot_buckets
-            alt_bucket_size_calc = alt_bucket_size_calc * bucket_contingency
-
-            if alt_bucket_size_calc > recommended_bucket_size:
-                logger.info("index=%s alternative_bucket_size_calculation=%s, original recommended_bucket_size=%s, new recommended_bucket_size=%s" % (index_name, alt_bucket_size_calc, recommended_bucket_size, alt_bucket_size_calc))
-                recommended_bucket_size = alt_bucket_size_calc
-                index_list[index_name].recommended_bucket_size = recommended_bucket_size
-                index_list[index_name].number_recommended_bucket_size = recommended_bucket_size
-        else:
+        # If the data is poorly parsed (e.g. dates go well into the past) then the MB/day might be greater than what appears via dbinspect
+        # and therefore we might need to sanity check this based on license usage * storage ratio / number of indexers / (potential hot buckets)
+        if sizing["use_alt_bucket_size"][position]:
+            alt_bucket_size_calc = sizing["alt_bucket_size"][position]
+            logger.info("index=%s alternative_bucket_size_calculation=%s, original recommended_bucket_size=%s, new recommended_bucket_size=%s" % (index_name, alt_bucket_size_calc, recommended_bucket_size, alt_bucket_size_calc))
+            recommended_bucket_size = alt_bucket_size_calc
+            index_list[index_name].recommended_bucket_size = recommended_bucket_size
+            index_list[index_name].number_recommended_bucket_size = recommended_bucket_size
+        elif not sizing["alt_calculated"][position]:
             logger.info("index=%s had a comp_ratio=%s and a splunk_total_size=%s, this is less than the lower_bound=%s, not performing the alternative bucket size calculation, oldest_data_found=%s days old" % (index_name, index_comp_ratio, splunk_max_disk_usage_mb, min_size_to_calculate, oldest_data_found))
         # We only change values where required, otherwise we output the line as we read it
         requires_change = False
@@ -114,59 +122,26 @@ def run_bucket_sizing(utility, index_list, index_name_restriction, index_limit,
             logger.warn("Not an auto sized bucket for index=" + index_name + " this index will be excluded from sizing")
             continue
         # It is an auto sized bucket, this makes it slightly different
-        logger.debug("index=%s auto sized bucket with bucket_size=%s" % (index_name, bucket_size))
-        end = bucket_size.find("_")
-        # With auto sized buckets we probably care more when the buckets are too small rather than too large (for now)
-        bucket_auto_size = float(bucket_size[0:end])
-        perc_diff = (100 / bucket_auto_size)*recommended_bucket_size
+        logger.debug("index=%s auto sized bucket with bucket_size=%s perc_diff=%s" % (index_name, bucket_size, sizing["perc_diff"][position]))
 
         # If the calculated size of the index usage is less than
         # max_hot_buckets * bucket_size
         # Do not give out free space by increasing the bucket sizing unless its a summary index
         # So if calculation > calculated_size we do not increase to auto_high_volume
         # if calculated_size < calculated_size we ensure we are using auto setting (not auto_high_volume)
-        # Edge case if sizing comment is specified
-        if sizing_comment >= 0:
-            # If we have a do not lose data flag use the larger of the average license usage or the sizing comment
-            if do_not_lose_data_flag:
-                if avg_license_usage_per_day > sizing_comment:
-                    license_calc_size = avg_license_usage_per_day
-                else:
-                    license_calc_size = sizing_comment
-            else:
-                license_calc_size = sizing_comment
-        else:
-            license_calc_size = avg_license_usage_per_day
-
-        decrease_required = False
-        increase_allowed = True
-        calculated_size = (index_comp_ratio * license_calc_size * frozen_time_period_in_days * rep_factor_multiplier)/num_of_indexers
-        if (max_hot_buckets * bucket_auto_size) > calculated_size and not summary_index and bucket_size == "10240_auto":
-            decrease_required = True
-            logger.debug("index=%s requires a bucket_decrease as it has a (max_hot_buckets=%s * bucket_auto_size=%s() > ((index_comp_ratio=%s * license_calc_size=%s" \
+        # Edge case if sizing comment is specified, the license_calc_size is the larger of the comment and the average license usage
+        # if we have a do not lose data flag
+        license_calc_size = sizing["license_calc_size"][position]
+        decrease_required = sizing["decrease_required"][position]
+        if decrease_required:
+            logger.debug("index=%s requires a bucket_decrease as it has a (max_hot_buckets=%s * bucket_size=%s() > ((index_comp_ratio=%s * license_calc_size=%s" \
                 " * frozen_time_period_in_days=%s * rep_factor_multiplier=%s) / num_of_indexers=%s) == %s"
-                % (index_name, max_hot_buckets, bucket_auto_size, index_comp_ratio, license_calc_size, frozen_time_period_in_days,
-                rep_factor_multiplier, num_of_indexers, calculated_size))
-        elif (max_hot_buckets * 10240) > calculated_size and not summary_index and bucket_size == "750_auto":
-            increase_allowed = False
-            logger.debug("index=%s lacks the license usage/agreed size for an increase (max_hot_buckets=%s * bucket_auto_size=%s) > ((index_comp_ratio=%s * license_calc_size=%s" \
-                " * frozen_time_period_in_days=%s * rep_factor_multiplier=%s) / num_of_indexers=%s) == %s"
-                % (index_name, max_hot_buckets, bucket_auto_size, index_comp_ratio, license_calc_size, frozen_time_period_in_days,
-                rep_factor_multiplier, num_of_indexers, calculated_size))
+                % (index_name, max_hot_buckets, bucket_size, index_comp_ratio, license_calc_size, frozen_time_period_in_days,
+                rep_factor_multiplier, num_of_indexers, sizing["calculated_size"][position]))
 
         # If we expect to exceed the auto size in use, go to the auto_high_volume setting, assuming we are not already there
-        if perc_diff > 100 and not bucket_size == "10240_auto":
-            homepath_max_data_size_mb = index_list[index_name].homepath_max_data_size_mb
-
-            #logger.debug("homepath_max_data_size_mb=%s and auto_high_volume_sizeMB * max_hot_buckets calc=%s and max_total_data_size_mb=%s"
-            #    % (homepath_max_data_size_mb, auto_high_volume_sizeMB * max_hot_buckets, max_total_data_size_mb))
-            #if homepath_max_data_size_mb != 0.0 and (auto_high_volume_sizeMB * max_hot_buckets) > homepath_max_data_size_mb:
-            #    logger.warn("index=%s would require an auto_high_volume (10GB) bucket but the homepath_max_data_size_mb=%s "\
-            #                "cannot fit max_hot_buckets=%s of that size, not changing the bucket sizing" % (index_name, homepath_max_data_size_mb, max_hot_buckets))
-            #elif homepath_max_data_size_mb == 0.0 and (auto_high_volume_sizeMB * max_hot_buckets) > max_total_data_size_mb:
-            #    logger.warn("index=%s would require an auto_high_volume (10GB) bucket but the max_total_data_size_mb=%s "\
-            #                "cannot fit max_hot_buckets=%s buckets of that size, not changing the bucket sizing" % (index_name, max_total_data_size_mb, max_hot_buckets))
-            if not increase_allowed:
+        if sizing["increase_candidate"][position]:
+            if not sizing["increase_allowed"][position]:
                 logger.warn("index=%s would require an auto_high_volume (10GB) bucket but it lacks the license usage/agreed size for an increase based on the calculation"  \
                     "(max_hot_buckets=%s * bucket_size=%s) > ((index_comp_ratio=%s * license_calc_size=%s * frozen_time_period_in_days=%s * rep_factor_multiplier=%s)" \
                     " / num_of_indexers=%s)"
@@ -174,9 +149,6 @@ def run_bucket_sizing(utility, index_list, index_name_restriction, index_limit,
                     rep_factor_multiplier, num_of_indexers))
             else:
                 requires_change = "bucket"
-                # If we don't have any change comments so far create the dictionary
-                if not hasattr(index_list[index_name], "change_comment"):
-                    index_list[index_name].change_comment = {}
                 # Write comments into the output files so we know what tuning occured and when
                 index_list[index_name].change_comment['bucket'] = "# Bucket size increase required estimated %s, auto-tuned on %s\n" % (index_list[index_name].number_recommended_bucket_size, todays_date)
                 # Simplify to auto_high_volume
@@ -185,27 +157,22 @@ def run_bucket_sizing(utility, index_list, index_name_restriction, index_limit,
                 index_list[index_name].max_data_size = "10240_auto"
                 logger.info("index=%s file=%s current bucket size is auto tuned maxDataSize=%s, recommended_bucket_size=%s "\
                 "(will be set to auto_high_volume (size increase)), max_hot_buckets=%s" % (index_name, conf_file, bucket_size, recommended_bucket_size, max_hot_buckets))
-        else:
-            # Bucket is smaller than current sizing, is it below the auto 750MB default or not, and is it currently set to a larger value?
-            if (recommended_bucket_size < 750 and bucket_auto_size > 750) or decrease_required:
-                requires_change = "bucket"
-                # If we don't have any change comments so far create the dictionary
-                if not hasattr(index_list[index_name],"change_comment"):
-                    index_list[index_name].change_comment = {}
-
-                # Write comments into the output files so we know what tuning occured and when
-                index_list[index_name].change_comment['bucket'] = "# Bucket size decrease required estimated %s, auto-tuned on %s\n" % (index_list[index_name].number_recommended_bucket_size, todays_date)
-                index_list[index_name].recommended_bucket_size = "auto"
-                # Update index object so index tuning is aware of this change
-                index_list[index_name].max_data_size = "750_auto"
-                if decrease_required:
-                    logger.info("index=%s file=%s current bucket size is auto tuned to maxDataSize=%s, recommended_bucket_size=%s "\
-                        "(will be set to auto (size decrease)), max_hot_buckets=%s this was decreased due to not fitting auto_high_volume into " \
-                        "the allocated index space"
-                        % (index_name, conf_file, bucket_size, recommended_bucket_size, max_hot_buckets))
-                else:
-                    logger.info("index=%s file=%s current bucket size is auto tuned to maxDataSize=%s, recommended_bucket_size=%s "\
-                        "(will be set to auto (size decrease)), max_hot_buckets=%s" % (index_name, conf_file, bucket_size, recommended_bucket_size, max_hot_buckets))
+        # Bucket is smaller than current sizing, is it below the auto 750MB default or not, and is it currently set to a larger value?
+        elif sizing["decrease"][position]:
+            requires_change = "bucket"
+            # Write comments into the output files so we know what tuning occured and when
+            index_list[index_name].change_comment['bucket'] = "# Bucket size decrease required estimated %s, auto-tuned on %s\n" % (index_list[index_name].number_recommended_bucket_size, todays_date)
+            index_list[index_name].recommended_bucket_size = "auto"
+            # Update index object so index tuning is aware of this change
+            index_list[index_name].max_data_size = "750_auto"
+            if decrease_required:
+                logger.info("index=%s file=%s current bucket size is auto tuned to maxDataSize=%s, recommended_bucket_size=%s "\
+                    "(will be set to auto (size decrease)), max_hot_buckets=%s this was decreased due to not fitting auto_high_volume into " \
+                    "the allocated index space"
+                    % (index_name, conf_file, bucket_size, recommended_bucket_size, max_hot_buckets))
+            else:
+                logger.info("index=%s file=%s current bucket size is auto tuned to maxDataSize=%s, recommended_bucket_size=%s "\
+                    "(will be set to auto (size decrease)), max_hot_buckets=%s" % (index_name, conf_file, bucket_size, recommended_bucket_size, max_hot_buckets))
 
         # If this index requires change we record this for later
         if requires_change != False:
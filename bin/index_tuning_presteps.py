@@ -1,10 +1,14 @@
 import logging
+import indextuning_snapshot
 
 logger = logging.getLogger()
 
 
 # Shared functions required by both index tuning/sizing & bucket tuning/sizing
-def index_tuning_presteps(utility, index_list, index_ignore_list, earliest_license, latest_license, index_name_restriction, index_limit, indexerhostnamefilter, useIntrospectionData, indexes_not_getting_sized):
+# if previous_snapshot is passed in (the -incremental mode) any index with unchanged settings and license usage
+# within the license_change_threshold re-uses the previous metrics, the list of unchanged indexes is returned
+def index_tuning_presteps(utility, index_list, index_ignore_list, earliest_license, latest_license, index_name_restriction, index_limit, indexerhostnamefilter, useIntrospectionData, indexes_not_getting_sized,
+    previous_snapshot=False, license_change_threshold=0.1):
     logger.info("Running index_tuning_presteps")
     conf_files_to_check = {}
     for index in list(index_list.keys()):
@@ -27,6 +31,7 @@ def index_tuning_presteps(utility, index_list, index_ignore_list, earliest_licen
     if index_limit < index_count:
         index_count = index_limit
 
+    index_names = []
     for index_name in list(index_list.keys()):
         # If we have a restriction on which indexes to look at, skip the loop until we hit our specific index name
         if index_name_restriction:
@@ -40,44 +45,76 @@ def index_tuning_presteps(utility, index_list, index_ignore_list, earliest_licen
         if counter > index_limit:
             break
 
-        # Actually check license usage per index over the past X days, function returns three ints
+        # record the settings before the sizing functions change the index object
+        index_list[index_name].btool_settings = indextuning_snapshot.capture_settings(index_list[index_name])
+        index_names.append(index_name)
+        counter = counter + 1
+
+    # Unless we are restricted to a single index, one search grouped by idx provides the license usage of every
+    # index rather than scanning the license logs once per index
+    license_usage = False
+    if not index_name_restriction:
+        logger.info("Running determine_license_usage_per_day_bulk")
+        license_usage = utility.determine_license_usage_per_day_bulk(earliest_license, latest_license)
+
+    # Any searches still required per index run concurrently, each call only returns values and the index objects are
+    # updated afterwards in the original index order
+    def determine_license_metrics(index_name):
         logger.info("index=%s running determine_license_usage_per_day" % (index_name))
-        index_list[index_name].avg_license_usage_per_day, index_list[index_name].first_seen, index_list[index_name].max_license_usage_per_day = \
-            utility.determine_license_usage_per_day(index_name, earliest_license, latest_license)
+        return utility.determine_license_usage_per_day(index_name, earliest_license, latest_license)
+
+    if license_usage == False:
+        license_usage = utility.run_concurrently(determine_license_metrics, index_names)
 
-        # Determine compression ratio of each index, function returns floats, index_comp_ratio is re-used during index sizing so required by both index sizing
-        # and bucket sizing scenarios
+    # Actually check license usage per index over the past X days, three ints, no license data is recorded as zero usage
+    for index_name in index_names:
+        index_list[index_name].avg_license_usage_per_day, index_list[index_name].first_seen, index_list[index_name].max_license_usage_per_day = \
+            license_usage.get(index_name, (0, 0, 0))
+
+    # In incremental mode the indexes that have not changed since the previous run re-use the previous metrics
+    unchanged_index_names = []
+    if previous_snapshot != False:
+        for index_name in index_names:
+            if indextuning_snapshot.is_unchanged(previous_snapshot, index_list[index_name], license_change_threshold):
+                indextuning_snapshot.restore_metrics(previous_snapshot, index_list[index_name])
+                unchanged_index_names.append(index_name)
+        logger.info("Incremental mode found unchanged_index_count=%s of index_count=%s" % (len(unchanged_index_names), len(index_names)))
+        index_names = [ index_name for index_name in index_names if index_name not in unchanged_index_names ]
+
+    comp_ratios = False
+    if not index_name_restriction and len(index_names) > 0:
+        logger.info("Running determine_compression_ratio_bulk")
+        comp_ratios = utility.determine_compression_ratio_bulk(indexerhostnamefilter, useIntrospectionData)
+
+    def determine_comp_ratio_metrics(index_name):
         logger.info("index=%s running determine_compression_ratio" % (index_name))
+        return utility.determine_compression_ratio(index_name, indexerhostnamefilter, useIntrospectionData)
+
+    if comp_ratios == False:
+        comp_ratios = utility.run_concurrently(determine_comp_ratio_metrics, index_names)
+
+    # Determine compression ratio of each index, function returns floats, index_comp_ratio is re-used during index sizing so required by both index sizing
+    # and bucket sizing scenarios
+    # no data on disk is recorded with a comp ratio of 0.5 as a guess, as per determine_compression_ratio
+    for index_name in index_names:
         index_list[index_name].index_comp_ratio, index_list[index_name].splunk_max_disk_usage_mb, index_list[index_name].oldest_data_found, index_list[index_name].newest_data_found = \
-            utility.determine_compression_ratio(index_name, indexerhostnamefilter, useIntrospectionData)
+            comp_ratios.get(index_name, (float(0.5), float(0), int(0), int(0)))
 
-        index_list[index_name].summary_index = False
-        avg_license_usage_per_day = index_list[index_name].avg_license_usage_per_day
-        # Zero license usage, this could be a summary index
-        if avg_license_usage_per_day == 0:
-            json_result = utility.run_search_query("| metadata index=%s type=sourcetypes | table sourcetype" % (index_name))
-            # Load the result so that it's formatted into a dictionary instead of string
-
-            # If we get no results back assume its not a summary index
-            if "results" in json_result and len(json_result["results"]) == 1 and json_result["results"][0]["sourcetype"] == "stash":
-                # At this point we know its a summary index
-                # So we can use the average growth rate to determine if any sizing changes are required
-                json_result = utility.run_search_query(""" search index=_introspection \"data.name\"=\"%s\"
-                | bin _time span=1d
-                | stats max(data.total_size) AS total_size by host, _time
-                | streamstats current=f window=1 max(total_size) AS prev_total by host
-                | eval diff=total_size - prev_total
-                | stats avg(diff) AS avgchange by host
-                | stats avg(avgchange) AS overallavg""" % (index_name))
-
-                # Load the result so that it's formatted into a dictionary instead of string
-                if "results" in json_result and len(json_result["results"]) == 1:
-                    summary_usage_change_per_day = float(json_result["results"][0]["overallavg"])
-                    logger.info("index=%s is a summary index, average_change_per_day=%s from introspection logs" % (index_name, summary_usage_change_per_day))
-                    index_list[index_name].summary_usage_change_per_day = summary_usage_change_per_day
-                index_list[index_name].summary_index = True
+    # Zero license usage, this could be a summary index, detection happens once here for all of these indexes
+    # and the result is stored on the index so that index sizing does not need to re-run these searches
+    zero_license_index_names = [ index_name for index_name in index_names if index_list[index_name].avg_license_usage_per_day == 0 ]
+    logger.info("Running determine_summary_indexes_bulk for index_count=%s" % (len(zero_license_index_names)))
+    summary_indexes = utility.determine_summary_indexes_bulk(zero_license_index_names)
+    if summary_indexes == False:
+        summary_indexes = utility.run_concurrently(utility.determine_summary_index, zero_license_index_names)
 
-        counter = counter + 1
+    for index_name in index_names:
+        index_list[index_name].summary_index = False
+        if index_name in summary_indexes:
+            summary_index, summary_usage_change_per_day = summary_indexes[index_name]
+            index_list[index_name].summary_index = summary_index
+            if summary_usage_change_per_day is not None:
+                index_list[index_name].summary_usage_change_per_day = summary_usage_change_per_day
 
     # At this point we have indexes that we are supposed to ignore in the dictionary, we need them there so we could
     # ensure that we didn't suggest deleting them from the filesystem, however now we can ignore them so we do not
@@ -96,3 +133,5 @@ def index_tuning_presteps(utility, index_list, index_ignore_list, earliest_licen
     #        logger.info("index=%s is excluded from tuning due to not been of type events, type=%s" % (index_name, datatype))
     #        indexes_not_getting_sized[index_name] = index_list[index_name]
     #        del index_list[index_name]
+
+    return unchanged_index_names
@@ -6,6 +6,10 @@ import os
 import indextuning_utility as idx_utility
 import indextuning_indextempoutput
 import indextuning_dirchecker
+import indextuning_searchcache
+import indextuning_snapshot
+import indextuning_forecast
+import indextuning_deleter
 import datetime
 import shutil
 import argparse
@@ -61,11 +65,20 @@ What does this script do?
     * Checking max_total_data_size_mb of each index, and the size of the volumes set in Splunk, determine if we have over-allocated based
       on the worst case usage scenario that all max_total_data_size_mb is in use
     * If index tuning is occurring and this switch is passed a more accurate estimate of index sizing is provided
+    * The combined growth of the indexes is forecast over forecastDays days, the days until the volumes are full and the daily
+      growth curve are written to disk_forecast.json / disk_forecast.csv in the workingPath
+    * Each volume is also forecast on its own (hot and cold volumes are often on different storage), the growth of an index is
+      on the homePath volume until homePath.maxDataSizeMB is reached and then on the coldPath volume
 
  deadIndexCheck mode
     * Check the relevant Splunk directories for index storage and determine if there are directories in these locations that no longer map to an index stanza in the config
     this commonly happens when an index is renamed leaving extra directories on the filesystem that will never delete themselves
     * Unless the deadIndexDelete flag is also passed in this will not actually delete any files, it will provide a listing of what appears to be extra files
+      with deadIndexDelete the directories are moved into a .indextuning_trash directory and deleted in the background (throttled by
+      deleteFilesPerSecond / deleteMBPerSecond), a killed run is resumed from dead_dir_deletion.json in the workingPath by the next run
+      or by python indextuning_deleter.py -journalFile <workingPath>/dead_dir_deletion.json
+    * The space used by each dead directory (hot, cold, summaries and thawed) and the total per volume is written to dead_dirs.json / dead_dirs.csv
+      in the workingPath largest first, the sizes are cached in the workingPath until the directory changes
 
  Indexes datatype can be event or metric, if metrics we do the same tuning but we avoid data loss as the chance of accidentally flooding a metrics index with data
  is very low...dbinspect still works along with other queries, and as of 7.3+ the license usage is now limited to 150 bytes/metric (it can be less now)
@@ -120,7 +133,7 @@ parser.add_argument('-latest_license', help='Latest point in time to find licens
 parser.add_argument('-numberOfIndexers', help='Number of indexers the tuning should be based on', default="6", type=int)
 
 # For bucket tuning, aim for 24 hours of data per bucket for now, we add contingency to this anyway
-parser.add_argument('-num_hours_per_bucket', help='Aim for approximate number of hours per bucket (not including contingency)', default="24")
+parser.add_argument('-num_hours_per_bucket', help='Aim for approximate number of hours per bucket (not including contingency)', default=24.0, type=float)
 
 # Add 20% contingency to the result for buckets
 parser.add_argument('-bucket_contingency', help='Contingency multiplier for buckets', default=1.2, type=float)
@@ -171,16 +184,40 @@ parser.add_argument('-upper_comp_ratio_level', help="Comp ratio limit where a wa
 # Multiply license usage by this multiplier to take into account index replication
 parser.add_argument('-rep_factor_multiplier', help='Multiply by rep factor (for example if 2 copies of raw/indexed data, 2.0 works', default=2.0, type=float)
 
+# Timeouts/retries used for each search against the REST API, a failed search is logged and the run continues
+parser.add_argument('-connect_timeout', help='Seconds to wait for a connection to the REST API before retrying', default=10, type=float)
+parser.add_argument('-read_timeout', help='Seconds to wait for a search to return results before retrying', default=600, type=float)
+parser.add_argument('-search_retries', help='Number of times a failed search is retried (with backoff) before moving on', default=3, type=int)
+# Search results can be cached in the workingPath so re-runs with different sizing parameters do not re-run every search
+parser.add_argument('-searchCacheTTL', help='(optional) seconds that cached search results are re-used for (for example 14400 to re-use the results for 4 hours), defaults to 0 (the search cache is disabled)', default=0, type=int)
+parser.add_argument('-searchCacheRefresh', help='Ignore any cached search results and re-run the searches (the cache is still updated)', action='store_true')
+# Only re-evaluate indexes whose settings or license usage changed since the last run
+parser.add_argument('-incremental', help='Only re-query and re-size indexes with changed settings or license usage since the previous run, '\
+    'all other indexes carry forward the previous recommendations', action='store_true')
+parser.add_argument('-incrementalThreshold', help='Change in average license usage per day (0.1 is 10 perc.) before an index is re-evaluated in incremental mode',
+    default=0.1, type=float)
+# Reading the indexes.conf files directly avoids starting a Splunk CLI process for btool
+parser.add_argument('-nativeConfResolver', help='Resolve the indexes.conf files in python rather than running splunk btool indexes list, '\
+    'python indextuning_confresolver.py -verify compares the two', action='store_true')
+parser.add_argument('-noCatalogCache', help='Always re-read the index list, by default the parsed index list is re-used from the workingPath while '\
+    'the indexes.conf files are unchanged', action='store_true')
+parser.add_argument('-max_concurrent_searches', help='Maximum number of per-index searches to run in parallel, this is always kept below the search quota of the user', default=4, type=int)
+
 parser.add_argument('-debugMode', help='(optional) turn on DEBUG level logging (defaults to INFO)', action='store_true')
 parser.add_argument('-username', help='Username to login to the remote Splunk instance with', required=True)
 parser.add_argument('-password', help='Password to login to the remote Splunk instance with', required=True)
 parser.add_argument('-indexNameRestriction', help='List of index names to run against (defaults to all indexes)')
 parser.add_argument('-deadIndexCheck', help='Only use the utility to run the dead index check, no index tuning required', action='store_true')
+parser.add_argument('-dirScanThreads', help='Number of directories listed in parallel during the dead index check (the listings are slow on NFS/SAN storage)', default=8, type=int)
 parser.add_argument('-deadIndexDelete', help='After running the dead index check perform an rm -R on the directories "\
     "which appear to be no longer in use, use with caution', action='store_true')
+# The dead directories are moved to a trash directory and deleted in the background, an unthrottled delete of a large cold directory saturates the disks
+parser.add_argument('-deleteFilesPerSecond', help='Maximum number of files deleted per second with deadIndexDelete (0 is unlimited)', default=0, type=float)
+parser.add_argument('-deleteMBPerSecond', help='Maximum MB deleted per second with deadIndexDelete (0 is unlimited)', default=0, type=float)
 parser.add_argument('-do_not_lose_data_flag', help='By default the index sizing estimate overrides any attempt to prevent data loss, "\
     "use this switch to provide extra storage to prevent data loss (free storage!)', action='store_true')
 parser.add_argument('-sizingEstimates', help='Only run sizing estimates (do not resize indexes)', action='store_true')
+parser.add_argument('-forecastDays', help='Number of days to forecast the disk usage for in the sizing estimates', default=365, type=int)
 parser.add_argument('-indexTuning', help='Run index tuning & bucket tuning (resize indexes + buckets)', action='store_true')
 parser.add_argument('-bucketTuning', help='Only run bucket tuning (resize buckets only)', action='store_true')
 parser.add_argument('-indexSizing', help='Only run index tuning (resize indexes only)', action='store_true')
@@ -217,6 +254,8 @@ if not args.debugMode:
     logging.getLogger().setLevel(logging.INFO)
 
 args.excludedDirs = args.excludedDirs.split(",")
+# directories waiting to be deleted by deadIndexDelete are not dead index directories
+args.excludedDirs.append(indextuning_deleter.trash_dir_name)
 
 if args.all:
     args.sizingEstimates = True
@@ -246,22 +285,46 @@ if args.bucketTuning or args.indexSizing:
     else:
         logger.warn("Found no indexes to add to ignore list for tuning purposes, this normally indicates a problem that should be checked")
 
+search_cache_file = "search_cache.db"
+snapshot_file = "index_snapshot.json"
+catalog_cache_file = "index_catalog.json"
+dead_dir_size_cache_file = "dead_dir_sizes.json"
+deletion_journal_file = "dead_dir_deletion.json"
+
+# Cleanup previous runs, the search cache, snapshot, catalog cache, dead directory sizes and deletion journal are the only files we keep between runs
+if os.path.isdir(args.workingPath):
+    logger.debug("Deleting old files in dir=%s after previous run" % (args.workingPath))
+    for entry in os.listdir(args.workingPath):
+        if entry in (search_cache_file, snapshot_file, catalog_cache_file, dead_dir_size_cache_file, deletion_journal_file):
+            continue
+        entry = os.path.join(args.workingPath, entry)
+        if os.path.isdir(entry):
+            shutil.rmtree(entry)
+        else:
+            os.remove(entry)
+else:
+    os.makedirs(args.workingPath, 0o750)
+
+search_cache = None
+if args.searchCacheTTL > 0:
+    search_cache = indextuning_searchcache.search_cache(os.path.join(args.workingPath, search_cache_file), args.searchCacheTTL, args.searchCacheRefresh)
+
 # Setup the utility class with the username, password and URL we have available
 logger.debug("Creating utility object with username=%s, destURL=%s, oldest_data_found=%s" % (args.username, args.destURL, args.oldest_data_found))
-utility = idx_utility.utility(args.username, args.password, args.destURL, args.oldest_data_found)
+utility = idx_utility.utility(args.username, args.password, args.destURL, args.oldest_data_found, connect_timeout=args.connect_timeout,
+    read_timeout=args.read_timeout, max_retries=args.search_retries, max_concurrent_searches=args.max_concurrent_searches,
+    search_cache=search_cache)
 
 # Determine the index/volume list we are working with
-index_list, vol_list = utility.parse_btool_output()
+catalog_cache = False
+if not args.noCatalogCache:
+    catalog_cache = os.path.join(args.workingPath, catalog_cache_file)
+index_list, vol_list = utility.parse_btool_output(native_resolver=args.nativeConfResolver, cache_file=catalog_cache)
 
 # We only care about unique dirs to check and unique directories that are unused
 dead_index_dir_list = {}
 dead_summary_dir_list = {}
 
-# Cleanup previous runs
-if os.path.isdir(args.workingPath):
-    logger.debug("Deleting old dir=%s after previous run" % (args.workingPath))
-    shutil.rmtree(args.workingPath)
-
 excludedList = [ "password", "gitLabToken" ]
 clean_args = without_keys(vars(args), excludedList)
 logger.info("Index sizing script running with args=\"%s\"" % (clean_args))
@@ -280,7 +343,10 @@ logger.info("Index sizing script running with args=\"%s\"" % (clean_args))
 """
 index_dir_check_res = False
 if args.deadIndexCheck:
-    index_dir_check_res = indextuning_dirchecker.check_for_dead_dirs(index_list, vol_list, args.excludedDirs, utility)
+    index_dir_check_res = indextuning_dirchecker.check_for_dead_dirs(index_list, vol_list, args.excludedDirs, utility, args.dirScanThreads)
+
+# Disabled indexes are included in the dead index check (their directories are still in use) but they are not sized
+index_list = dict((index_name, an_index) for index_name, an_index in index_list.items() if not an_index.disabled)
 
 # We need to ignore these indexes for re-sizing purposes
 # but we need the details of these indexes for sizing estimates done later...
@@ -291,21 +357,41 @@ indexes_not_getting_sized = {}
 """
 # We may or may not want to run the entire complex tuning script
 if args.bucketTuning or args.indexSizing:
-    index_tuning_presteps(utility, index_list, index_ignore_list, args.earliest_license, args.latest_license, args.indexNameRestriction, args.indexLimit, args.indexerhostnamefilter, args.useIntrospectionData, indexes_not_getting_sized)
+    # if any of these change the previous recommendations cannot be carried forward in incremental mode
+    sizing_parameter_names = [ "destURL", "oldest_data_found", "earliest_license", "latest_license", "numberOfIndexers", "num_hours_per_bucket", "bucket_contingency",
+        "sizing_continency", "undersizing_continency", "indexerhostnamefilter", "lower_index_size_limit", "smallbucket_size", "perc_before_adjustment",
+        "min_days_of_license_for_sizing", "min_size_to_calculate", "upper_comp_ratio_level", "rep_factor_multiplier", "do_not_lose_data_flag", "bucketTuning",
+        "indexSizing", "useIntrospectionData", "no_sizing_comments", "skipProblemIndexes" ]
+    sizing_parameters = dict((name, clean_args[name]) for name in sizing_parameter_names)
+    previous_snapshot = False
+    if args.incremental:
+        previous_snapshot = indextuning_snapshot.load_snapshot(os.path.join(args.workingPath, snapshot_file), sizing_parameters)
+
+    unchanged_index_names = index_tuning_presteps(utility, index_list, index_ignore_list, args.earliest_license, args.latest_license, args.indexNameRestriction, args.indexLimit,
+        args.indexerhostnamefilter, args.useIntrospectionData, indexes_not_getting_sized, previous_snapshot, args.incrementalThreshold)
+
+    # unchanged indexes are not re-sized, the previous recommendations are carried forward after sizing
+    sizing_index_list = without_keys(index_list, unchanged_index_names)
 
     indexes_requiring_changes = {}
     conf_files_requiring_changes = []
 
     if args.bucketTuning:
-        (indexes_requiring_changes, conf_files_requiring_changes) = run_bucket_sizing(utility, index_list, args.indexNameRestriction, args.indexLimit, args.num_hours_per_bucket,
+        (indexes_requiring_changes, conf_files_requiring_changes) = run_bucket_sizing(utility, sizing_index_list, args.indexNameRestriction, args.indexLimit, args.num_hours_per_bucket,
         args.bucket_contingency, args.upper_comp_ratio_level, args.min_size_to_calculate, args.numberOfIndexers, args.rep_factor_multiplier, args.do_not_lose_data_flag)
 
     if args.indexSizing:
-        (conf_files_requiring_changes, indexes_requiring_changes, calculated_size_total) = run_index_sizing(utility, index_list, args.indexNameRestriction, args.indexLimit,
+        (conf_files_requiring_changes, indexes_requiring_changes, calculated_size_total) = run_index_sizing(utility, sizing_index_list, args.indexNameRestriction, args.indexLimit,
         args.numberOfIndexers, args.lower_index_size_limit, args.sizing_continency, args.min_days_of_license_for_sizing, args.perc_before_adjustment, args.do_not_lose_data_flag,
         args.undersizing_continency, args.smallbucket_size, args.skipProblemIndexes, indexes_requiring_changes, conf_files_requiring_changes, args.rep_factor_multiplier, args.upper_comp_ratio_level,
         args.no_sizing_comments)
 
+    if len(unchanged_index_names) > 0:
+        indextuning_snapshot.restore_results(previous_snapshot, index_list, unchanged_index_names, indexes_requiring_changes, conf_files_requiring_changes)
+
+    indextuning_snapshot.save_snapshot(os.path.join(args.workingPath, snapshot_file), datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"), index_list,
+        sizing_parameters, indexes_requiring_changes)
+
     if args.outputTempFilesWithTuning:
         indextuning_indextempoutput.output_index_files_into_temp_dir(conf_files_requiring_changes, index_list, args.workingPath, indexes_requiring_changes)
 
@@ -404,14 +490,17 @@ if args.sizingEstimates:
     total_index_allocation = 0
     total_estimated_index_allocation = 0
 
-    #Ugly hack until I find a better way to do this
-    total_growth_per_day_mb = [0 for i in range(0,365)]
+    # The growth per day and number of days of growth of each index that is not yet full
+    growth_rates = []
+    growth_days = []
+    # The growth per volume (homePath / coldPath) of each index
+    volume_growth = []
 
     for index in list(index_list.keys()):
         max_total_data_size_mb = index_list[index].max_total_data_size_mb
         total_index_allocation = total_index_allocation + max_total_data_size_mb
         logger.debug("index=%s max_total_data_size_mb=%s" % (index, max_total_data_size_mb))
-        if hasattr(index_list[index], "estimated_total_data_size"):
+        if index_list[index].estimated_total_data_size is not None:
             estimated_total_data_size = index_list[index].estimated_total_data_size
             logger.info("index=%s estimated_total_data_size=%s, perc_of_current_disk_utilised=%s, days_until_full_compared_to_frozen=%s, days_until_full_disk_calculation=%s, "\
                 " current_max_on_disk=%s, estimated_total_data_size_with_contingency=%s, perc_utilised_on_estimate=%s, days_until_full_disk_calculation_on_estimate=%s"
@@ -421,15 +510,11 @@ if args.sizingEstimates:
                 index_list[index].days_until_full_disk_calculation_on_estimate))
 
             # If the index is not yet full it will likely consume further disk space on the indexing tier...
-            if index_list[index].days_until_full > 0:
-                total_growth_per_day_calc = estimated_total_data_size / ((index_list[index].frozen_time_period_in_secs)/60/60/24)
-
-                if index_list[index].days_until_full > 365:
-                    days_until_full = 365
-                else:
-                    days_until_full = index_list[index].days_until_full
-                for entry in range(days_until_full):
-                    total_growth_per_day_mb[entry] = total_growth_per_day_mb[entry] + total_growth_per_day_calc
+            growth = indextuning_forecast.index_growth(index_list[index])
+            if growth is not None:
+                growth_rates.append(growth[0])
+                growth_days.append(growth[1])
+            volume_growth.extend(indextuning_forecast.index_volume_growth(index_list[index]))
 
             total_estimated_index_allocation = total_estimated_index_allocation + estimated_total_data_size
 
@@ -437,7 +522,7 @@ if args.sizingEstimates:
         max_total_data_size_mb = indexes_not_getting_sized[index].max_total_data_size_mb
         total_index_allocation = total_index_allocation + max_total_data_size_mb
         logger.debug("index=%s max_total_data_size_mb=%s (indexes_not_getting_sized)" % (index, max_total_data_size_mb))
-        if hasattr(indexes_not_getting_sized[index], "estimated_total_data_size"):
+        if indexes_not_getting_sized[index].estimated_total_data_size is not None:
             estimated_total_data_size = indexes_not_getting_sized[index].estimated_total_data_size
             logger.info("index=%s estimated_total_data_size=%s (indexes_not_getting_sized), perc_of_current_disk_utilised=%s, days_until_full_compared_to_frozen=%s, " \
                 " days_until_full_disk_calculation=%s, current_max_on_disk=%s, estimated_total_data_size_with_contingency=%s, perc_utilised_on_estimate=%s, " \
@@ -448,51 +533,59 @@ if args.sizingEstimates:
                 indexes_not_getting_sized[index].days_until_full_disk_calculation_on_estimate))
 
             # If the index is not yet full it will likely consume further disk space on the indexing tier...
-            if indexes_not_getting_sized[index].days_until_full > 0:
-                total_growth_per_day_calc = estimated_total_data_size / ((indexes_not_getting_sized[index].frozen_time_period_in_secs)/60/60/24)
-
-                if indexes_not_getting_sized[index].days_until_full > 365:
-                    days_until_full = 365
-                else:
-                    days_until_full = indexes_not_getting_sized[index].days_until_full
-
-                for entry in range(days_until_full):
-                    total_growth_per_day_mb[entry] = total_growth_per_day_mb[entry] + total_growth_per_day_calc
+            growth = indextuning_forecast.index_growth(indexes_not_getting_sized[index])
+            if growth is not None:
+                growth_rates.append(growth[0])
+                growth_days.append(growth[1])
+            volume_growth.extend(indextuning_forecast.index_volume_growth(indexes_not_getting_sized[index]))
 
             total_estimated_index_allocation = total_estimated_index_allocation + estimated_total_data_size
 
     total_vol_size = 0
     total_in_use_currently = 0
+    # Determine current disk utilisation for the volumes
+    volume_usage = indextuning_forecast.volume_usage_mb(vol_list)
     for vol in list(vol_list.keys()):
-        if hasattr(vol_list[vol], "max_vol_data_size_mb"):
+        if vol in volume_usage:
             vol_size = vol_list[vol].max_vol_data_size_mb
-
-            # Determine current disk utilisation for this volume
-            stat = os.statvfs(vol_list[vol].path)
-            used_in_mb = ((stat.f_blocks-stat.f_bfree)*stat.f_bsize)/1024/1024
+            used_in_mb = volume_usage[vol]
             if vol != "_splunk_summaries":
                 total_vol_size = total_vol_size + vol_size
                 total_in_use_currently = total_in_use_currently + used_in_mb
             logger.info("volume=%s max_vol_data_size_mb=%s used_in_mb=%s" % (vol, vol_size, used_in_mb))
-        else:
+        elif vol_list[vol].max_vol_data_size_mb is None:
             logger.info("volume=%s, has no maxVolumedata_size_mb setting" % (vol))
     logger.info("Summary: total_index_allocated=%s total_volume_allocated=%s (excluding _splunk_summaries)" % (total_index_allocation, total_vol_size))
 
     total_available = total_vol_size - total_in_use_currently
     logger.debug("total_available=%s, total_vol_size=%s, total_in_use_currently=%s" % (total_available, total_vol_size, total_in_use_currently))
 
-    day_counter = 0
-    while total_available > 0 and day_counter < 365:
-        total_available = total_available - total_growth_per_day_mb[day_counter]
-        day_counter = day_counter + 1
-
-    if day_counter >= 365:
-        logger.info("Based on a combined available volume size of %s with %s in use currently, leaving %s available, I am calculating we will not run out of disk in the next 365 days"
-            % (total_vol_size, total_in_use_currently, total_available))        
+    disk_forecast = indextuning_forecast.forecast(growth_rates, growth_days, total_available, args.forecastDays)
+    days_to_full = disk_forecast["days_to_full"]
+    if days_to_full is None:
+        logger.info("Based on a combined available volume size of %s with %s in use currently, leaving %s available, I am calculating we will not run out of disk in the next %s days"
+            % (total_vol_size, total_in_use_currently, total_available, args.forecastDays))
     else:
         logger.info("Based on a combined available volume size of %s with %s in use currently, leaving %s available, I am calculating %s days before we run out of disk"
-            % (total_vol_size, total_in_use_currently, total_available, day_counter))
-
+            % (total_vol_size, total_in_use_currently, total_available, days_to_full))
+
+    # Hot and cold volumes are often on different storage so each volume is forecast on its own
+    indexes_by_volume = indextuning_forecast.volume_indexes(list(index_list.values()) + list(indexes_not_getting_sized.values()))
+    volume_forecasts = indextuning_forecast.volume_forecasts(vol_list, volume_usage, volume_growth, args.forecastDays, indexes_by_volume)
+    forecasts = { "combined": disk_forecast }
+    for vol in sorted(volume_forecasts.keys()):
+        volume_forecast = volume_forecasts[vol]
+        if volume_forecast["days_to_full"] is None:
+            logger.info("volume=%s max_vol_data_size_mb=%s used_in_mb=%s available_mb=%s home_index_count=%s cold_index_count=%s, will not run out of disk in the next %s days"
+                % (vol, volume_forecast["max_vol_data_size_mb"], volume_forecast["used_mb"], volume_forecast["available_mb"],
+                len(volume_forecast["indexes"]["home"]), len(volume_forecast["indexes"]["cold"]), args.forecastDays))
+        else:
+            logger.info("volume=%s max_vol_data_size_mb=%s used_in_mb=%s available_mb=%s home_index_count=%s cold_index_count=%s, days_to_full=%s"
+                % (vol, volume_forecast["max_vol_data_size_mb"], volume_forecast["used_mb"], volume_forecast["available_mb"],
+                len(volume_forecast["indexes"]["home"]), len(volume_forecast["indexes"]["cold"]), volume_forecast["days_to_full"]))
+        forecasts["volume:" + vol] = volume_forecast
+    indextuning_forecast.write_forecast(forecasts, os.path.join(args.workingPath, "disk_forecast.json"),
+        os.path.join(args.workingPath, "disk_forecast.csv"))
 
     if total_estimated_index_allocation > 0:
         if args.indexLimit < len(index_list):
@@ -507,6 +600,18 @@ if index_dir_check_res:
     dead_cold_dirs = index_dir_check_res["cold_dirs_dead"]
     dead_summary_dirs = index_dir_check_res["summaries_dirs_dead"]
 
+    # The space each dead directory uses (before anything is deleted), largest first with the totals per volume
+    dead_dir_report = indextuning_dirchecker.dead_dir_report(index_dir_check_res, vol_list, os.path.join(args.workingPath, dead_dir_size_cache_file),
+        args.dirScanThreads)
+    indextuning_dirchecker.write_dead_dir_report(dead_dir_report, os.path.join(args.workingPath, "dead_dirs.json"),
+        os.path.join(args.workingPath, "dead_dirs.csv"))
+    dead_dir_bytes = dict((entry["path"], entry["bytes"]) for entry in dead_dir_report["dirs"])
+
+    # any deletion from a previous run that did not complete is resumed from the journal
+    deleter = False
+    if args.deadIndexDelete:
+        deleter = indextuning_deleter.dir_deleter(os.path.join(args.workingPath, deletion_journal_file), args.deleteFilesPerSecond, args.deleteMBPerSecond)
+
     #Note that duplicate values can be returned if the same path is used for hot/cold or summaries, for example /opt/splunk/var/lib/splunk
     #may be duplicated...
     #output the remaining data around "dead" indexes which have directories on the filesystem but no matching config
@@ -520,8 +625,7 @@ if index_dir_check_res:
                 thedir = entry + "/" + line
                 if args.deadIndexDelete and not line == "\\$_index_name":
                     if os.path.isdir(thedir):
-                        logger.info("Wiping directory %s" % (thedir))
-                        shutil.rmtree(thedir)
+                        deleter.trash(thedir, entry, dead_dir_bytes.get(thedir))
                     else:
                         logger.warn("dir=%s does not exist, no deletion required" % (thedir))
                 else:
@@ -540,8 +644,7 @@ if index_dir_check_res:
                 thedir = entry + "/" + line
                 if args.deadIndexDelete and not line == "\\$_index_name":
                     if os.path.isdir(thedir):
-                        logger.info("dir=%s deleted due to not existing and deadIndexDelete flag enabled" % (thedir))
-                        shutil.rmtree(thedir)
+                        deleter.trash(thedir, entry, dead_dir_bytes.get(thedir))
                     else:
                         logger.warn("dir=%s does not exist, no deletion required" % (thedir))
                 else:
@@ -560,8 +663,7 @@ if index_dir_check_res:
                 thedir = entry + "/" + line
                 if args.deadIndexDelete and not line == "\\$_index_name":
                     if os.path.isdir(thedir):
-                        logger.info("dir=%s deleted due to not existing and deadIndexDelete flag enabled" % (thedir))
-                        shutil.rmtree(thedir)
+                        deleter.trash(thedir, entry, dead_dir_bytes.get(thedir))
                     else:
                         logger.warn("dir=%s does not exist, no deletion required" % (thedir))
                 else:
@@ -570,6 +672,8 @@ if index_dir_check_res:
         logger.info("No dead summary dirs found")
 
     if args.deadIndexDelete:
+        deleter.start()
+
         unique_directories_checked = hot_dirs_checked + cold_dirs_checked + summaries_dirs_checked
         unique_directories_checked = list(set(unique_directories_checked))
 
@@ -597,4 +701,11 @@ if index_dir_check_res:
             for entry in dead_summary_dirs[line]:
                 print(entry + "/" + line)
 
+# Report the cost of each search we ran so expensive searches (or per-index searches that should be batched) can be found
+if len(utility.search_stats.records) > 0:
+    utility.search_stats.write_report(os.path.join(args.workingPath, "search_stats.json"), os.path.join(args.workingPath, "search_stats.csv"))
+
+if index_dir_check_res and deleter:
+    deleter.wait()
+
 logger.info("End index sizing script with args=\"%s\"" % (clean_args))
@@ -0,0 +1,306 @@
+import re
+import sys
+from subprocess import Popen, PIPE, CalledProcessError
+import time
+import logging
+import argparse
+from typing import Any, Dict, Optional, Union
+
+logger = logging.getLogger()
+
+###############################
+#
+# Parser for the output of splunk btool indexes list --debug
+#   shared by indextuning_utility and indextuning_utility_k8s (and therefore dead_index_remover.py), the patterns are
+#   compiled once and each setting is handled via a lookup in the index_handlers/volume_handlers dispatch tables
+#   rather than a chain of string comparisons per line
+#
+###############################
+
+# Splunk volume, the settings are set by parse_btool_lines, None if the volume does not set them
+class volume:
+    __slots__ = ( "name", "conf_file", "path", "max_vol_data_size_mb" )
+
+    def __init__(self, name):
+        self.name: str = name
+        self.conf_file: Optional[str] = None
+        self.path: Optional[str] = None
+        self.max_vol_data_size_mb: Optional[int] = None
+
+
+# Splunk index, the indexes.conf settings are set by parse_btool_lines and the remaining fields during
+# index_tuning_presteps, bucket sizing and index sizing, None means the value is not known (or not yet calculated)
+class index:
+    __slots__ = ( "name", "conf_file", "cold_path", "coldpath_max_datasize_mb", "cold_to_frozen_dir", "datatype", "disabled",
+        "frozen_time_period_in_secs", "home_path", "homepath_max_data_size_mb", "max_data_size", "max_hot_buckets",
+        "max_total_data_size_mb", "thawed_path", "tstats_home_path", "size_per_day_in_mb", "btool_settings",
+        "avg_license_usage_per_day", "first_seen", "max_license_usage_per_day", "index_comp_ratio", "splunk_max_disk_usage_mb",
+        "oldest_data_found", "newest_data_found", "summary_index", "summary_usage_change_per_day", "bucket_size_per_hour", "recommended_bucket_size",
+        "number_recommended_bucket_size", "calc_max_total_data_size_mb", "cold_path_max_data_size_mb", "estimated_total_data_size",
+        "estimated_total_data_size_with_contingency", "perc_utilised", "perc_utilised_on_estimate", "days_until_full",
+        "days_until_full_disk_calculation", "days_until_full_disk_calculation_on_estimate", "change_comment", "checked",
+        "home_path_resolved", "cold_path_resolved", "tstats_home_path_resolved", "thawed_path_resolved", "cold_to_frozen_dir_resolved" )
+
+    def __init__(self, name):
+        self.name: str = name
+        # indexes.conf settings
+        self.conf_file: Optional[str] = None
+        self.cold_path: Optional[str] = None
+        self.coldpath_max_datasize_mb: Optional[int] = None
+        self.cold_to_frozen_dir: Optional[str] = None
+        self.datatype: Optional[str] = None
+        # disabled = 1/true or deleted = true, the index is still recorded as its directories are in use
+        self.disabled: bool = False
+        self.frozen_time_period_in_secs: Optional[int] = None
+        self.home_path: Optional[str] = None
+        self.homepath_max_data_size_mb: Optional[int] = None
+        self.max_data_size: Optional[str] = None
+        self.max_hot_buckets: Optional[float] = None
+        self.max_total_data_size_mb: Optional[int] = None
+        self.thawed_path: Optional[str] = None
+        self.tstats_home_path: Optional[str] = None
+        # the size per day in MB from the sizing comment in the indexes.conf file
+        self.size_per_day_in_mb: Optional[int] = None
+        # settings as found before any sizing (indextuning_snapshot.capture_settings)
+        self.btool_settings: Optional[Dict[str, Any]] = None
+        # license usage, compression ratio and summary index detection from index_tuning_presteps
+        self.avg_license_usage_per_day: Optional[int] = None
+        self.first_seen: Optional[int] = None
+        self.max_license_usage_per_day: Optional[int] = None
+        self.index_comp_ratio: Optional[float] = None
+        self.splunk_max_disk_usage_mb: Optional[float] = None
+        self.oldest_data_found: Optional[int] = None
+        self.newest_data_found: Optional[int] = None
+        self.summary_index: bool = False
+        self.summary_usage_change_per_day: Optional[float] = None
+        # bucket sizing, the dbinspect size per hour is kept so the bucket size can be re-calculated for other num_hours_per_bucket
+        self.bucket_size_per_hour: Optional[float] = None
+        self.recommended_bucket_size: Union[float, str, None] = None
+        self.number_recommended_bucket_size: Optional[float] = None
+        # index sizing
+        self.calc_max_total_data_size_mb: Optional[float] = None
+        self.cold_path_max_data_size_mb: Optional[float] = None
+        self.estimated_total_data_size: Optional[float] = None
+        self.estimated_total_data_size_with_contingency: Optional[float] = None
+        self.perc_utilised: Optional[float] = None
+        self.perc_utilised_on_estimate: Optional[float] = None
+        self.days_until_full: Optional[int] = None
+        self.days_until_full_disk_calculation: Optional[int] = None
+        self.days_until_full_disk_calculation_on_estimate: Optional[int] = None
+        # comments to write into the indexes.conf keyed by the type of change (bucket, sizing, sizingcomment)
+        self.change_comment: Dict[str, str] = {}
+        self.checked: bool = False
+        # absolute paths with volume:, $SPLUNK_DB and $_index_name expanded (indextuning_paths.resolve_index_paths)
+        self.home_path_resolved: Optional[str] = None
+        self.cold_path_resolved: Optional[str] = None
+        self.tstats_home_path_resolved: Optional[str] = None
+        self.thawed_path_resolved: Optional[str] = None
+        self.cold_to_frozen_dir_resolved: Optional[str] = None
+
+
+# Split the string /opt/splunk/etc/slave-apps/_cluster/local/indexes.conf                [_internal]
+# into the conf file and the remainder of the line
+conf_file_regex = re.compile(r"^([^ ]+) +(.*)")
+# Further split a line such as:
+# homePath.maxDataSizeMB = 0
+# into the setting and the value
+setting_regex = re.compile(r"^([^= ]+)\s*=\s*(.*)")
+
+
+def set_cold_to_frozen_dir(an_index, value):
+    if value != "":
+        an_index.cold_to_frozen_dir = value
+
+
+def set_max_data_size(an_index, value):
+    if value.find("auto_high_volume") != -1:
+        value = "10240_auto"
+    elif value.find("auto") != -1:
+        value = "750_auto"
+    an_index.max_data_size = value
+
+
+def attribute_setter(attribute, convert=None):
+    if convert is None:
+        def setter(record, value):
+            setattr(record, attribute, value)
+    else:
+        def setter(record, value):
+            setattr(record, attribute, convert(value))
+    return setter
+
+
+# Settings recorded on each index, any setting not listed here is ignored
+index_handlers = {
+    "coldPath": attribute_setter("cold_path"),
+    "coldPath.maxDataSizeMB": attribute_setter("coldpath_max_datasize_mb", int),
+    "coldToFrozenDir": set_cold_to_frozen_dir,
+    "datatype": attribute_setter("datatype"),
+    "frozenTimePeriodInSecs": attribute_setter("frozen_time_period_in_secs", int),
+    "homePath": attribute_setter("home_path"),
+    "homePath.maxDataSizeMB": attribute_setter("homepath_max_data_size_mb", int),
+    "maxDataSize": set_max_data_size,
+    "maxHotBuckets": attribute_setter("max_hot_buckets", float),
+    "maxTotalDataSizeMB": attribute_setter("max_total_data_size_mb", int),
+    "thawedPath": attribute_setter("thawed_path"),
+    "tstatsHomePath": attribute_setter("tstats_home_path"),
+}
+
+# Settings recorded on each volume
+volume_handlers = {
+    "path": attribute_setter("path"),
+    "maxVolumeDataSizeMB": attribute_setter("max_vol_data_size_mb", int),
+}
+
+
+# Parse the lines of btool indexes list --debug output and return the dictionaries of indexes and volumes
+#   btool prints the settings of a stanza in lexicographical order, therefore tstatsHomePath is the last setting
+#   we need for an index and warmToColdScript is the last setting for a volume, at that point the index/volume is recorded
+#   indexes which are disabled (or deleted) are recorded with disabled set, their directories must not be treated as dead
+#   so only the sizing/tuning leaves them out
+def parse_btool_lines(lines):
+    indexes = {}
+    volumes = {}
+
+    cur_record = None
+    in_index_mode = False
+    disabled = False
+
+    for line in lines:
+        line = line.rstrip("\r\n")
+        # don't attempt to parse empty lines
+        if line == "":
+            continue
+
+        result = conf_file_regex.match(line)
+        conf_file = result.group(1)
+        string_res = result.group(2)
+
+        if string_res[0] == "[":
+            disabled = False
+            if string_res.startswith("[volume:"):
+                # skip the volume:... part and the ] at the end
+                cur_record = volume(string_res[8:-1])
+                in_index_mode = False
+            else:
+                cur_record = index(string_res[1:-1])
+                in_index_mode = True
+            cur_record.conf_file = conf_file
+            continue
+
+        result = setting_regex.match(string_res)
+        if result is None:
+            continue
+        setting = result.group(1)
+        value = result.group(2)
+
+        if setting == "disabled":
+            if value == "1" or value == "true":
+                disabled = True
+            continue
+        elif setting == "deleted":
+            if value == "true":
+                disabled = True
+            continue
+
+        if in_index_mode:
+            handler = index_handlers.get(setting)
+            if handler is None:
+                continue
+            handler(cur_record, value)
+
+            if setting == "tstatsHomePath":
+                if disabled:
+                    logger.debug("index=%s is disabled" % (cur_record.name))
+                    cur_record.disabled = True
+                if cur_record.home_path is None:
+                    logger.warn("index=%s does not have a homePath, not recording this index" % (cur_record.name))
+                    continue
+                indexes[cur_record.name] = cur_record
+                logger.debug("Recording index=%s into indexes dict" % (cur_record.name))
+        elif cur_record is not None:
+            handler = volume_handlers.get(setting)
+            if handler is not None:
+                handler(cur_record, value)
+            elif setting == "warmToColdScript":
+                volumes[cur_record.name] = cur_record
+                logger.debug("Recording vol=%s into volumes dict" % (cur_record.name))
+
+    return indexes, volumes
+
+
+# Run btool and yield the output one line at a time, parsing overlaps with btool's own runtime and the
+# complete output (several MB with thousands of indexes) is never held in memory
+# raises CalledProcessError (as check_output did) if btool fails
+def run_btool(command):
+    logger.debug("Running %s" % (" ".join(command)))
+    process = Popen(command, stdout=PIPE, universal_newlines=True)
+    try:
+        for line in process.stdout:
+            yield line
+    finally:
+        process.stdout.close()
+        return_code = process.wait()
+    if return_code != 0:
+        raise CalledProcessError(return_code, command)
+
+
+# Run btool indexes list --debug (debug switch to obtain the file names) and parse the output
+def parse_btool_output(splunk_bin="/opt/splunk/bin/splunk"):
+    return parse_btool_lines(run_btool([splunk_bin, "btool", "indexes", "list", "--debug"]))
+
+
+# Create btool style output for the benchmark, each index has the usual ~40 settings of an indexes.conf stanza
+def generate_btool_lines(line_count):
+    index_settings = [ "assureUTF8 = false", "bucketRebuildMemoryHint = auto", "coldPath = $SPLUNK_DB/%s/colddb",
+        "coldPath.maxDataSizeMB = 0", "coldToFrozenDir = ", "compressRawdata = true", "datatype = event", "defaultDatabase = main",
+        "enableDataIntegrityControl = false", "enableOnlineBucketRepair = true", "enableTsidxReduction = false",
+        "frozenTimePeriodInSecs = 188697600", "homePath = $SPLUNK_DB/%s/db", "homePath.maxDataSizeMB = 0", "hotBucketTimeRefreshInterval = 10",
+        "indexThreads = default", "journalCompression = gzip", "maxBloomBackfillBucketAge = 30d", "maxBucketSizeCacheEntries = 0",
+        "maxConcurrentOptimizes = 6", "maxDataSize = auto_high_volume", "maxHotBuckets = 3", "maxHotIdleSecs = 0", "maxHotSpanSecs = 7776000",
+        "maxMemMB = 5", "maxMetaEntries = 1000000", "maxRunningProcessGroups = 8", "maxTotalDataSizeMB = 500000", "maxWarmDBCount = 300",
+        "memPoolMB = auto", "minRawFileSyncSecs = disable", "minStreamGroupQueueSize = 2000", "partialServiceMetaPeriod = 0",
+        "processTrackerServiceInterval = 1", "quarantineFutureSecs = 2592000", "rawChunkSizeBytes = 131072", "repFactor = auto",
+        "rotatePeriodInSecs = 60", "serviceMetaPeriod = 25", "syncMeta = true", "thawedPath = $SPLUNK_DB/%s/thaweddb",
+        "throttleCheckPeriod = 15", "tstatsHomePath = volume:_splunk_summaries/$_index_name/datamodel_summary", "warmToColdScript = " ]
+    conf_file = "/opt/splunk/etc/slave-apps/_cluster/local/indexes.conf"
+
+    lines = []
+    counter = 0
+    while len(lines) < line_count:
+        index_name = "index_%06d" % (counter)
+        counter = counter + 1
+        lines.append("%s [%s]" % (conf_file, index_name))
+        for setting in index_settings:
+            if setting.find("%s") != -1:
+                setting = setting % (index_name)
+            lines.append("%s %s" % (conf_file, setting))
+    return lines[:line_count]
+
+
+# Benchmark the parser, python indextuning_btool.py [-benchmark_lines 100000] [-btool_file <output of btool indexes list --debug>]
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark the btool indexes list --debug parser')
+    parser.add_argument('-benchmark_lines', help='Number of lines of generated btool output to parse', default=100000, type=int)
+    parser.add_argument('-btool_file', help='Parse this btool output file rather than generated output')
+    parser.add_argument('-iterations', help='Number of times to parse the output', default=5, type=int)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+    if args.btool_file:
+        with open(args.btool_file) as btool_file:
+            lines = btool_file.readlines()
+    else:
+        lines = generate_btool_lines(args.benchmark_lines)
+
+    timings = []
+    for iteration in range(args.iterations):
+        start_time = time.time()
+        indexes, volumes = parse_btool_lines(lines)
+        timings.append(time.time() - start_time)
+
+    best = min(timings)
+    print("lines=%s indexes=%s volumes=%s iterations=%s best_seconds=%.4f lines_per_second=%d"
+          % (len(lines), len(indexes), len(volumes), args.iterations, best, len(lines) / best))
+    sys.exit(0)
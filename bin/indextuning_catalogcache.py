@@ -0,0 +1,108 @@
+import os
+import json
+import logging
+from io import open
+
+import indextuning_btool
+import indextuning_confresolver
+
+logger = logging.getLogger()
+
+###############################
+#
+# Cache of the parsed index/volume catalog
+#   the btool indexes output only changes when an indexes.conf changes (normally a bundle push), the parsed indexes
+#   and volumes are stored in a JSON file with a fingerprint (path, size, mtime) of every indexes.conf that btool
+#   reads and the resolver (btool or native) that parsed them, if both still match on the next run the catalog is
+#   loaded from the file rather than running and parsing btool
+#
+###############################
+
+# Incremented when the recorded indexes/volumes change, a cache file written by another version is re-read
+# (version 2 records the disabled indexes)
+catalog_version = 2
+
+
+# The path, size and modification time of each indexes.conf file in precedence order, a new, removed or
+# modified file (in any app) changes the fingerprint
+def conf_fingerprint(splunk_home=None):
+    if splunk_home is None:
+        splunk_home = indextuning_confresolver.default_splunk_home()
+    fingerprint = []
+    for conf_file in indextuning_confresolver.conf_file_layers(splunk_home):
+        stat = os.stat(conf_file)
+        fingerprint.append([ conf_file, stat.st_size, stat.st_mtime_ns ])
+    return fingerprint
+
+
+def record_to_dict(record):
+    return dict((attribute, getattr(record, attribute)) for attribute in record.__slots__)
+
+
+def dict_to_record(record_class, attributes):
+    record = record_class(attributes["name"])
+    for attribute, value in attributes.items():
+        setattr(record, attribute, value)
+    return record
+
+
+# Return the cached (indexes, volumes) or False if there is no cache file or the resolver/fingerprint has changed
+def load_catalog(cache_file, resolver, fingerprint):
+    if not os.path.isfile(cache_file):
+        return False
+
+    try:
+        with open(cache_file, encoding='utf-8') as catalog_file:
+            catalog = json.load(catalog_file)
+    except (IOError, ValueError) as e:
+        logger.warn("Unable to read catalog cache file=%s, error=\"%s\"" % (cache_file, e))
+        return False
+
+    if catalog.get("version") != catalog_version:
+        logger.info("Catalog cache file=%s was written by a different version, re-reading the index list" % (cache_file))
+        return False
+
+    if catalog.get("resolver") != resolver:
+        logger.info("Catalog cache file=%s was created by resolver=%s, re-reading the index list with resolver=%s" % (cache_file, catalog.get("resolver"), resolver))
+        return False
+
+    if catalog.get("fingerprint") != fingerprint:
+        logger.info("indexes.conf files have changed since the catalog cache file=%s was created, re-reading the index list" % (cache_file))
+        return False
+
+    indexes = dict((name, dict_to_record(indextuning_btool.index, attributes)) for name, attributes in catalog["indexes"].items())
+    volumes = dict((name, dict_to_record(indextuning_btool.volume, attributes)) for name, attributes in catalog["volumes"].items())
+    logger.info("Loaded index_count=%s volume_count=%s from catalog cache file=%s" % (len(indexes), len(volumes), cache_file))
+    return indexes, volumes
+
+
+def save_catalog(cache_file, resolver, fingerprint, indexes, volumes):
+    catalog = { "version": catalog_version, "resolver": resolver, "fingerprint": fingerprint,
+                "indexes": dict((name, record_to_dict(an_index)) for name, an_index in indexes.items()),
+                "volumes": dict((name, record_to_dict(vol)) for name, vol in volumes.items()) }
+    temp_file = cache_file + ".tmp"
+    with open(temp_file, "w", encoding='utf-8') as catalog_file:
+        catalog_file.write(json.dumps(catalog))
+    os.rename(temp_file, cache_file)
+    logger.debug("Saved index_count=%s volume_count=%s to catalog cache file=%s" % (len(indexes), len(volumes), cache_file))
+
+
+# Return the (indexes, volumes) from the cache_file if the resolver and fingerprint match, otherwise call parse_function
+# and cache the result, the fingerprint is taken before parsing so a change during the parse is picked up next time
+# splunk_home must be the installation that parse_function reads the indexes.conf files of
+def cached_catalog(cache_file, parse_function, resolver, splunk_home):
+    fingerprint = conf_fingerprint(splunk_home)
+    # without any indexes.conf files (btool run against another SPLUNK_HOME) there is nothing to detect a change with
+    if len(fingerprint) == 0:
+        return parse_function()
+
+    catalog = load_catalog(cache_file, resolver, fingerprint)
+    if catalog != False:
+        return catalog
+
+    indexes, volumes = parse_function()
+    try:
+        save_catalog(cache_file, resolver, fingerprint, indexes, volumes)
+    except (IOError, OSError) as e:
+        logger.warn("Unable to write catalog cache file=%s, error=\"%s\"" % (cache_file, e))
+    return indexes, volumes
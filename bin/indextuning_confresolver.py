@@ -0,0 +1,204 @@
+import os
+import re
+import sys
+import logging
+import argparse
+from io import open
+
+import indextuning_btool
+
+logger = logging.getLogger()
+
+###############################
+#
+# Resolve indexes.conf without running btool
+#   each splunk btool invocation starts a Splunk CLI process which takes seconds on an indexer, this reads the
+#   indexes.conf files directly and applies the same precedence as Splunk (global context):
+#     etc/peer-apps (or etc/slave-apps) */local
+#     etc/system/local
+#     etc/apps/*/local
+#     etc/peer-apps (or etc/slave-apps) */default
+#     etc/apps/*/default
+#     etc/system/default
+#   within each layer apps are in lexicographical order with A taking priority over B
+#   the output is in the same format as btool indexes list --debug so the same parser is used for both,
+#   verify_against_btool compares the resolved settings to the real btool output
+#
+###############################
+
+stanza_regex = re.compile(r"^\s*\[(.*)\]\s*$")
+setting_regex = re.compile(r"^\s*([^=]+?)\s*=\s*(.*?)\s*$")
+
+
+def default_splunk_home():
+    return os.environ.get("SPLUNK_HOME", "/opt/splunk")
+
+
+# Return the conf files in order of precedence, highest precedence first
+def conf_file_layers(splunk_home, conf_name="indexes.conf"):
+    etc = os.path.join(splunk_home, "etc")
+
+    def app_dirs(apps_dir, sub_dir):
+        if not os.path.isdir(apps_dir):
+            return []
+        return [ os.path.join(apps_dir, app, sub_dir, conf_name) for app in sorted(os.listdir(apps_dir)) ]
+
+    # peer-apps replaced slave-apps in Splunk 9, only one of them exists on a cluster peer
+    peer_apps = os.path.join(etc, "peer-apps")
+    if not os.path.isdir(peer_apps):
+        peer_apps = os.path.join(etc, "slave-apps")
+    apps = os.path.join(etc, "apps")
+
+    layers = app_dirs(peer_apps, "local")
+    layers.append(os.path.join(etc, "system", "local", conf_name))
+    layers.extend(app_dirs(apps, "local"))
+    layers.extend(app_dirs(peer_apps, "default"))
+    layers.extend(app_dirs(apps, "default"))
+    layers.append(os.path.join(etc, "system", "default", conf_name))
+
+    return [ a_file for a_file in layers if os.path.isfile(a_file) ]
+
+
+# Read a single .conf file into a dictionary of stanza to a dictionary of setting to value
+# settings before the first stanza are part of the [default] stanza, as they are in Splunk
+def read_conf_file(path):
+    stanzas = { "default": {} }
+    cur_stanza = stanzas["default"]
+    continued = False
+
+    with open(path, encoding='utf-8', errors='replace') as conf_file:
+        for line in conf_file:
+            line = line.rstrip("\r\n")
+            # a trailing \ continues the value on the next line
+            if continued:
+                line = line.rstrip()
+                continued = line.endswith("\\")
+                cur_stanza[setting] = cur_stanza[setting] + (line[:-1] if continued else line)
+                continue
+
+            stripped = line.strip()
+            if stripped == "" or stripped[0] == "#":
+                continue
+
+            result = stanza_regex.match(line)
+            if result:
+                cur_stanza = stanzas.setdefault(result.group(1), {})
+                continue
+
+            result = setting_regex.match(line)
+            if result is None:
+                logger.debug("Ignoring line=\"%s\" in file=%s" % (line, path))
+                continue
+            setting = result.group(1)
+            value = result.group(2)
+            continued = value.endswith("\\")
+            cur_stanza[setting] = value[:-1] if continued else value
+
+    return stanzas
+
+
+# Merge the conf files (highest precedence first) into a dictionary of stanza to setting to (value, conf_file)
+# the [default] stanza settings apply to every stanza that does not set them
+def resolve_conf_files(conf_files):
+    resolved = {}
+    stanza_files = {}
+    for conf_file in conf_files:
+        for stanza, settings in read_conf_file(conf_file).items():
+            if stanza not in resolved:
+                resolved[stanza] = {}
+                stanza_files[stanza] = conf_file
+            for setting, value in settings.items():
+                if setting not in resolved[stanza]:
+                    resolved[stanza][setting] = (value, conf_file)
+
+    default = resolved.get("default", {})
+    for stanza in resolved:
+        for setting, value in default.items():
+            if setting not in resolved[stanza]:
+                resolved[stanza][setting] = value
+
+    return resolved, stanza_files
+
+
+# Output in the btool list --debug format, stanzas and settings in lexicographical order
+def resolved_to_btool_lines(resolved, stanza_files):
+    for stanza in sorted(resolved.keys()):
+        yield "%s [%s]" % (stanza_files[stanza], stanza)
+        for setting in sorted(resolved[stanza].keys()):
+            value, conf_file = resolved[stanza][setting]
+            yield "%s %s = %s" % (conf_file, setting, value)
+
+
+def resolve_btool_lines(splunk_home=None, conf_name="indexes.conf"):
+    if splunk_home is None:
+        splunk_home = default_splunk_home()
+    conf_files = conf_file_layers(splunk_home, conf_name)
+    logger.debug("Resolving conf_name=%s from conf_files=%s" % (conf_name, conf_files))
+    resolved, stanza_files = resolve_conf_files(conf_files)
+    return list(resolved_to_btool_lines(resolved, stanza_files))
+
+
+# Same result as indextuning_btool.parse_btool_output without running btool
+def parse_indexes_conf(splunk_home=None):
+    return indextuning_btool.parse_btool_lines(resolve_btool_lines(splunk_home))
+
+
+# Read btool list --debug style lines into a dictionary of (stanza, setting) to (value, conf_file)
+def btool_lines_to_settings(lines):
+    settings = {}
+    stanza = None
+    for line in lines:
+        line = line.rstrip("\r\n")
+        if line == "":
+            continue
+        result = indextuning_btool.conf_file_regex.match(line)
+        conf_file = result.group(1)
+        string_res = result.group(2)
+        if string_res[0] == "[":
+            stanza = string_res[1:-1]
+            continue
+        result = indextuning_btool.setting_regex.match(string_res)
+        if result is None:
+            continue
+        settings[(stanza, result.group(1))] = (result.group(2).strip(), conf_file)
+    return settings
+
+
+# Compare the resolved indexes.conf to the output of btool indexes list --debug
+# returns a list of differences, each is (stanza, setting, btool (value, conf_file), resolved (value, conf_file))
+# where a missing entry is None
+def verify_against_btool(splunk_home=None):
+    if splunk_home is None:
+        splunk_home = default_splunk_home()
+    btool_settings = btool_lines_to_settings(indextuning_btool.run_btool([os.path.join(splunk_home, "bin", "splunk"),
+        "btool", "indexes", "list", "--debug"]))
+    resolved_settings = btool_lines_to_settings(resolve_btool_lines(splunk_home))
+
+    differences = []
+    for key in sorted(set(btool_settings.keys()) | set(resolved_settings.keys())):
+        btool_entry = btool_settings.get(key)
+        resolved_entry = resolved_settings.get(key)
+        if btool_entry != resolved_entry:
+            differences.append((key[0], key[1], btool_entry, resolved_entry))
+            logger.warn("Difference in stanza=%s setting=%s btool=%s resolved=%s" % (key[0], key[1], btool_entry, resolved_entry))
+
+    logger.info("Compared btool_setting_count=%s resolved_setting_count=%s difference_count=%s"
+                % (len(btool_settings), len(resolved_settings), len(differences)))
+    return differences
+
+
+# python indextuning_confresolver.py [-splunk_home /opt/splunk] [-verify]
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Resolve indexes.conf without running btool')
+    parser.add_argument('-splunk_home', help='Splunk installation directory (defaults to $SPLUNK_HOME or /opt/splunk)', default=default_splunk_home())
+    parser.add_argument('-verify', help='Compare the resolved settings against the output of splunk btool indexes list --debug', action='store_true')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+    if args.verify:
+        differences = verify_against_btool(args.splunk_home)
+        sys.exit(1 if len(differences) > 0 else 0)
+
+    for line in resolve_btool_lines(args.splunk_home):
+        print(line)
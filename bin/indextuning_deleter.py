@@ -0,0 +1,213 @@
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import threading
+from io import open
+
+logger = logging.getLogger()
+
+###############################
+#
+# Throttled deletion of the dead index directories
+#   an rm -R of a multi-terabyte cold directory saturates the disks the indexer is writing to. Each directory is
+#   renamed into a trash directory within the directory it was found in (so the rename is on the same filesystem and
+#   is atomic, the trash directory is on the same volume), the trash is then purged file by file in a background thread
+#   throttled to files_per_second and/or mb_per_second (0 is unlimited)
+#   the journal file records each directory before it is renamed and the progress of the purge, if the run is killed
+#   the next run with the same journal (python indextuning_deleter.py -journalFile ... or indextuning.py -deadIndexDelete)
+#   continues the purge, the journal is removed once everything is purged
+#   a directory that cannot be renamed (for example a mount point) is never deleted in place, it is marked as failed
+#
+###############################
+
+# The trash directory name within the checked directories, this must be excluded from the dead index check
+trash_dir_name = ".indextuning_trash"
+
+# Journal entry states that require no further work
+finished_states = ("purged", "failed")
+
+
+class dir_deleter:
+    def __init__(self, journal_file, files_per_second=0, mb_per_second=0, progress_interval=60):
+        self.journal_file = journal_file
+        self.files_per_second = files_per_second
+        self.mb_per_second = mb_per_second
+        self.progress_interval = progress_interval
+        self.thread = None
+        # the purge thread updates the entries while trash() may still be adding them
+        self.lock = threading.Lock()
+        self.entries = []
+        if os.path.isfile(journal_file):
+            with open(journal_file, encoding='utf-8') as a_file:
+                self.entries = json.load(a_file)["entries"]
+            logger.info("Resuming deletion of dir_count=%s from journal=%s" % (len([ entry for entry in self.entries if entry["state"] not in finished_states ]),
+                journal_file))
+            for entry in self.entries:
+                if entry["state"] == "pending":
+                    self.rename(entry)
+
+    def save_journal(self):
+        with self.lock:
+            remaining = [ entry for entry in self.entries if entry["state"] not in finished_states ]
+            if len(remaining) == 0:
+                if os.path.isfile(self.journal_file):
+                    os.remove(self.journal_file)
+                return
+            # write then rename so a killed run never leaves a partially written journal
+            with open(self.journal_file + ".tmp", "w", encoding='utf-8') as a_file:
+                a_file.write(json.dumps({ "entries": self.entries }, indent=2))
+            os.replace(self.journal_file + ".tmp", self.journal_file)
+
+    # Move the directory to the trash, an entry is pending until the rename is done, if the run was killed in between
+    # the rename is retried (or has already happened if the trash path exists), if the rename fails the directory is left alone
+    def rename(self, entry):
+        if os.path.isdir(entry["trash"]):
+            entry["state"] = "trashed"
+        elif os.path.isdir(entry["path"]):
+            try:
+                os.makedirs(os.path.dirname(entry["trash"]), exist_ok=True)
+                os.rename(entry["path"], entry["trash"])
+                entry["state"] = "trashed"
+            except OSError as e:
+                # for example a mount point, the directory is skipped and must be removed manually
+                logger.warn("dir=%s could not be moved to trash=%s, it will not be deleted error=\"%s\"" % (entry["path"], entry["trash"], e))
+                entry["state"] = "failed"
+                try:
+                    os.rmdir(os.path.dirname(entry["trash"]))
+                except OSError:
+                    pass
+        else:
+            logger.warn("dir=%s does not exist, no deletion required" % (entry["path"]))
+            entry["state"] = "purged"
+        self.save_journal()
+
+    # Move path (found within root_dir) to the trash of root_dir to be purged, expected_bytes is used for the progress
+    def trash(self, path, root_dir, expected_bytes=None):
+        name = "%s_%s" % (time.strftime("%Y%m%d%H%M%S"), os.path.relpath(path, root_dir).replace("/", "_"))
+        entry = { "path": path, "trash": os.path.join(root_dir, trash_dir_name, name), "state": "pending", "expected_bytes": expected_bytes,
+                  "purged_files": 0, "purged_bytes": 0 }
+        with self.lock:
+            self.entries.append(entry)
+        self.save_journal()
+        self.rename(entry)
+        if entry["state"] == "trashed":
+            logger.info("dir=%s moved to trash=%s to be deleted" % (path, entry["trash"]))
+
+    # Sleep until the files/bytes purged in this run are within the files_per_second/mb_per_second limits
+    def throttle(self, files, purged_bytes, started):
+        elapsed = time.time() - started
+        wait = 0
+        if self.files_per_second > 0:
+            wait = max(wait, files / self.files_per_second - elapsed)
+        if self.mb_per_second > 0:
+            wait = max(wait, purged_bytes/1024/1024 / self.mb_per_second - elapsed)
+        if wait > 0:
+            time.sleep(wait)
+
+    # perc_complete only includes the directories with an expected size (None if there are none)
+    def progress(self):
+        with self.lock:
+            purged_files = sum(entry["purged_files"] for entry in self.entries)
+            purged_bytes = sum(entry["purged_bytes"] for entry in self.entries)
+            sized_entries = [ entry for entry in self.entries if entry["expected_bytes"] and entry["state"] != "failed" ]
+            expected_bytes = sum(entry["expected_bytes"] for entry in sized_entries)
+            sized_purged_bytes = sum(entry["purged_bytes"] for entry in sized_entries)
+            remaining = len([ entry for entry in self.entries if entry["state"] not in finished_states ])
+            failed = len([ entry for entry in self.entries if entry["state"] == "failed" ])
+        perc_complete = min(round(sized_purged_bytes / expected_bytes * 100, 1), 100.0) if expected_bytes > 0 else None
+        logger.info("Deletion progress purged_files=%s purged_mb=%s expected_mb=%s perc_complete=%s remaining_dirs=%s failed_dirs=%s" % (purged_files,
+            round(purged_bytes/1024/1024, 2), round(expected_bytes/1024/1024, 2), perc_complete, remaining, failed))
+
+    # Delete the files of the trashed directory (deepest first) within the throttle limits, symbolic links are removed
+    # rather than followed
+    def purge(self, entry, counters):
+        for dirpath, dirnames, filenames in os.walk(entry["trash"], topdown=False):
+            for name in filenames:
+                file_path = os.path.join(dirpath, name)
+                try:
+                    stat = os.lstat(file_path)
+                    os.unlink(file_path)
+                except OSError as e:
+                    logger.warn("Unable to delete file=%s error=\"%s\"" % (file_path, e))
+                    continue
+                size = stat.st_blocks * 512 if hasattr(stat, "st_blocks") else stat.st_size
+                with self.lock:
+                    entry["purged_files"] = entry["purged_files"] + 1
+                    entry["purged_bytes"] = entry["purged_bytes"] + size
+                counters["files"] = counters["files"] + 1
+                counters["bytes"] = counters["bytes"] + size
+                self.throttle(counters["files"], counters["bytes"], counters["started"])
+
+                if time.time() - counters["last_progress"] > self.progress_interval:
+                    counters["last_progress"] = time.time()
+                    self.save_journal()
+                    self.progress()
+
+            for name in dirnames:
+                dir_path = os.path.join(dirpath, name)
+                try:
+                    if os.path.islink(dir_path):
+                        os.unlink(dir_path)
+                    else:
+                        os.rmdir(dir_path)
+                except OSError as e:
+                    logger.warn("Unable to delete dir=%s error=\"%s\"" % (dir_path, e))
+
+        try:
+            os.rmdir(entry["trash"])
+        except OSError as e:
+            logger.warn("Unable to delete dir=%s error=\"%s\"" % (entry["trash"], e))
+            return
+        with self.lock:
+            entry["state"] = "purged"
+        self.save_journal()
+        logger.info("dir=%s deleted purged_files=%s purged_mb=%s" % (entry["path"], entry["purged_files"], round(entry["purged_bytes"]/1024/1024, 2)))
+
+        # The trash directory itself is removed once empty
+        trash_dir = os.path.dirname(entry["trash"])
+        if os.path.basename(trash_dir) == trash_dir_name:
+            try:
+                os.rmdir(trash_dir)
+            except OSError:
+                pass
+
+    def run(self):
+        counters = { "files": 0, "bytes": 0, "started": time.time(), "last_progress": time.time() }
+        for entry in list(self.entries):
+            if entry["state"] == "trashed":
+                self.purge(entry, counters)
+        self.progress()
+
+    # Purge everything in the trash in a background thread
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name="dir_deleter")
+        self.thread.start()
+
+    def wait(self):
+        if self.thread is not None:
+            logger.info("Waiting for the background deletion to complete")
+            self.thread.join()
+
+
+# python indextuning_deleter.py -journalFile /tmp/indextuningtemp/dead_dir_deletion.json -filesPerSecond 500 -MBPerSecond 100
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Continue the throttled deletion of the dead index directories from the journal of a previous run')
+    parser.add_argument('-journalFile', help='Deletion journal (dead_dir_deletion.json in the workingPath of indextuning.py)', required=True)
+    parser.add_argument('-filesPerSecond', help='Maximum number of files deleted per second (0 is unlimited)', default=0, type=float)
+    parser.add_argument('-MBPerSecond', help='Maximum MB deleted per second (0 is unlimited)', default=0, type=float)
+    parser.add_argument('-progressInterval', help='Seconds between progress messages', default=60, type=int)
+    parser.add_argument('-debugMode', help='(optional) turn on DEBUG level logging (defaults to INFO)', action='store_true')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.DEBUG if args.debugMode else logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+    if not os.path.isfile(args.journalFile):
+        logger.info("journal=%s does not exist, no deletion to resume" % (args.journalFile))
+        sys.exit(0)
+
+    deleter = dir_deleter(args.journalFile, args.filesPerSecond, args.MBPerSecond, args.progressInterval)
+    deleter.run()
+    sys.exit(0)
@@ -1,83 +1,86 @@
 from __future__ import print_function
 import os
+import csv
+import json
 import logging
+import indextuning_paths
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait, FIRST_COMPLETED
+from io import open
 
 logger = logging.getLogger()
 
+# Sub-directories of path, os.scandir returns the file type with the directory listing so there is no stat per entry
+# (symbolic links are still followed as per os.path.isdir)
+def scan_subdirs(path):
+    with os.scandir(path) as entries:
+        return [ entry.name for entry in entries if entry.is_dir() ]
+
+
+# List the roots and each of their sub-directories, returns a dictionary of root to a dictionary of sub-directory to
+# the list of its sub-directories, the listings run concurrently in a bounded thread pool as each listing on NFS/SAN
+# storage is a network round trip, the OSError is stored in place of any listing that failed
+def scan_dirs(roots, max_workers=8):
+    dir_tree = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        root_futures = dict((executor.submit(scan_subdirs, root), root) for root in set(roots))
+        sub_futures = {}
+        for future in as_completed(root_futures):
+            root = root_futures[future]
+            try:
+                subdirs = future.result()
+            except OSError as e:
+                dir_tree[root] = e
+                continue
+            dir_tree[root] = dict((subdir, None) for subdir in subdirs)
+            for subdir in subdirs:
+                sub_futures[executor.submit(scan_subdirs, root + "/" + subdir)] = (root, subdir)
+
+        for future in as_completed(sub_futures):
+            root, subdir = sub_futures[future]
+            try:
+                dir_tree[root][subdir] = future.result()
+            except OSError as e:
+                dir_tree[root][subdir] = e
+
+    logger.debug("Scanned root_count=%s subdir_count=%s" % (len(dir_tree), len(sub_futures)))
+    return dir_tree
+
+
 # check_dirs checks that the directories on the filesystem relate to a real index and have not
 # accidentally been left here by indexes that have been deleted
 # If they have been left here it suggests a list of directories that could be deleted
-def check_for_dead_dirs(index_list, vol_list, excluded_dirs, utility):
+def check_for_dead_dirs(index_list, vol_list, excluded_dirs, utility, max_workers=8):
 
     index_dirs_to_check_hot = {}
     index_dirs_to_check_cold = {}
     summary_dirs_to_check = {}
     index_dirs_to_check_thawed = {}
 
-    # Splunk uses the $SPLUNK_DB variable to specify the default location of the data
-    splunkDBLoc = os.environ['SPLUNK_DB']
+    # The paths are normally resolved when the catalog is loaded
+    if any(index_list[index].home_path_resolved is None for index in index_list):
+        indextuning_paths.resolve_index_paths(index_list, vol_list)
+
     for index in index_list:
         # expecting something similar to
         # home_path = volume:hot/$_index_name/db
         # cold_path = volume:cold/$_index_name/colddb
         # tstats_home_path = volume:_splunk_summaries/$_index_name/datamodel_summary
-        home_path = index_list[index].home_path
-        cold_path = index_list[index].cold_path
-        tstats_home_path = index_list[index].tstats_home_path
-        thawed_path = index_list[index].thawed_path
-        if hasattr(index_list[index], "cold_to_frozen_dir"):
-            cold_to_frozen_dir = index_list[index].cold_to_frozen_dir
+        # resolved into the full directory path, for example /opt/splunk/var/lib/splunk/hot/_internaldb/db
+        home_path = index_list[index].home_path_resolved
+        cold_path = index_list[index].cold_path_resolved
+        tstats_home_path = index_list[index].tstats_home_path_resolved
+        thawed_path = index_list[index].thawed_path_resolved
+        if index_list[index].cold_to_frozen_dir_resolved is not None:
+            cold_to_frozen_dir = index_list[index].cold_to_frozen_dir_resolved
         else:
             cold_to_frozen_dir = False
 
-        logger.debug("dead dirs prechanges index=%s home_path=%s cold_path=%s tstats_home_path=%s thawed_path=%s cold_to_frozen_dir=%s" % (index, home_path, cold_path, tstats_home_path, thawed_path, cold_to_frozen_dir))
-        # Ok we found a volume, replace it with the full directory path for the dir function to work
-        if (home_path.find("volume:") != -1):
-            end = home_path.find("/")
-            findVol = home_path[7:end]
-            home_path = home_path.replace("volume:%s" % (findVol), vol_list[findVol].path)
-
-        # Ok we found a volume, replace it with the full directory path for the dir function to work
-        if (cold_path.find("volume:") != -1):
-            end = cold_path.find("/")
-            findVol = cold_path[7:end]
-            cold_path = cold_path.replace("volume:%s" % (findVol), vol_list[findVol].path)
-
-        # Ok we found a volume, replace it with the full directory path for the dir function to work
-        if (tstats_home_path.find("volume:") != -1):
-            end = tstats_home_path.find("/")
-            findVol = tstats_home_path[7:end]
-            tstats_home_path = tstats_home_path.replace("volume:%s" % (findVol), vol_list[findVol].path)
-
-        home_path = home_path.replace("$SPLUNK_DB", splunkDBLoc)
-        cold_path = cold_path.replace("$SPLUNK_DB", splunkDBLoc)
-        tstats_home_path = tstats_home_path.replace("$SPLUNK_DB", splunkDBLoc)
-        thawed_path = thawed_path.replace("$SPLUNK_DB", splunkDBLoc)
-        if cold_to_frozen_dir:
-            cold_to_frozen_dir = cold_to_frozen_dir.replace("$SPLUNK_DB", splunkDBLoc)
-
-        # $_index_name is just a variable for the index name stanza
-        home_path = home_path.replace("$_index_name", index).replace("//","/").lower()
-        cold_path = cold_path.replace("$_index_name", index).replace("//","/").lower()
-        tstats_home_path = tstats_home_path.replace("$_index_name", index).replace("//","/").lower()
-        thawed_path = thawed_path.replace("$_index_name", index).replace("//","/").lower()
-        if cold_to_frozen_dir:
-            cold_to_frozen_dir = cold_to_frozen_dir.replace("//","/").lower()
-
-        # Splunk changes any directory specified in mixed case for home_path/cold_path/tstats_home_path locations to lowercase
-        # btool does not therefore we lower() here
-        index_list[index].home_path = home_path
-        index_list[index].cold_path = cold_path
-        index_list[index].tstats_home_path = tstats_home_path
-        index_list[index].thawed_path = thawed_path
-        index_list[index].cold_to_frozen_dir = cold_to_frozen_dir
-
         # Drop off the /db/, /cold_path, or /datamodel directories off the end of, for example /opt/splunk/var/lib/splunk/_internaldb/db
         home_path = home_path[:home_path.rfind("/")]
         cold_path = cold_path[:cold_path.rfind("/")]
         tstats_home_path = tstats_home_path[:tstats_home_path.rfind("/")]
         thawed_path = thawed_path[:thawed_path.rfind("/")]
-        if index_list[index].cold_to_frozen_dir:
+        if cold_to_frozen_dir:
             cold_to_frozen_dir = cold_to_frozen_dir[:cold_to_frozen_dir.rfind("/")]
         else:
             cold_to_frozen_dir = False
@@ -97,63 +100,65 @@ def check_for_dead_dirs(index_list, vol_list, excluded_dirs, utility):
 
         logger.debug("dead dirs postchanges index=%s home_path=%s cold_path=%s tstats_home_path=%s thawed_path=%s cold_to_frozen_dir=%s" % (index, home_path, cold_path, tstats_home_path, thawed_path, cold_to_frozen_dir))
 
-    # At this point we know what indexes we need to check
-    dead_index_dir_list_hot = check_dirs(index_list, index_dirs_to_check_hot, excluded_dirs, utility)
-    dead_index_dir_list_cold = check_dirs(index_list, index_dirs_to_check_cold, excluded_dirs, utility)
-    dead_index_dir_list_summaries = check_dirs(index_list, summary_dirs_to_check, excluded_dirs, utility)
-    dead_index_dir_list_thawed = check_dirs(index_list, index_dirs_to_check_thawed, excluded_dirs, utility)
+    # At this point we know what indexes we need to check, the paths in use are the same for each check
+    # all of the directories are listed once (the same directory is often used for hot/cold/thawed) and concurrently
+    live_dirs = live_index_dirs(index_list)
+    dir_tree = scan_dirs(list(index_dirs_to_check_hot.keys()) + list(index_dirs_to_check_cold.keys()) + list(summary_dirs_to_check.keys())
+        + list(index_dirs_to_check_thawed.keys()), max_workers)
+    dead_index_dir_list_hot = check_dirs(index_list, index_dirs_to_check_hot, excluded_dirs, utility, live_dirs, dir_tree)
+    dead_index_dir_list_cold = check_dirs(index_list, index_dirs_to_check_cold, excluded_dirs, utility, live_dirs, dir_tree)
+    dead_index_dir_list_summaries = check_dirs(index_list, summary_dirs_to_check, excluded_dirs, utility, live_dirs, dir_tree)
+    dead_index_dir_list_thawed = check_dirs(index_list, index_dirs_to_check_thawed, excluded_dirs, utility, live_dirs, dir_tree)
 
     logger.debug("Returning these lists to be checked: dead_index_dir_list_hot=\"%s\", dead_index_dir_list_cold=\"%s\", dead_index_dir_list_summaries=\"%s\", dead_index_dir_list_thawed=\"%s\""
                   % (dead_index_dir_list_hot, dead_index_dir_list_cold, dead_index_dir_list_summaries, dead_index_dir_list_thawed))
     return { "hot_dirs_checked" : index_dirs_to_check_hot, "hot_dirs_dead": dead_index_dir_list_hot, "cold_dirs_checked" : index_dirs_to_check_cold,
     "cold_dirs_dead" : dead_index_dir_list_cold, "summaries_dirs_checked" : summary_dirs_to_check, "summaries_dirs_dead" : dead_index_dir_list_summaries,
-    "thawed_dirs_checked" : dead_index_dir_list_thawed }
+    "thawed_dirs_checked" : index_dirs_to_check_thawed, "thawed_dirs_dead" : dead_index_dir_list_thawed }
+
+# The directories in use by the indexes (from the resolved paths), as a set of the index
+# directories (for example /opt/splunk/var/lib/splunk/_internaldb) and a set of the full paths (.../_internaldb/db)
+# so that each directory on the filesystem is checked with a single lookup rather than comparing against every index
+def live_index_dirs(index_list):
+    index_dirs = set()
+    full_paths = set()
+    for index in index_list:
+        an_index = index_list[index]
+        paths = [ an_index.home_path_resolved, an_index.cold_path_resolved, an_index.tstats_home_path_resolved, an_index.thawed_path_resolved ]
+        if an_index.cold_to_frozen_dir_resolved:
+            paths.append(an_index.cold_to_frozen_dir_resolved)
+        for path in paths:
+            full_paths.add(path)
+            index_dirs.add(path[:path.rfind("/")])
+    return index_dirs, full_paths
+
+
+def check_dirs(index_list, dirsToCheck, excluded_dirs, utility, live_dirs=None, dir_tree=None):
+    if live_dirs is None:
+        live_dirs = live_index_dirs(index_list)
+    if dir_tree is None:
+        dir_tree = scan_dirs(list(dirsToCheck.keys()))
+    index_dirs, full_paths = live_dirs
+    excluded_dirs = set(excluded_dirs)
 
-def check_dirs(index_list, dirsToCheck, excluded_dirs, utility):
     dead_dir_list = {}
     # For each directory that we should be checking we check if we have an index that relates to the sub-directories, if not it's probably an old directory
     # left around by an index that has been removed from the config but left on the filesystem
     for dirs in list(dirsToCheck.keys()):
-        # list the directories we see under the specified paths, ignoring files
+        # the directories we see under the specified paths, ignoring files
         logger.debug("Now checking directory=%s" % (dirs))
-        try:
-            dirlist = utility.listdirs(dirs)
-        except OSError as e:
-            if e.strerror.find("No such file or directory") != -1:
-                print(e)
+        dirlist = dir_tree[dirs]
+        if isinstance(dirlist, OSError):
+            if dirlist.strerror.find("No such file or directory") != -1:
+                print(dirlist)
+            continue
 
-        for dir in dirlist:
-            found = False
+        for dir in list(dirlist.keys()):
             logger.debug("Checking subdir=%s of dir=%s" % (dir, dirs))
             # If we cannot find any mention of this index name then most likely it exists from a previous config / needs cleanup
+            # don't include the excluded directories
             abs_dir = dirs + "/" + dir
-            for index in index_list:
-                home_path = index_list[index].home_path
-                home_path = home_path[:home_path.rfind("/")]
-                cold_path = index_list[index].cold_path
-                cold_path = cold_path[:cold_path.rfind("/")]
-                tstats_home_path = index_list[index].tstats_home_path
-                tstats_home_path = tstats_home_path[:tstats_home_path.rfind("/")]
-                thawed_path = index_list[index].thawed_path
-                thawed_path = thawed_path[:thawed_path.rfind("/")]
-                if index_list[index].cold_to_frozen_dir:
-                    cold_to_frozen_dir = index_list[index].cold_to_frozen_dir
-                    cold_to_frozen_dir2 = index_list[index].cold_to_frozen_dir
-                    cold_to_frozen_dir = cold_to_frozen_dir[:cold_to_frozen_dir.rfind("/")]
-                else:
-                    cold_to_frozen_dir = False
-                    cold_to_frozen_dir2 = False
-
-                # logger.debug("home path is %s" % (home_path))
-                if abs_dir==home_path or abs_dir==cold_path or abs_dir==tstats_home_path or abs_dir==thawed_path or abs_dir==cold_to_frozen_dir:
-                    found = True
-                    break
-                else:
-                    # don't include the excluded directories
-                    if dir in excluded_dirs:
-                        logger.debug("dir=%s is excluded so marking it found" % (dir))
-                        found = True
-                        break
+            found = abs_dir in index_dirs or (dir in excluded_dirs and len(index_list) > 0)
             if not found:
                 logger.debug("dir=%s not found in the btool listing for splunk btool indexes list --debug" % (dir))
                 # If someone created the $_index_name on the filesystem...
@@ -163,13 +168,12 @@ def check_dirs(index_list, dirsToCheck, excluded_dirs, utility):
                 dead_dir_list[dead_dir].append(dirs)
                 logger.debug("dir=%s appears to be unused, adding to the list to be removed" % (dead_dir))
 
-            try:
-                sub_dir_list = utility.listdirs(abs_dir)
-                logger.debug("Working with sub_dirs=\"%s\" from abs_dir=%s" % (sub_dir_list, abs_dir))
-            except OSError as e:
-                if e.strerror.find("No such file or directory") != -1:
-                    logger.error(e)
+            sub_dir_list = dirlist[dir]
+            if isinstance(sub_dir_list, OSError):
+                if sub_dir_list.strerror.find("No such file or directory") != -1:
+                    logger.error(sub_dir_list)
                 continue
+            logger.debug("Working with sub_dirs=\"%s\" from abs_dir=%s" % (sub_dir_list, abs_dir))
 
             found2 = False
             for a_dir in sub_dir_list:
@@ -177,11 +181,8 @@ def check_dirs(index_list, dirsToCheck, excluded_dirs, utility):
                 if dir in excluded_dirs:
                     continue
                 abs_dir2 = abs_dir + "/" + a_dir
-                for index in index_list:
-                    if abs_dir2==index_list[index].home_path or abs_dir2==index_list[index].cold_path or abs_dir2==index_list[index].tstats_home_path \
-                    or abs_dir2==index_list[index].thawed_path or abs_dir2==cold_to_frozen_dir2:
-                        found2 = True
-                        break
+                if abs_dir2 in full_paths:
+                    found2 = True
                 if not found2:
                     logger.debug("dir=%s not found in the btool listing for splunk btool indexes list --debug / home_path's" % (abs_dir2))
                     #If someone created the $_index_name on the filesystem...
@@ -192,3 +193,157 @@ def check_dirs(index_list, dirsToCheck, excluded_dirs, utility):
                     logger.debug("dir=%s appears to be unused, adding to the list" % (dead_dir))
 
     return dead_dir_list
+
+
+# The dead directory types in the check_for_dead_dirs result
+dead_dir_types = (("hot", "hot_dirs_dead"), ("cold", "cold_dirs_dead"), ("summaries", "summaries_dirs_dead"), ("thawed", "thawed_dirs_dead"))
+
+# Bytes allocated on disk and the number of files directly within path, and the list of sub-directories to walk next
+# the allocated blocks are used rather than the file size as that is the space a deletion would reclaim (st_blocks
+# does not exist on Windows so the file size is used there), symbolic links are counted but not followed
+def scan_dir_usage(path):
+    size = 0
+    files = 0
+    subdirs = []
+    with os.scandir(path) as entries:
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                subdirs.append(entry.path)
+                continue
+            stat = entry.stat(follow_symlinks=False)
+            size = size + (stat.st_blocks * 512 if hasattr(stat, "st_blocks") else stat.st_size)
+            files = files + 1
+    return size, files, subdirs
+
+
+# Dictionary of path to [ bytes, file count ] of everything below each path, every directory in the trees is listed
+# as its own task in the thread pool (rather than one task per path) so a single large index directory of thousands
+# of buckets is walked in parallel, an OSError is logged and the directory is skipped
+def dirs_usage(paths, max_workers=8):
+    usage = dict((path, [ 0, 0 ]) for path in paths)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        pending = dict((executor.submit(scan_dir_usage, path), path) for path in usage)
+        while len(pending) > 0:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                path = pending.pop(future)
+                try:
+                    size, files, subdirs = future.result()
+                except OSError as e:
+                    logger.warn("Unable to determine the size of a directory within dir=%s error=\"%s\"" % (path, e))
+                    continue
+                usage[path][0] = usage[path][0] + size
+                usage[path][1] = usage[path][1] + files
+                for subdir in subdirs:
+                    pending[executor.submit(scan_dir_usage, subdir)] = path
+    return usage
+
+
+# Modification times of the directory and its sub-directories, buckets are added to/removed from the db/colddb/datamodel
+# sub-directories of an index directory so a cached size is re-used while this has not changed
+def dir_fingerprint(path):
+    with os.scandir(path) as entries:
+        subdir_times = sorted([ entry.name, entry.stat(follow_symlinks=False).st_mtime_ns ] for entry in entries if entry.is_dir(follow_symlinks=False))
+    return [ os.stat(path).st_mtime_ns, subdir_times ]
+
+
+# Dictionary of path to [ bytes, file count ], the sizes are cached in cache_file (if set) as the dead directories are
+# not written to and walking them on each run is slow
+def dead_dir_sizes(paths, cache_file=None, max_workers=8):
+    cache = {}
+    if cache_file is not None and os.path.isfile(cache_file):
+        try:
+            with open(cache_file, encoding='utf-8') as a_file:
+                cache = json.load(a_file)
+        except ValueError as e:
+            logger.warn("Ignoring the dead directory size cache file=%s as it could not be read error=\"%s\"" % (cache_file, e))
+
+    sizes = {}
+    fingerprints = {}
+    for path in paths:
+        try:
+            fingerprints[path] = dir_fingerprint(path)
+        except OSError as e:
+            logger.warn("Unable to determine the size of dir=%s error=\"%s\"" % (path, e))
+            continue
+        if path in cache and cache[path]["fingerprint"] == fingerprints[path]:
+            sizes[path] = [ cache[path]["bytes"], cache[path]["files"] ]
+
+    to_walk = [ path for path in fingerprints if path not in sizes ]
+    logger.debug("Dead directory sizes cached_count=%s walk_count=%s" % (len(sizes), len(to_walk)))
+    sizes.update(dirs_usage(to_walk, max_workers))
+
+    if cache_file is not None:
+        cache = dict((path, { "fingerprint": fingerprints[path], "bytes": sizes[path][0], "files": sizes[path][1] }) for path in sizes)
+        with open(cache_file, "w", encoding='utf-8') as a_file:
+            a_file.write(json.dumps(cache))
+    return sizes
+
+
+# The volume name with the longest path that contains path, None if the path is not on a volume
+def dir_volume(path, vol_list):
+    volume = None
+    volume_path = ""
+    for vol in vol_list:
+        if vol_list[vol].path is None:
+            continue
+        # the (lowercased) home/cold/tstats paths of the indexes are within the resolved volume paths
+        vol_path = indextuning_paths.resolve_path(vol_list[vol].path, None, (), indextuning_paths.default_splunk_db(), True).rstrip("/")
+        if (path.startswith(vol_path + "/") or path == vol_path) and len(vol_path) > len(volume_path):
+            volume = vol
+            volume_path = vol_path
+    return volume
+
+
+# The reclaimable space of the dead directories from check_for_dead_dirs, each directory is listed once (with each type
+# it was found as) largest first, a dead directory within another dead directory (for example the db directory of a dead
+# index directory) is not listed separately as it is included in the size of its parent, the totals are per volume
+# (the directory is listed as not on a volume if it is outside of all volume paths)
+def dead_dir_report(index_dir_check_res, vol_list, cache_file=None, max_workers=8):
+    dead_dirs = {}
+    for dir_type, key in dead_dir_types:
+        for line, roots in index_dir_check_res[key].items():
+            #We escaped the $ and space symbols for the shell
+            line = line.replace('\\ ',' ').replace('\\$','$')
+            for root in roots:
+                dead_dirs.setdefault(root + "/" + line, [])
+                if not dir_type in dead_dirs[root + "/" + line]:
+                    dead_dirs[root + "/" + line].append(dir_type)
+
+    paths = [ path for path in dead_dirs if path[:path.rfind("/")] not in dead_dirs ]
+    sizes = dead_dir_sizes(paths, cache_file, max_workers)
+
+    entries = []
+    volumes = {}
+    for path in sizes:
+        volume = dir_volume(path, vol_list)
+        entries.append({ "path": path, "types": dead_dirs[path], "volume": volume, "bytes": sizes[path][0], "files": sizes[path][1] })
+        volume = volume if volume is not None else "none"
+        volumes.setdefault(volume, { "dirs": 0, "bytes": 0, "files": 0 })
+        volumes[volume]["dirs"] = volumes[volume]["dirs"] + 1
+        volumes[volume]["bytes"] = volumes[volume]["bytes"] + sizes[path][0]
+        volumes[volume]["files"] = volumes[volume]["files"] + sizes[path][1]
+    entries.sort(key=lambda entry: (-entry["bytes"], entry["path"]))
+
+    for entry in entries:
+        logger.info("dead dir=%s types=%s volume=%s reclaimable_mb=%s files=%s" % (entry["path"], ",".join(entry["types"]), entry["volume"],
+            round(entry["bytes"]/1024/1024, 2), entry["files"]))
+    for volume in sorted(volumes.keys()):
+        logger.info("volume=%s dead_dir_count=%s reclaimable_mb=%s files=%s" % (volume, volumes[volume]["dirs"], round(volumes[volume]["bytes"]/1024/1024, 2),
+            volumes[volume]["files"]))
+
+    return { "dirs": entries, "volumes": volumes, "total_bytes": sum(entry["bytes"] for entry in entries), "total_files": sum(entry["files"] for entry in entries) }
+
+
+def write_dead_dir_report(report, json_path, csv_path):
+    with open(json_path, "w", encoding='utf-8') as json_file:
+        json_file.write(json.dumps(report, indent=2))
+
+    with open(csv_path, "w", encoding='utf-8', newline='') as csv_file:
+        writer = csv.writer(csv_file)
+        writer.writerow([ "path", "types", "volume", "bytes", "files" ])
+        for entry in report["dirs"]:
+            writer.writerow([ entry["path"], ",".join(entry["types"]), entry["volume"] or "", entry["bytes"], entry["files"] ])
+
+    logger.info("Reclaimable space of dead_dir_count=%s total_mb=%s written to json_file=%s csv_file=%s" % (len(report["dirs"]),
+        round(report["total_bytes"]/1024/1024, 2), json_path, csv_path))
@@ -0,0 +1,114 @@
+import os
+import sys
+import json
+import logging
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from io import open
+
+import indextuning_btool
+import indextuning_confresolver
+
+logger = logging.getLogger()
+
+###############################
+#
+# Fleet view of the index configuration
+#   reads a directory of splunk btool indexes list --debug dumps, one file per peer (the file name without extension
+#   is the peer name), parses them concurrently in a process pool and reports any setting of an index or volume stanza
+#   that differs between peers (or any stanza which only exists on some of the peers)
+#
+###############################
+
+def peer_name(dump_file):
+    return os.path.splitext(os.path.basename(dump_file))[0]
+
+
+# Dictionary of stanza to dictionary of setting to value for every setting in the btool output, the conf file
+# a value came from is where the setting is set rather than a setting so it is not compared
+def stanza_settings(lines):
+    stanzas = {}
+    for (stanza, setting), (value, conf_file) in indextuning_confresolver.btool_lines_to_settings(lines).items():
+        stanzas.setdefault(stanza, {})[setting] = value
+    return stanzas
+
+
+# Run in the worker processes, returns the peer name, the parsed indexes/volumes and the settings of each stanza
+def parse_btool_dump(dump_file):
+    with open(dump_file, encoding='utf-8', errors='replace') as btool_file:
+        lines = btool_file.readlines()
+    indexes, volumes = indextuning_btool.parse_btool_lines(lines)
+    return peer_name(dump_file), indexes, volumes, stanza_settings(lines)
+
+
+# Parse every file in dump_dir, returns a dictionary of peer name to (indexes, volumes, stanza settings)
+def load_fleet(dump_dir, max_workers=None):
+    dump_files = [ os.path.join(dump_dir, entry) for entry in sorted(os.listdir(dump_dir))
+                   if os.path.isfile(os.path.join(dump_dir, entry)) and not entry.startswith(".") ]
+    logger.info("Parsing dump_count=%s btool dumps from dir=%s" % (len(dump_files), dump_dir))
+
+    fleet = {}
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        for peer, indexes, volumes, settings in executor.map(parse_btool_dump, dump_files):
+            logger.debug("peer=%s index_count=%s volume_count=%s stanza_count=%s" % (peer, len(indexes), len(volumes), len(settings)))
+            fleet[peer] = (indexes, volumes, settings)
+    return fleet
+
+
+# Return a list of differences between peers, each is a dictionary of type (index/volume), name, setting and the values by peer
+# every setting of every stanza is compared, a setting that is not set on a peer has the value None, a setting of "missing"
+# lists which peers do not have the index/volume stanza at all
+def config_drift(fleet):
+    drift = []
+    peers = sorted(fleet.keys())
+    stanzas = set()
+    for peer in peers:
+        stanzas.update(fleet[peer][2].keys())
+
+    for stanza in sorted(stanzas):
+        if stanza.startswith("volume:"):
+            record_type, name = "volume", stanza[len("volume:"):]
+        else:
+            record_type, name = "index", stanza
+
+        missing_peers = [ peer for peer in peers if stanza not in fleet[peer][2] ]
+        if len(missing_peers) > 0:
+            drift.append({ "type": record_type, "name": name, "setting": "missing", "values": dict((peer, "missing" if peer in missing_peers else "present") for peer in peers) })
+
+        present_settings = [ fleet[peer][2][stanza] for peer in peers if peer not in missing_peers ]
+        setting_names = set()
+        for settings in present_settings:
+            setting_names.update(settings.keys())
+        for setting in sorted(setting_names):
+            values = dict((peer, fleet[peer][2][stanza].get(setting)) for peer in peers if peer not in missing_peers)
+            if len(set(values.values())) > 1:
+                drift.append({ "type": record_type, "name": name, "setting": setting, "values": values })
+
+    for entry in drift:
+        logger.warn("Config drift type=%s name=%s setting=%s values=\"%s\"" % (entry["type"], entry["name"], entry["setting"], entry["values"]))
+    logger.info("Found drift_count=%s differences across peer_count=%s" % (len(drift), len(fleet)))
+    return drift
+
+
+# python indextuning_fleet.py -dumpDir <dir with one btool indexes list --debug output per peer> [-reportFile drift.json]
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Compare the btool indexes list --debug output of multiple indexers')
+    parser.add_argument('-dumpDir', help='Directory with one btool indexes list --debug output file per peer', required=True)
+    parser.add_argument('-reportFile', help='Write the differences found to this JSON file')
+    parser.add_argument('-max_workers', help='Number of processes used to parse the dumps (defaults to the number of CPUs)', type=int)
+    parser.add_argument('-debugMode', help='(optional) turn on DEBUG level logging (defaults to INFO)', action='store_true')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.DEBUG if args.debugMode else logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+    fleet = load_fleet(args.dumpDir, args.max_workers)
+    drift = config_drift(fleet)
+
+    if args.reportFile:
+        report = { "peers": dict((peer, { "index_count": len(fleet[peer][0]), "volume_count": len(fleet[peer][1]) }) for peer in fleet),
+                   "drift": drift }
+        with open(args.reportFile, "w", encoding='utf-8') as report_file:
+            report_file.write(json.dumps(report, indent=2))
+        logger.info("Drift report written to file=%s" % (args.reportFile))
+
+    sys.exit(1 if len(drift) > 0 else 0)
@@ -0,0 +1,180 @@
+import os
+import csv
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from io import open
+from itertools import accumulate
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+logger = logging.getLogger()
+
+###############################
+#
+# Disk capacity forecast
+#   each index that is not yet full grows by estimated_total_data_size / frozen_time_period_in_days per day until
+#   days_until_full, after which data freezes as fast as it arrives. The per-index growth is summed into a daily growth
+#   curve (the cumulative sum of the growth that has started minus the cumulative sum of the growth that has ended by
+#   each day), the cumulative growth is compared to the available space to find the number of days until the disk is full
+#   per volume the growth of an index is split between the volume of the homePath and the volume of the coldPath,
+#   data stays in the homePath until homePath.maxDataSizeMB is reached so the home volume grows for the first part
+#   of the days until the index is full and the cold volume for the remainder
+#
+###############################
+
+# The growth per day in MB and the number of days it continues for, None if the index will not grow
+def index_growth(an_index):
+    if an_index.estimated_total_data_size is None or an_index.days_until_full is None or an_index.days_until_full <= 0:
+        return None
+    frozen_time_period_in_days = int(an_index.frozen_time_period_in_secs)/60/60/24
+    return an_index.estimated_total_data_size / frozen_time_period_in_days, int(an_index.days_until_full)
+
+
+# The total growth in MB on each day of the horizon, each growth rate applies from its start day (default 0) until
+# the day before its growth_days
+def daily_growth(growth_rates, growth_days, horizon, growth_starts=None):
+    if growth_starts is None:
+        growth_starts = [ 0 ] * len(growth_rates)
+
+    if numpy is not None:
+        rates = numpy.asarray(growth_rates, dtype=float)
+        starts = numpy.minimum(numpy.asarray(growth_starts, dtype=int), horizon)
+        days = numpy.minimum(numpy.asarray(growth_days, dtype=int), horizon)
+        started = numpy.cumsum(numpy.bincount(starts, weights=rates, minlength=horizon + 1))
+        ended = numpy.cumsum(numpy.bincount(days, weights=rates, minlength=horizon + 1))
+        return (started[:horizon] - ended[:horizon]).tolist()
+
+    changes = [ 0.0 ] * (horizon + 1)
+    for rate, start, days in zip(growth_rates, growth_starts, growth_days):
+        changes[min(start, horizon)] = changes[min(start, horizon)] + rate
+        changes[min(days, horizon)] = changes[min(days, horizon)] - rate
+    return list(accumulate(changes[:horizon]))
+
+
+# Forecast the usage of available_mb over horizon days, days_to_full is None if there is still space at the end of the horizon
+def forecast(growth_rates, growth_days, available_mb, horizon=365, growth_starts=None):
+    growth = daily_growth(growth_rates, growth_days, horizon, growth_starts)
+    if numpy is not None:
+        cumulative_growth = numpy.cumsum(growth)
+        remaining = available_mb - cumulative_growth
+        exhausted = numpy.flatnonzero(remaining <= 0)
+        cumulative_growth = cumulative_growth.tolist()
+        remaining = remaining.tolist()
+    else:
+        cumulative_growth = list(accumulate(growth))
+        remaining = [ available_mb - total for total in cumulative_growth ]
+        exhausted = [ day for day, available in enumerate(remaining) if available <= 0 ]
+
+    if available_mb <= 0:
+        days_to_full = 0
+    elif len(exhausted) > 0:
+        days_to_full = int(exhausted[0]) + 1
+    else:
+        days_to_full = None
+
+    return { "horizon": horizon, "available_mb": available_mb, "days_to_full": days_to_full, "growth_mb": growth,
+             "cumulative_growth_mb": cumulative_growth, "available_curve_mb": remaining }
+
+
+# The volume name of a volume:<name>/... path, None if the path is not on a volume
+def path_volume(path):
+    if path is None or not path.startswith("volume:"):
+        return None
+    return path[len("volume:"):].split("/")[0]
+
+
+# Dictionary of volume to the index names with their homePath, coldPath and tstatsHomePath on that volume
+def volume_indexes(indexes):
+    volumes = {}
+    for an_index in indexes:
+        for path_type, path in (("home", an_index.home_path), ("cold", an_index.cold_path), ("tstats", an_index.tstats_home_path)):
+            volume = path_volume(path)
+            if volume is not None:
+                volumes.setdefault(volume, { "home": [], "cold": [], "tstats": [] })[path_type].append(an_index.name)
+    return volumes
+
+
+# The growth of an index split between the home and cold volumes as a list of (volume, growth per day, first day, last day)
+# the home volume grows until the homePath.maxDataSizeMB is reached (based on the current size of the index), the cold
+# volume for the remaining days until the index is full, tstatsHomePath growth is not estimated
+def index_volume_growth(an_index):
+    growth = index_growth(an_index)
+    if growth is None or growth[0] <= 0:
+        return []
+    growth_per_day, days = growth
+
+    home_days = days
+    if an_index.homepath_max_data_size_mb:
+        splunk_max_disk_usage_mb = an_index.splunk_max_disk_usage_mb or 0
+        home_available_mb = max(an_index.homepath_max_data_size_mb - splunk_max_disk_usage_mb, 0)
+        home_days = min(days, int(home_available_mb / growth_per_day))
+
+    volume_growth = []
+    home_volume = path_volume(an_index.home_path)
+    if home_volume is not None and home_days > 0:
+        volume_growth.append((home_volume, growth_per_day, 0, home_days))
+    cold_volume = path_volume(an_index.cold_path)
+    if cold_volume is not None and home_days < days:
+        volume_growth.append((cold_volume, growth_per_day, home_days, days))
+    return volume_growth
+
+
+def statvfs_used_mb(path):
+    stat = os.statvfs(path)
+    return ((stat.f_blocks-stat.f_bfree)*stat.f_bsize)/1024/1024
+
+
+# Dictionary of volume name to the MB in use on the filesystem of the volume path, for the volumes with a maxVolumeDataSizeMB
+# the filesystems are checked in parallel as slow (network) storage can take a while to respond
+def volume_usage_mb(vol_list, max_workers=8):
+    volumes = [ vol for vol in vol_list if vol_list[vol].max_vol_data_size_mb is not None and vol_list[vol].path is not None ]
+    usage = {}
+    if len(volumes) == 0:
+        return usage
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = dict((vol, executor.submit(statvfs_used_mb, vol_list[vol].path)) for vol in volumes)
+
+    for vol in volumes:
+        try:
+            usage[vol] = futures[vol].result()
+        except OSError as e:
+            logger.warn("volume=%s unable to determine disk usage of path=%s error=\"%s\"" % (vol, vol_list[vol].path, e))
+    return usage
+
+
+# Dictionary of volume to forecast for each volume with a maxVolumeDataSizeMB and known usage, volume_growth is a list
+# of the index_volume_growth entries of all indexes
+def volume_forecasts(vol_list, usage, volume_growth, horizon=365, indexes_by_volume=None):
+    forecasts = {}
+    for vol in sorted(usage.keys()):
+        entries = [ entry for entry in volume_growth if entry[0] == vol ]
+        available_mb = vol_list[vol].max_vol_data_size_mb - usage[vol]
+        forecasts[vol] = forecast([ entry[1] for entry in entries ], [ entry[3] for entry in entries ], available_mb, horizon,
+            [ entry[2] for entry in entries ])
+        forecasts[vol]["max_vol_data_size_mb"] = vol_list[vol].max_vol_data_size_mb
+        forecasts[vol]["used_mb"] = usage[vol]
+        if indexes_by_volume is not None:
+            forecasts[vol]["indexes"] = indexes_by_volume.get(vol, { "home": [], "cold": [], "tstats": [] })
+    return forecasts
+
+
+# forecasts is a dictionary of name (for example the volume) to forecast, the CSV has one row per name and day
+def write_forecast(forecasts, json_path, csv_path):
+    with open(json_path, "w", encoding='utf-8') as json_file:
+        json_file.write(json.dumps(forecasts, indent=2))
+
+    with open(csv_path, "w", encoding='utf-8', newline='') as csv_file:
+        writer = csv.writer(csv_file)
+        writer.writerow([ "name", "day", "growth_mb", "cumulative_growth_mb", "available_mb" ])
+        for name in sorted(forecasts.keys()):
+            a_forecast = forecasts[name]
+            for day in range(a_forecast["horizon"]):
+                writer.writerow([ name, day + 1, round(a_forecast["growth_mb"][day], 2), round(a_forecast["cumulative_growth_mb"][day], 2),
+                    round(a_forecast["available_curve_mb"][day], 2) ])
+
+    logger.info("Disk forecast of forecast_count=%s written to json_file=%s csv_file=%s" % (len(forecasts), json_path, csv_path))
@@ -1,6 +1,8 @@
 import logging
 import datetime
 
+import indextuning_sizing
+
 logger = logging.getLogger()
 
 
@@ -19,7 +21,7 @@ def run_index_sizing(utility, index_list, index_name_restriction, index_limit, n
     calculated_size_total = 0
 
     counter = 0
-    logger.info("Running queries to determine index sizing")
+    index_names = []
     for index_name in list(index_list.keys()):
         logger.debug("index=%s counter=%s counter_limit=%s" % (index_name, counter, index_limit))
         # If we have a restriction on which indexes to look at, skip the loop until we hit our specific index name
@@ -32,10 +34,18 @@ def run_index_sizing(utility, index_list, index_name_restriction, index_limit, n
         if counter > index_limit:
             break
 
-        conf_file = index_list[index_name].conf_file
-        if not hasattr(index_list[index_name], 'index_comp_ratio'):
+        if index_list[index_name].index_comp_ratio is None:
             logger.warn("index=%s has no data on disk, not doing any sizing" % (index_name))
             continue
+        index_names.append(index_name)
+
+    # The size calculations run across all indexes at once, the results are applied per index below
+    logger.info("Running index sizing calculations")
+    sizing = indextuning_sizing.index_sizing(index_list, index_names, num_of_indexers, rep_factor_multiplier, sizing_continency,
+        lower_index_size_limit, upper_comp_ratio_level)
+
+    for position, index_name in enumerate(index_names):
+        conf_file = index_list[index_name].conf_file
 
         #Creating variables to make these easier to access later in the code
         index_comp_ratio = index_list[index_name].index_comp_ratio
@@ -53,178 +63,76 @@ def run_index_sizing(utility, index_list, index_name_restriction, index_limit, n
                 "changing this to index_compression_ratio=%s" % (index_name, index_comp_ratio, upper_comp_ratio_level, upper_comp_ratio_level))
             index_comp_ratio = upper_comp_ratio_level
 
-        summary_index = False
-        # Zero license usage, this could be a summary index
-        if avg_license_usage_per_day == 0:
-            json_result = utility.run_search_query("| metadata index=%s type=sourcetypes | table sourcetype" % (index_name))
-
-            if len(json_result["results"]) == 1 and json_result["results"][0]["sourcetype"] == "stash":
-                # At this point we know its a summary index
-                # So we can use the average growth rate to determine if any sizing changes are required
-                json_result = utility.run_search_query(""" search index=_introspection \"data.name\"=\"%s\"
-                | bin _time span=1d
-                | stats max(data.total_size) AS total_size by host, _time
-                | streamstats current=f window=1 max(total_size) AS prev_total by host
-                | eval diff=total_size - prev_total
-                | stats avg(diff) AS avgchange by host
-                | stats avg(avgchange) AS overallavg""" % (index_name))
-
-                if len(json_result["results"]) == 1:
-                    summary_usage_change_per_day = float(json_result["results"][0]["overallavg"])
-                    logger.info("index=%s is a summary index, average_change_per_day=%s from introspection logs" % (index_name, summary_usage_change_per_day))
-                else:
-                    logger.info("index=%s is a summary index, could not find average_change_per_day from introspection logs average_change_per_day=0.0" % (index_name))
-                    summary_usage_change_per_day = 0.0
-                summary_index = True
-            else:
-                logger.debug("No metadata found for index=%s, please ensure the username can see this index to check for stash sourcetype..." % (index_name))
+        # Summary index detection was done during index_tuning_presteps
+        summary_index = index_list[index_name].summary_index
+        if summary_index:
+            summary_usage_change_per_day = index_list[index_name].summary_usage_change_per_day
+            if summary_usage_change_per_day is None:
+                logger.info("index=%s is a summary index, could not find average_change_per_day from introspection logs average_change_per_day=0.0" % (index_name))
+                summary_usage_change_per_day = 0.0
 
         # Company specific field here, the commented size per day in the indexes.conf file
         sizing_comment = -1
-        if hasattr(index_list[index_name],"size_per_day_in_mb"):
+        if index_list[index_name].size_per_day_in_mb is not None:
             sizing_comment = int(index_list[index_name].size_per_day_in_mb)
 
         oversized = False
-        estimated_days_for_current_size = 0
-        # calculate the index size usage based on recent license usage data and divide by the number of indexers we have
-        calculated_size = (index_comp_ratio * avg_license_usage_per_day * frozen_time_period_in_days * rep_factor_multiplier)/num_of_indexers
-
-        # This index has data but no incoming data during the measurement period (via the license logs), capping the index at current size + contingency
-        # or the estimated size if we have it
-        if calculated_size == 0.0:
-            # We have zero incoming data so we should be fine to store the frozen time period in days amount of data
+        # The estimated days are the frozen time period in days where we have zero incoming data (or compression ratio)
+        if sizing["days_is_frozen"][position]:
             estimated_days_for_current_size = frozen_time_period_in_days
-
-            # If this indexed was never sized through the sizing script *and* it has no recent data *and* it is not a summary index
-            # then we cap it at current size + contingency rather than just leaving it on defaults
-            # If it had a configured size it's dealt with later in the code
-            if sizing_comment < 0 and not summary_index:
-                # ensure that our new sizing does not drop below what we already have on disk
-                largest_on_disk_size = splunk_max_disk_usage_mb
-                 #add the contingency calculation in as we don't want to size to the point where we drop data once we apply on any of the indexers
-                largest_on_disk_size = int(round(largest_on_disk_size * sizing_continency))
-                # This now becomes our tuned size
-                # However we cannot go below the lower index size limit restriction...
-
-                if largest_on_disk_size < lower_index_size_limit:
-                    largest_on_disk_size = lower_index_size_limit
-
-                logger.info("index=%s has zero incoming data for time period, capping size per indexer at size=%s" % (index_name, largest_on_disk_size))
-
-                # Store the calculated value for later use
-                index_list[index_name].calc_max_total_data_size_mb = largest_on_disk_size
-        # The index had recent data so we can estimate approx number of days we have left
-        # calculated_size is the amount of data we will use per indexer
         else:
-            if index_comp_ratio == 0.0:
-                estimated_days_for_current_size = frozen_time_period_in_days
-            else:
-                if summary_index:
-                    estimated_days_for_current_size = int(round(max_total_data_size_mb / (calculated_size * sizing_continency)))
-                else:
-                    estimated_days_for_current_size = int(round(max_total_data_size_mb / ((index_comp_ratio * avg_license_usage_per_day * sizing_continency * rep_factor_multiplier)/num_of_indexers)))
+            estimated_days_for_current_size = int(sizing["estimated_days"][position])
+
+        # This index has data but no incoming data during the measurement period (via the license logs), if this indexed was never sized
+        # through the sizing script *and* it is not a summary index then we cap it at current size + contingency rather than just leaving it on defaults
+        # If it had a configured size it's dealt with later in the code
+        if sizing["no_incoming_data"][position] and sizing_comment < 0 and not summary_index:
+            logger.info("index=%s has zero incoming data for time period, capping size per indexer at size=%s" % (index_name, int(sizing["zero_data_size"][position])))
 
-        index_list[index_name].estimated_total_data_size = int(calculated_size)
+        index_list[index_name].estimated_total_data_size = int(sizing["estimated_total_data_size"][position])
         # We leave a bit of room spare just in case by adding a contingency sizing here
-        calculated_size = int(round(calculated_size*sizing_continency))
+        calculated_size = int(sizing["estimated_total_data_size_with_contingency"][position])
         index_list[index_name].estimated_total_data_size_with_contingency = calculated_size
 
+        # Summary indexes are sized on the current size and the change per day rather than the license usage
         if summary_index:
-            largest_on_disk_size = splunk_max_disk_usage_mb
-            if summary_usage_change_per_day < 0.0:
-                calculated_size = int(largest_on_disk_size * sizing_continency)
-
-                # Store the estimate of how much we will likely use based on sizing calculations ignoring contingency
-                index_list[index_name].estimated_total_data_size = int(largest_on_disk_size)
-                index_list[index_name].estimated_total_data_size_with_contingency = calculated_size
+            if sizing["summary_shrinking"][position]:
                 logger.info("index=%s appears to have summary_usage_change_per_day=%s (zero or less), calculated_size=%s as the size that this index will need (includes contingency=%s)"
                             % (index_name, summary_usage_change_per_day, calculated_size, sizing_continency))
             else:
-                # Calculate the size per indexer as approx currentSize * contingency value * change per day * amount of time the data is kept in summary
-                calculated_size = int(largest_on_disk_size + (sizing_continency * summary_usage_change_per_day * frozen_time_period_in_days))
-                # Store the estimate of how much we will likely use based on sizing calculations ignoring contingency
-                index_list[index_name].estimated_total_data_size = int(largest_on_disk_size + (summary_usage_change_per_day * frozen_time_period_in_days))
-                index_list[index_name].estimated_total_data_size_with_contingency = calculated_size
-
                 logger.info("index=%s summary_usage_change_per_day=%s calculated_size=%s as the size that this summary index will need (includes contingency=%s)"
                             % (index_name, summary_usage_change_per_day, calculated_size, sizing_continency))
 
-        max_data_size = index_list[index_name].max_data_size
-        if max_data_size == "10240_auto":
-            max_data_size = 10240
-        elif max_data_size == "750_auto":
-            max_data_size = 750
-        else:
-            max_data_size = int(max_data_size)
-
         # If we are within 2 buckets worth of the max data size assume the index is 100% full
-        if (splunk_max_disk_usage_mb + (2*max_data_size)) > max_total_data_size_mb:
-            index_list[index_name].perc_utilised = 100
-            index_list[index_name].perc_utilised_on_estimate = 100
-            index_list[index_name].days_until_full = 0
-            index_list[index_name].days_until_full_disk_calculation = 0
-            index_list[index_name].days_until_full_disk_calculation_on_estimate = 0
-            logger.debug("index=%s perc_utilised=100 days_until_full=0 because splunk_max_disk_usage_mb=%s + 2*%s > %s, perc_utilised_on_estimate=100, days_until_full_disk_calculation_on_estimate=0"
-                        % (index_name, splunk_max_disk_usage_mb, max_data_size, max_total_data_size_mb))
-        else:
-            # Estimate the perc full we are
-            index_list[index_name].perc_utilised = round((splunk_max_disk_usage_mb / max_total_data_size_mb)*100)
-            available_index_mb = max_total_data_size_mb - splunk_max_disk_usage_mb
-            if index_comp_ratio * avg_license_usage_per_day * rep_factor_multiplier == 0.0:
-                days_until_full_disk_calculation = frozen_time_period_in_days
-            else:
-                days_until_full_disk_calculation = int(round(available_index_mb / ((index_comp_ratio * avg_license_usage_per_day * rep_factor_multiplier)/num_of_indexers)))
-
-            if days_until_full_disk_calculation > frozen_time_period_in_days:
-                days_until_full_disk_calculation = frozen_time_period_in_days
-            else:
-                days_until_full_disk_calculation = days_until_full_disk_calculation
-
-            days_until_full = frozen_time_period_in_days - int(index_list[index_name].oldest_data_found)
-            if days_until_full < 0:
-                logger.warn("index=%s days_until_full=%s seems inaccurate calculated from oldest_data_found=%s and frozen_time_period_in_days=%s changing this to zero to assume this is full"
-                    % (index_name, days_until_full, oldest_data_found, frozen_time_period_in_days))
-                days_until_full = 0
-
-            if splunk_max_disk_usage_mb == 0.0:
-                perc_utilised_on_estimate = 0
-                days_until_full_disk_calculation_on_estimate = frozen_time_period_in_days
-                perc_utilised_on_estimate = 0
-            else:
-                perc_utilised_on_estimate = index_list[index_name].estimated_total_data_size  / splunk_max_disk_usage_mb
-                days_until_full_disk_calculation_on_estimate = frozen_time_period_in_days - int(round(perc_utilised_on_estimate * frozen_time_period_in_days))
-                perc_utilised_on_estimate = int(round(perc_utilised_on_estimate * 100))
-
-            logger.debug("index=%s perc_utilised=%s days_until_full=%s days_until_full_disk_calculation=%s calculated using index_comp_ratio=%s, " \
-                "avg_license_usage_per_day=%s, rep_factor_multiplier=%s, num_of_indexers=%s, perc_utilised_on_estimate=%s, days_until_full_disk_calculation_on_estimate=%s"
-                % (index_name, index_list[index_name].perc_utilised, days_until_full,days_until_full_disk_calculation, index_comp_ratio, avg_license_usage_per_day,
-                rep_factor_multiplier, num_of_indexers, perc_utilised_on_estimate, days_until_full_disk_calculation_on_estimate))
-
-            index_list[index_name].days_until_full = days_until_full
-            index_list[index_name].days_until_full_disk_calculation = days_until_full_disk_calculation
-            index_list[index_name].perc_utilised_on_estimate = perc_utilised_on_estimate
-            index_list[index_name].days_until_full_disk_calculation_on_estimate = days_until_full_disk_calculation_on_estimate
-
-        min_size_override = False
-        # Bucket explosion occurs if we undersize an index too much so cap at the lower size limit
-        if calculated_size < lower_index_size_limit:
-            calculated_size = lower_index_size_limit
-
-        min_req_size = int(index_list[index_name].max_hot_buckets) * max_data_size
-        if calculated_size < min_req_size:
+        index_list[index_name].perc_utilised = int(sizing["perc_utilised"][position])
+        index_list[index_name].perc_utilised_on_estimate = int(sizing["perc_utilised_on_estimate"][position])
+        index_list[index_name].days_until_full = sizing["days_until_full"][position]
+        index_list[index_name].days_until_full_disk_calculation = sizing["days_until_full_disk_calculation"][position]
+        index_list[index_name].days_until_full_disk_calculation_on_estimate = sizing["days_until_full_disk_calculation_on_estimate"][position]
+        if sizing["days_until_full_negative"][position]:
+            logger.warn("index=%s days_until_full=%s seems inaccurate calculated from oldest_data_found=%s and frozen_time_period_in_days=%s changing this to zero to assume this is full"
+                % (index_name, frozen_time_period_in_days - int(oldest_data_found), oldest_data_found, frozen_time_period_in_days))
+        logger.debug("index=%s full=%s perc_utilised=%s days_until_full=%s days_until_full_disk_calculation=%s calculated using index_comp_ratio=%s, " \
+            "avg_license_usage_per_day=%s, rep_factor_multiplier=%s, num_of_indexers=%s, perc_utilised_on_estimate=%s, days_until_full_disk_calculation_on_estimate=%s"
+            % (index_name, sizing["full"][position], index_list[index_name].perc_utilised, index_list[index_name].days_until_full,
+            index_list[index_name].days_until_full_disk_calculation, index_comp_ratio, avg_license_usage_per_day, rep_factor_multiplier, num_of_indexers,
+            index_list[index_name].perc_utilised_on_estimate, index_list[index_name].days_until_full_disk_calculation_on_estimate))
+
+        # Bucket explosion occurs if we undersize an index too much so cap at the lower size limit and the max_hot_buckets * bucket size
+        calculated_size = int(sizing["size"][position])
+        min_size_override = sizing["min_size_override"][position]
+        if min_size_override:
             logger.warn("index=%s, calc_max_total_data_size_mb=%s less than min_req_size=%s (based on bucket_size=%s*max_hot_buckets=%s), "\
                 " frozen_time_period_in_days=%s, max_total_data_size_mb=%s , "\
-                "avg_license_usage_per_day=%s, sizing_comment=%s, index_comp_ratio=%s, calculated_size=%s, estimated_days_for_current_size=%s, "\
+                "avg_license_usage_per_day=%s, sizing_comment=%s, index_comp_ratio=%s, estimated_days_for_current_size=%s, "\
                 "oldest_data_found=%s, rep_factor_multiplier=%s, changing size back to %s"
-                % (index_name, calculated_size, min_req_size, max_data_size, index_list[index_name].max_hot_buckets,
-                   frozen_time_period_in_days, max_total_data_size_mb, avg_license_usage_per_day, sizing_comment, index_comp_ratio, calculated_size,
-                   estimated_days_for_current_size, oldest_data_found, rep_factor_multiplier, min_req_size))
-
-            calculated_size = min_req_size
-            min_size_override = True
+                % (index_name, index_list[index_name].estimated_total_data_size_with_contingency, int(sizing["min_req_size"][position]),
+                   index_list[index_name].max_data_size, index_list[index_name].max_hot_buckets, frozen_time_period_in_days, max_total_data_size_mb,
+                   avg_license_usage_per_day, sizing_comment, index_comp_ratio, estimated_days_for_current_size, oldest_data_found, rep_factor_multiplier,
+                   calculated_size))
 
-        # Add our calculated size back in for later, int just in case the lower_index_size_limit is a float
-        index_list[index_name].calc_max_total_data_size_mb = int(round(calculated_size))
+        # Add our calculated size back in for later
+        index_list[index_name].calc_max_total_data_size_mb = calculated_size
 
         # This flag is set if the index is undersized on purpose (i.e. we have a setting that says to set it below the limit where we lose data
         do_not_increase = False
@@ -241,7 +149,7 @@ def run_index_sizing(utility, index_list, index_name_restriction, index_limit, n
                 logger.warn("index=%s, max_total_data_size_mb==0, invalid setting" % (index_name))
             else:
                 # If we have oversized the index by a significant margin we do something, if not we take no action
-                perc_est = calculated_size / max_total_data_size_mb
+                perc_est = sizing["perc_est"][position]
                 logger.debug("perc_est=%s for calculated_size/maxTotalSizeMB" % (perc_est))
                 if perc_est < perc_before_adjustment:
                     # Index is oversized > ?% therefore we can use our new sizing to deal with this
@@ -260,25 +168,18 @@ def run_index_sizing(utility, index_list, index_name_restriction, index_limit, n
                 oversized = False
             else:
                 # size estimate on disk based on the compression ratio we have seen, and the the configured size in the config file
-                size_estimate = (sizing_comment * index_comp_ratio * frozen_time_period_in_days * rep_factor_multiplier)/num_of_indexers
-                # including contingency
-                size_estimate = size_estimate * sizing_continency
-
-                # 3000MB is the lower bound as 3*auto sized buckets + a little extra is 3000MB
-                if size_estimate < lower_index_size_limit:
-                    size_estimate = lower_index_size_limit
-
+                # including contingency, 3000MB is the lower bound as 3*auto sized buckets + a little extra is 3000MB
                 usage_based_caculated_size = index_list[index_name].calc_max_total_data_size_mb
                 # If the sizing was previously decided during a sizing discussion, then allocate the requested size
-                index_list[index_name].calc_max_total_data_size_mb = int(round(size_estimate))
+                index_list[index_name].calc_max_total_data_size_mb = int(sizing["commented_size"][position])
                 calc_size_per_day_based_on_commented_size = index_list[index_name].calc_max_total_data_size_mb
                 logger.debug("index=%s, based on previous calculations the max_total_data_size_mb=%sMB, however sizing_comment=%sMB/day "\
                     "so re-calculated max_total_data_size_mb=%sMB, oldest_data_found=%s days old"
                     % (index_name, usage_based_caculated_size, sizing_comment, index_list[index_name].calc_max_total_data_size_mb, oldest_data_found))
 
                 # Skip the zero size estimated where index_comp_ratio == 0.0 or license usage is zero
-                if index_comp_ratio != 0.0 and avg_license_usage_per_day != 0:
-                    estimated_days_for_current_size = int(round(max_total_data_size_mb / ((index_comp_ratio * avg_license_usage_per_day * sizing_continency * rep_factor_multiplier)/num_of_indexers)))
+                if sizing["commented_days_calculated"][position]:
+                    estimated_days_for_current_size = int(sizing["commented_days"][position])
 
                 # If the commented size would result in data loss or an undersized index and we have a comment about this it's ok to keep it undersized
                 if usage_based_caculated_size > calc_size_per_day_based_on_commented_size:
@@ -387,8 +288,6 @@ def run_index_sizing(utility, index_list, index_name_restriction, index_limit, n
                 if index_list[index_name].calc_max_total_data_size_mb > adjust_if_above:
                     logger.debug("index=%s adjust_if_above=%s calc_max_total_data_size_mb=%s" % (index_name, adjust_if_above, index_list[index_name].calc_max_total_data_size_mb))
                     requires_change = "sizing"
-                    if not hasattr(index_list[index_name],'change_comment'):
-                        index_list[index_name].change_comment = {}
 
                     # Write comments into the output files so we know what tuning occured and when
                     str = "# max_total_data_size_mb previously %s, had room for %s days, auto-tuned on %s\n" % (index_list[index_name].max_total_data_size_mb, estimated_days_for_current_size, todays_date)
@@ -428,10 +327,6 @@ def run_index_sizing(utility, index_list, index_name_restriction, index_limit, n
                 index_list[index_name].estimated_total_data_size = int(index_list[index_name].splunk_max_disk_usage_mb)
                 index_list[index_name].estimated_total_data_size_with_contingency = largest_on_disk_size
 
-            # Write comments into the output files so we know what tuning occured and when
-            if not hasattr(index_list[index_name], 'change_comment'):
-                index_list[index_name].change_comment = {}
-
             # If we have skip problem indexes on *and* we are reducing an index in size that would result in a cap at current disk usage levels
             # then we skip it as it might lose data after this change
             if skip_problem_indexes_flag and calc_max_total_data_size_mb < largest_on_disk_size:
@@ -464,9 +359,6 @@ def run_index_sizing(utility, index_list, index_name_restriction, index_limit, n
             else:
                 requires_change = "sizingcomment"
 
-            if not hasattr(index_list[index_name], 'change_comment'):
-                index_list[index_name].change_comment = {}
-
             # Write comments into the output files so we know what tuning occured and when
             str = "# auto-size comment created on %s (%s days @ %sMB/day @ %s compression ratio)\n" % (todays_date, frozen_time_period_in_days, avg_license_usage_per_day, index_comp_ratio)
 
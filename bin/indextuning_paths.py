@@ -0,0 +1,77 @@
+import os
+import logging
+from functools import lru_cache
+
+import indextuning_confresolver
+
+logger = logging.getLogger()
+
+###############################
+#
+# Resolver for the index paths
+#   the homePath, coldPath, tstatsHomePath, thawedPath and coldToFrozenDir settings are templates such as
+#   volume:hot/$_index_name/db or $SPLUNK_DB/$_index_name/thaweddb, resolve_index_paths expands each of them once when
+#   the catalog is loaded (volume:<name> to the volume path, $SPLUNK_DB, $_index_name) into the canonical absolute path
+#   and stores it on the index (home_path_resolved et cetera), the settings themselves are left as per btool
+#   the volume:/$SPLUNK_DB expansion is memoised per path template and volume map, most indexes share the same few
+#   templates ($_index_name is substituted afterwards)
+#
+###############################
+
+def default_splunk_db():
+    return os.environ.get('SPLUNK_DB', os.path.join(indextuning_confresolver.default_splunk_home(), "var", "lib", "splunk"))
+
+
+# Expand volume:<name> and $SPLUNK_DB of the path template
+# volume_paths is a tuple of (volume name, volume path) pairs so that it can be part of the memoisation key
+@lru_cache(maxsize=None)
+def resolve_template(path, volume_paths, splunk_db):
+    if path.startswith("volume:"):
+        end = path.find("/")
+        volume = path[7:end] if end != -1 else path[7:]
+        vol_path = dict(volume_paths).get(volume)
+        if vol_path is None:
+            logger.warn("volume=%s of path=%s does not exist or has no path, the path cannot be resolved" % (volume, path))
+            return path
+        path = path.replace("volume:%s" % (volume), vol_path, 1)
+
+    return path.replace("$SPLUNK_DB", splunk_db)
+
+
+# Splunk changes any directory specified in mixed case for homePath/coldPath/tstatsHomePath to lowercase
+# (btool does not), the thawedPath and coldToFrozenDir keep their case
+def resolve_path(path, index_name, volume_paths, splunk_db, lower):
+    if path is None:
+        return None
+
+    path = resolve_template(path, volume_paths, splunk_db)
+    # a path on an unknown volume is left as is
+    if path.startswith("volume:"):
+        return path
+    # $_index_name is just a variable for the index name stanza
+    if index_name is not None:
+        path = path.replace("$_index_name", index_name)
+    path = path.replace("//","/")
+    if lower:
+        path = path.lower()
+    return path
+
+
+def volume_path_map(vol_list):
+    return tuple(sorted((name, vol_list[name].path) for name in vol_list if vol_list[name].path is not None))
+
+
+# Set the resolved paths of each index in index_list
+def resolve_index_paths(index_list, vol_list, splunk_db=None):
+    if splunk_db is None:
+        splunk_db = default_splunk_db()
+    volume_paths = volume_path_map(vol_list)
+
+    for index_name, an_index in index_list.items():
+        an_index.home_path_resolved = resolve_path(an_index.home_path, index_name, volume_paths, splunk_db, True)
+        an_index.cold_path_resolved = resolve_path(an_index.cold_path, index_name, volume_paths, splunk_db, True)
+        an_index.tstats_home_path_resolved = resolve_path(an_index.tstats_home_path, index_name, volume_paths, splunk_db, True)
+        an_index.thawed_path_resolved = resolve_path(an_index.thawed_path, index_name, volume_paths, splunk_db, False)
+        an_index.cold_to_frozen_dir_resolved = resolve_path(an_index.cold_to_frozen_dir, None, volume_paths, splunk_db, False)
+
+    logger.debug("Resolved the paths of index_count=%s cache_info=\"%s\"" % (len(index_list), resolve_template.cache_info()))
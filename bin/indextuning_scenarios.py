@@ -0,0 +1,177 @@
+import sys
+import json
+import logging
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from io import open
+
+import indextuning_btool
+from index_bucket_sizing import run_bucket_sizing
+from indextuning_index_tuning import run_index_sizing
+
+logger = logging.getLogger()
+
+###############################
+#
+# What-if sizing scenarios
+#   planning an indexer addition or a replication factor change previously meant re-running the index tuning with
+#   different parameters, which re-runs every search. The snapshot of the last run (index_snapshot.json in the
+#   workingPath) has the btool settings and the metrics of each index, each scenario overrides some of the sizing
+#   parameters of that run (numberOfIndexers, rep_factor_multiplier, sizing_continency, num_hours_per_bucket et cetera)
+#   and re-runs the bucket/index sizing against the snapshot in a process pool, no searches are run
+#   the results are compared to the sizing with the parameters of the snapshot (the baseline)
+#
+###############################
+
+# The sizing parameters a scenario may override
+scenario_parameter_names = [ "numberOfIndexers", "rep_factor_multiplier", "sizing_continency", "bucket_contingency", "num_hours_per_bucket",
+    "undersizing_continency", "lower_index_size_limit", "smallbucket_size", "perc_before_adjustment", "min_days_of_license_for_sizing",
+    "min_size_to_calculate", "upper_comp_ratio_level", "do_not_lose_data_flag", "no_sizing_comments", "skipProblemIndexes" ]
+
+
+# Stands in for indextuning_utility during bucket sizing, the bucket sizes come from the dbinspect size per hour
+# in the snapshot rather than a search
+class snapshot_utility:
+    def __init__(self, index_list):
+        self.index_list = index_list
+
+    def determine_recommended_bucket_size_bulk(self, num_hours_per_bucket):
+        return dict((index_name, an_index.bucket_size_per_hour * num_hours_per_bucket) for index_name, an_index in self.index_list.items()
+            if an_index.bucket_size_per_hour is not None)
+
+
+# Index objects as they were before sizing, built from the btool settings and metrics in the snapshot
+def snapshot_indexes(snapshot):
+    index_list = {}
+    for index_name, entry in snapshot["indexes"].items():
+        an_index = indextuning_btool.index(index_name)
+        for attribute, value in entry["settings"].items():
+            setattr(an_index, attribute, value)
+        for attribute, value in entry["metrics"].items():
+            setattr(an_index, attribute, value)
+        an_index.btool_settings = entry["settings"]
+        index_list[index_name] = an_index
+    return index_list
+
+
+# Scenario runs are only interested in the results, per-index logging of each scenario is not useful
+def quiet_worker():
+    logging.disable(logging.WARNING)
+
+
+# Run in the worker processes, run the bucket and/or index sizing (as per the run that created the snapshot) with
+# the snapshot parameters updated with the scenario parameters
+def run_scenario(snapshot, scenario):
+    parameters = dict(snapshot["sizing_parameters"])
+    parameters.update(scenario)
+    index_list = snapshot_indexes(snapshot)
+    index_limit = len(index_list)
+
+    indexes_requiring_changes = {}
+    conf_files_requiring_changes = []
+    calculated_size_total = 0
+
+    if parameters["bucketTuning"]:
+        (indexes_requiring_changes, conf_files_requiring_changes) = run_bucket_sizing(snapshot_utility(index_list), index_list, False, index_limit,
+            parameters["num_hours_per_bucket"], parameters["bucket_contingency"], parameters["upper_comp_ratio_level"], parameters["min_size_to_calculate"],
+            parameters["numberOfIndexers"], parameters["rep_factor_multiplier"], parameters["do_not_lose_data_flag"])
+
+    if parameters["indexSizing"]:
+        (conf_files_requiring_changes, indexes_requiring_changes, calculated_size_total) = run_index_sizing(None, index_list, False, index_limit,
+            parameters["numberOfIndexers"], parameters["lower_index_size_limit"], parameters["sizing_continency"], parameters["min_days_of_license_for_sizing"],
+            parameters["perc_before_adjustment"], parameters["do_not_lose_data_flag"], parameters["undersizing_continency"], parameters["smallbucket_size"],
+            parameters["skipProblemIndexes"], indexes_requiring_changes, conf_files_requiring_changes, parameters["rep_factor_multiplier"],
+            parameters["upper_comp_ratio_level"], parameters["no_sizing_comments"])
+
+    indexes = dict((index_name, { "calc_max_total_data_size_mb": an_index.calc_max_total_data_size_mb, "max_data_size": an_index.max_data_size,
+        "requires_change": indexes_requiring_changes.get(index_name, False) }) for index_name, an_index in index_list.items())
+
+    return { "scenario": scenario, "parameters": parameters, "total_allocation_mb": calculated_size_total,
+             "cluster_allocation_mb": calculated_size_total * parameters["numberOfIndexers"], "change_count": len(indexes_requiring_changes),
+             "indexes": indexes }
+
+
+# Evaluate the baseline (the snapshot parameters) and each scenario (a dictionary of parameter overrides), returns a list
+# of results with the baseline first, each scenario result lists the indexes with a different size or bucket size to the baseline
+def evaluate_scenarios(snapshot, scenarios, max_workers=None):
+    for scenario in scenarios:
+        for name in scenario:
+            if name not in scenario_parameter_names:
+                raise ValueError("%s is not a sizing parameter a scenario can change, valid parameters are %s" % (name, scenario_parameter_names))
+
+    logger.info("Evaluating scenario_count=%s against index_count=%s from snapshot created=%s" % (len(scenarios), len(snapshot["indexes"]), snapshot["created"]))
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=quiet_worker) as executor:
+        results = list(executor.map(run_scenario, [ snapshot ] * (len(scenarios) + 1), [ {} ] + list(scenarios)))
+
+    baseline = results[0]
+    for result in results:
+        result["total_allocation_change_mb"] = result["total_allocation_mb"] - baseline["total_allocation_mb"]
+        result["differences"] = {}
+        for index_name, values in result["indexes"].items():
+            baseline_values = baseline["indexes"][index_name]
+            if values["calc_max_total_data_size_mb"] != baseline_values["calc_max_total_data_size_mb"] or values["max_data_size"] != baseline_values["max_data_size"]:
+                result["differences"][index_name] = { "baseline": baseline_values, "scenario": values }
+    return results
+
+
+# A scenario on the command line is name=value,name=value, the values are converted to the type of the snapshot parameter
+def parse_scenario(scenario_string, sizing_parameters):
+    scenario = {}
+    for entry in scenario_string.split(","):
+        if entry.find("=") == -1:
+            raise ValueError("scenario entry=\"%s\" is not in the format name=value" % (entry))
+        name, value = entry.split("=", 1)
+        name = name.strip().lstrip("-")
+        value = value.strip()
+        current = sizing_parameters.get(name)
+        if isinstance(current, bool):
+            value = value.lower() in ("1", "true", "yes")
+        elif isinstance(current, int):
+            value = int(value)
+        elif isinstance(current, float):
+            value = float(value)
+        scenario[name] = value
+    return scenario
+
+
+def comparison_table(results):
+    columns = [ "scenario", "total_allocation_mb", "cluster_allocation_mb", "allocation_change_mb", "change_count", "indexes_differing" ]
+    rows = [ columns ]
+    for result in results:
+        name = ",".join("%s=%s" % (name, value) for name, value in sorted(result["scenario"].items())) or "baseline"
+        rows.append([ name, result["total_allocation_mb"], result["cluster_allocation_mb"], result["total_allocation_change_mb"],
+            result["change_count"], len(result["differences"]) ])
+    widths = [ max(len(str(row[column])) for row in rows) for column in range(len(columns)) ]
+    return "\n".join("  ".join(str(value).ljust(width) for value, width in zip(row, widths)) for row in rows)
+
+
+# python indextuning_scenarios.py -snapshotFile /tmp/indextuningtemp/index_snapshot.json -scenario numberOfIndexers=6 -scenario numberOfIndexers=6,rep_factor_multiplier=3.0
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Compare index sizing with different sizing parameters against the snapshot of the previous index tuning run')
+    parser.add_argument('-snapshotFile', help='Snapshot from an index tuning run with -bucketTuning and/or -indexSizing (index_snapshot.json in the workingPath)', required=True)
+    parser.add_argument('-scenario', help='Sizing parameters to change as name=value,name=value (for example numberOfIndexers=6,rep_factor_multiplier=3.0), '\
+        'may be repeated, valid names are %s' % (", ".join(scenario_parameter_names)), action='append', required=True)
+    parser.add_argument('-reportFile', help='Write the scenario results including the indexes that differ from the baseline to this JSON file')
+    parser.add_argument('-max_workers', help='Number of processes used to evaluate the scenarios (defaults to the number of CPUs)', type=int)
+    parser.add_argument('-debugMode', help='(optional) turn on DEBUG level logging (defaults to INFO)', action='store_true')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.DEBUG if args.debugMode else logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+    with open(args.snapshotFile, encoding='utf-8') as snapshot_file:
+        snapshot = json.load(snapshot_file)
+
+    try:
+        scenarios = [ parse_scenario(scenario, snapshot["sizing_parameters"]) for scenario in args.scenario ]
+        results = evaluate_scenarios(snapshot, scenarios, args.max_workers)
+    except ValueError as e:
+        parser.error(str(e))
+
+    print(comparison_table(results))
+
+    if args.reportFile:
+        with open(args.reportFile, "w", encoding='utf-8') as report_file:
+            report_file.write(json.dumps([ dict((key, value) for key, value in result.items() if key != "indexes") for result in results ], indent=2))
+        logger.info("Scenario report written to file=%s" % (args.reportFile))
+
+    sys.exit(0)
@@ -0,0 +1,76 @@
+import sqlite3
+import threading
+import hashlib
+import json
+import time
+import re
+import logging
+
+logger = logging.getLogger()
+
+###############################
+#
+# On-disk cache of search results
+#   Re-running the index tuning with different sizing parameters or index restrictions would otherwise re-run every
+#   license, dbinspect and introspection search. Results are stored in a SQLite file keyed by the normalised SPL plus the
+#   earliest/latest times and are re-used until they are older than the ttl (in seconds)
+#
+###############################
+class search_cache:
+    def __init__(self, path, ttl, refresh=False):
+        self.path = path
+        self.ttl = ttl
+        # refresh skips any cached entries but still records the new results
+        self.refresh = refresh
+        # searches may be running in multiple threads (utility.run_concurrently) so share one connection behind a lock
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS search_cache (cache_key TEXT PRIMARY KEY, created REAL, "\
+            "search TEXT, earliest_time TEXT, latest_time TEXT, result TEXT)")
+        self.connection.commit()
+        self.purge_expired()
+
+    # whitespace differences (the multi-line searches) should not result in a cache miss
+    def make_key(self, mode, search, earliest_time, latest_time):
+        normalised_search = re.sub(r"\s+", " ", search).strip()
+        key_str = "%s\n%s\n%s\n%s" % (mode, normalised_search, earliest_time, latest_time)
+        return hashlib.sha256(key_str.encode('utf-8')).hexdigest(), normalised_search
+
+    # Return the cached result or None if we do not have a result newer than the ttl
+    def get(self, mode, search, earliest_time, latest_time):
+        if self.refresh:
+            return None
+
+        cache_key, normalised_search = self.make_key(mode, search, earliest_time, latest_time)
+        with self.lock:
+            row = self.connection.execute("SELECT created, result FROM search_cache WHERE cache_key = ?", (cache_key,)).fetchone()
+
+        if row is None:
+            logger.debug("search cache miss for search=\"%s\"" % (normalised_search))
+            return None
+
+        age = time.time() - row[0]
+        if age > self.ttl:
+            logger.debug("search cache expired entry age=%s ttl=%s for search=\"%s\"" % (age, self.ttl, normalised_search))
+            return None
+
+        logger.info("Using cached search results age=%s ttl=%s for search=\"%s\", use -searchCacheRefresh to re-run the search" % (round(age), self.ttl, normalised_search))
+        return json.loads(row[1])
+
+    def set(self, mode, search, earliest_time, latest_time, result):
+        cache_key, normalised_search = self.make_key(mode, search, earliest_time, latest_time)
+        with self.lock:
+            self.connection.execute("INSERT OR REPLACE INTO search_cache (cache_key, created, search, earliest_time, latest_time, result) "\
+                "VALUES (?, ?, ?, ?, ?, ?)", (cache_key, time.time(), normalised_search, earliest_time, latest_time, json.dumps(result)))
+            self.connection.commit()
+
+    # Remove anything older than the ttl so the file does not grow forever
+    def purge_expired(self):
+        with self.lock:
+            cursor = self.connection.execute("DELETE FROM search_cache WHERE created < ?", (time.time() - self.ttl,))
+            self.connection.commit()
+        logger.debug("search cache file=%s purged expired_entries=%s" % (self.path, cursor.rowcount))
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
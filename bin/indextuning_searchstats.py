@@ -0,0 +1,85 @@
+import threading
+import json
+import csv
+import logging
+from io import open
+
+logger = logging.getLogger()
+
+###############################
+#
+# Cost of every search the index tuning runs against the search head
+#   each search is recorded with the phase (license_usage, compression_ratio et cetera) and index it was run for,
+#   the wall time, the job statistics (runDuration, scanCount, eventCount) where a search job was created, and the
+#   size of the results returned. Written as a JSON and CSV report at the end of the run to find the expensive
+#   searches and the per-index searches that should be batched
+#
+###############################
+class search_stats:
+    fields = [ "phase", "index", "mode", "cached", "failed", "sid", "wall_time", "run_duration", "scan_count",
+        "event_count", "result_count", "result_bytes", "attempts", "search" ]
+
+    def __init__(self):
+        # searches may be running in multiple threads (utility.run_concurrently)
+        self.lock = threading.Lock()
+        self.records = []
+
+    # A new record for a search, the job statistics are None unless a search job was created
+    # (oneshot searches do not return a sid so only the wall time and results are known)
+    def new_record(self, phase, index_name, mode, search):
+        record = dict((field, None) for field in self.fields)
+        record.update({ "phase": phase, "index": index_name, "mode": mode, "cached": False, "failed": False,
+            "result_count": 0, "result_bytes": 0, "attempts": 0, "search": search })
+        return record
+
+    def add(self, record):
+        logger.debug("search_stats phase=%s index=%s mode=%s cached=%s failed=%s wall_time=%s run_duration=%s scan_count=%s "\
+            "event_count=%s result_count=%s result_bytes=%s attempts=%s" % (record["phase"], record["index"], record["mode"],
+            record["cached"], record["failed"], record["wall_time"], record["run_duration"], record["scan_count"],
+            record["event_count"], record["result_count"], record["result_bytes"], record["attempts"]))
+        with self.lock:
+            self.records.append(record)
+
+    # Totals per phase, cached searches are counted but do not add to the cost on the search head
+    def summary(self):
+        phases = {}
+        with self.lock:
+            records = list(self.records)
+
+        for record in records:
+            phase = phases.setdefault(record["phase"], { "searches": 0, "cached": 0, "failed": 0, "wall_time": 0.0,
+                "run_duration": 0.0, "scan_count": 0, "event_count": 0, "result_bytes": 0 })
+            phase["searches"] = phase["searches"] + 1
+            if record["cached"]:
+                phase["cached"] = phase["cached"] + 1
+                continue
+            if record["failed"]:
+                phase["failed"] = phase["failed"] + 1
+            phase["wall_time"] = phase["wall_time"] + record["wall_time"]
+            phase["result_bytes"] = phase["result_bytes"] + record["result_bytes"]
+            for field in [ "run_duration", "scan_count", "event_count" ]:
+                if record[field] is not None:
+                    phase[field] = phase[field] + record[field]
+        return phases
+
+    def write_report(self, json_path, csv_path):
+        with self.lock:
+            records = sorted(self.records, key=lambda record: record["wall_time"], reverse=True)
+        phases = self.summary()
+
+        for phase_name in sorted(phases.keys()):
+            phase = phases[phase_name]
+            logger.info("Search cost phase=%s searches=%s cached=%s failed=%s wall_time=%.2f run_duration=%.2f scan_count=%s "\
+                "event_count=%s result_bytes=%s" % (phase_name, phase["searches"], phase["cached"], phase["failed"],
+                phase["wall_time"], phase["run_duration"], phase["scan_count"], phase["event_count"], phase["result_bytes"]))
+
+        with open(json_path, "w", encoding='utf-8') as json_file:
+            json_file.write(json.dumps({ "phases": phases, "searches": records }, indent=2))
+
+        with open(csv_path, "w", encoding='utf-8', newline='') as csv_file:
+            writer = csv.DictWriter(csv_file, fieldnames=self.fields)
+            writer.writeheader()
+            for record in records:
+                writer.writerow(record)
+
+        logger.info("Search cost report of search_count=%s written to json_file=%s csv_file=%s" % (len(records), json_path, csv_path))
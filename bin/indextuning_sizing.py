@@ -0,0 +1,269 @@
+import logging
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+logger = logging.getLogger()
+
+###############################
+#
+# Numeric core of the bucket and index sizing
+#   the per-index inputs (compression ratio, license usage, disk usage et cetera) are gathered once into columns and
+#   the sizing calculations run over all indexes at once, the decisions that only depend on the numbers (alternative
+#   bucket size, bucket increase/decrease, days until full, minimum size overrides) are returned as masks
+#   run_bucket_sizing and run_index_sizing apply the results per index and write the logs and change comments
+#   with numpy each column is an array, without numpy the same calculations run per index on floats
+#
+###############################
+
+def is_column(value):
+    return numpy is not None and isinstance(value, numpy.ndarray)
+
+
+def where(condition, if_true, if_false):
+    if is_column(condition):
+        return numpy.where(condition, if_true, if_false)
+    return if_true if condition else if_false
+
+
+# Division where a zero denominator returns zero, the caller masks these entries out
+def divide(numerator, denominator):
+    if is_column(numerator) or is_column(denominator):
+        numerator, denominator = numpy.broadcast_arrays(numpy.asarray(numerator, dtype=float), numpy.asarray(denominator, dtype=float))
+        return numpy.divide(numerator, denominator, out=numpy.zeros(numerator.shape), where=denominator != 0)
+    if denominator == 0:
+        return 0.0
+    return numerator / denominator
+
+
+# int(round(x)) and int(x) as floats, both round half to even like python
+def rint(value):
+    if is_column(value):
+        return numpy.rint(value)
+    return float(round(value))
+
+
+def trunc(value):
+    if is_column(value):
+        return numpy.trunc(value)
+    return float(int(value))
+
+
+def logical_not(value):
+    if is_column(value):
+        return numpy.logical_not(value)
+    return not value
+
+
+# Run core over the rows (a list of dictionaries of floats, one per index), returns a dictionary of result name to a list
+# with one entry per row
+def evaluate(core, rows, *args):
+    if len(rows) == 0:
+        return {}
+
+    if numpy is not None:
+        columns = dict((key, numpy.array([ row[key] for row in rows ], dtype=float)) for key in rows[0])
+        results = core(columns, *args)
+        return dict((key, numpy.broadcast_to(value, (len(rows),)).tolist()) for key, value in results.items())
+
+    results = [ core(dict((key, float(value)) for key, value in row.items()), *args) for row in rows ]
+    return dict((key, [ result[key] for result in results ]) for key in results[0])
+
+
+# The bucket size in MB of a maxDataSize setting (as stored by indextuning_btool), 0 if it is not a number
+def max_data_size_mb(max_data_size):
+    if max_data_size == "10240_auto":
+        return 10240
+    elif max_data_size == "750_auto":
+        return 750
+    try:
+        return int(max_data_size)
+    except ValueError:
+        return 0
+
+
+def frozen_time_period_in_days(an_index):
+    return int(an_index.frozen_time_period_in_secs)/60/60/24
+
+
+def comp_ratio_column(an_index, upper_comp_ratio_level):
+    if an_index.index_comp_ratio > upper_comp_ratio_level:
+        return upper_comp_ratio_level
+    return an_index.index_comp_ratio
+
+
+def sizing_comment_column(an_index):
+    if an_index.size_per_day_in_mb is None:
+        return -1
+    return int(an_index.size_per_day_in_mb)
+
+
+# Bucket sizing inputs for one index, the recommended_bucket_size must already include the bucket contingency
+def bucket_sizing_row(an_index, upper_comp_ratio_level):
+    max_data_size = an_index.max_data_size
+    return { "index_comp_ratio": comp_ratio_column(an_index, upper_comp_ratio_level),
+             "avg_license_usage_per_day": an_index.avg_license_usage_per_day,
+             "max_license_usage_per_day": an_index.max_license_usage_per_day,
+             "frozen_time_period_in_days": frozen_time_period_in_days(an_index),
+             "splunk_max_disk_usage_mb": an_index.splunk_max_disk_usage_mb,
+             "sizing_comment": sizing_comment_column(an_index),
+             "summary_index": bool(an_index.summary_index),
+             "max_hot_buckets": an_index.max_hot_buckets,
+             "recommended_bucket_size": an_index.recommended_bucket_size,
+             "auto_bucket": max_data_size.find("auto") != -1,
+             "bucket_auto_size": float(max_data_size[0:max_data_size.find("_")]) if max_data_size.find("auto") != -1 else 0.0,
+             "high_volume": max_data_size == "10240_auto",
+             "default_volume": max_data_size == "750_auto" }
+
+
+def bucket_sizing_core(col, num_of_indexers, rep_factor_multiplier, bucket_contingency, min_size_to_calculate, do_not_lose_data_flag):
+    comp_ratio = col["index_comp_ratio"]
+    avg_license = col["avg_license_usage_per_day"]
+    sizing_comment = col["sizing_comment"]
+    auto_bucket = col["auto_bucket"] != 0
+    high_volume = col["high_volume"] != 0
+    not_summary = logical_not(col["summary_index"] != 0)
+
+    # If the license usage suggests larger buckets than dbinspect (e.g. poorly parsed dates), only used with enough data on disk
+    # as tiny indexes have compression ratios that break this calculation
+    alt_calculated = col["splunk_max_disk_usage_mb"] > min_size_to_calculate
+    alt_bucket_size = divide((col["max_license_usage_per_day"] * comp_ratio * rep_factor_multiplier) / num_of_indexers, col["max_hot_buckets"]) * bucket_contingency
+    use_alt_bucket_size = alt_calculated & (alt_bucket_size > col["recommended_bucket_size"])
+    recommended_bucket_size = where(use_alt_bucket_size, alt_bucket_size, col["recommended_bucket_size"])
+
+    perc_diff = divide(100, col["bucket_auto_size"]) * recommended_bucket_size
+
+    # with a sizing comment size on the comment, or the larger of the comment and the license usage if we do not lose data
+    if do_not_lose_data_flag:
+        commented_size = where(avg_license > sizing_comment, avg_license, sizing_comment)
+    else:
+        commented_size = sizing_comment
+    license_calc_size = where(sizing_comment >= 0, commented_size, avg_license)
+    calculated_size = (comp_ratio * license_calc_size * col["frozen_time_period_in_days"] * rep_factor_multiplier) / num_of_indexers
+
+    # Do not give out free space by increasing the bucket sizing unless its a summary index
+    decrease_required = ((col["max_hot_buckets"] * col["bucket_auto_size"]) > calculated_size) & not_summary & high_volume
+    increase_allowed = logical_not(logical_not(decrease_required) & ((col["max_hot_buckets"] * 10240) > calculated_size) & not_summary & (col["default_volume"] != 0))
+
+    increase_candidate = auto_bucket & (perc_diff > 100) & logical_not(high_volume)
+    increase = increase_candidate & increase_allowed
+    decrease = auto_bucket & logical_not(increase_candidate) & (((recommended_bucket_size < 750) & (col["bucket_auto_size"] > 750)) | decrease_required)
+
+    return { "alt_calculated": alt_calculated, "alt_bucket_size": alt_bucket_size, "use_alt_bucket_size": use_alt_bucket_size,
+             "recommended_bucket_size": recommended_bucket_size, "perc_diff": perc_diff, "license_calc_size": license_calc_size,
+             "calculated_size": calculated_size, "decrease_required": decrease_required, "increase_allowed": increase_allowed,
+             "increase_candidate": increase_candidate, "increase": increase, "decrease": decrease }
+
+
+# Index sizing inputs for one index
+def index_sizing_row(an_index, upper_comp_ratio_level):
+    summary_usage_change_per_day = 0.0
+    if an_index.summary_index and an_index.summary_usage_change_per_day is not None:
+        summary_usage_change_per_day = an_index.summary_usage_change_per_day
+    return { "index_comp_ratio": comp_ratio_column(an_index, upper_comp_ratio_level),
+             "avg_license_usage_per_day": an_index.avg_license_usage_per_day,
+             "frozen_time_period_in_days": frozen_time_period_in_days(an_index),
+             "max_total_data_size_mb": float(an_index.max_total_data_size_mb),
+             "splunk_max_disk_usage_mb": float(an_index.splunk_max_disk_usage_mb),
+             "oldest_data_found": an_index.oldest_data_found,
+             "sizing_comment": sizing_comment_column(an_index),
+             "summary_index": bool(an_index.summary_index),
+             "summary_usage_change_per_day": summary_usage_change_per_day,
+             "max_data_size": max_data_size_mb(an_index.max_data_size),
+             "max_hot_buckets": an_index.max_hot_buckets }
+
+
+def index_sizing_core(col, num_of_indexers, rep_factor_multiplier, sizing_continency, lower_index_size_limit):
+    comp_ratio = col["index_comp_ratio"]
+    avg_license = col["avg_license_usage_per_day"]
+    frozen_days = col["frozen_time_period_in_days"]
+    max_total_data_size_mb = col["max_total_data_size_mb"]
+    disk_usage = col["splunk_max_disk_usage_mb"]
+    sizing_comment = col["sizing_comment"]
+    summary_index = col["summary_index"] != 0
+    summary_change = col["summary_usage_change_per_day"]
+
+    # size per indexer based on recent license usage
+    calculated_size = (comp_ratio * avg_license * frozen_days * rep_factor_multiplier) / num_of_indexers
+    ingest_per_indexer = (comp_ratio * avg_license * rep_factor_multiplier) / num_of_indexers
+
+    # zero incoming data (or compression ratio) means we can keep the frozen time period
+    no_incoming_data = calculated_size == 0.0
+    days_is_frozen = no_incoming_data | (comp_ratio == 0.0)
+    estimated_days = where(summary_index, rint(divide(max_total_data_size_mb, calculated_size * sizing_continency)),
+        rint(divide(max_total_data_size_mb, ingest_per_indexer * sizing_continency)))
+    estimated_days = where(days_is_frozen, frozen_days, estimated_days)
+    # an index with no incoming data and no sizing comment is capped at current size + contingency
+    zero_data_size = rint(disk_usage * sizing_continency)
+    zero_data_size = where(zero_data_size < lower_index_size_limit, lower_index_size_limit, zero_data_size)
+
+    estimated_total_data_size = trunc(calculated_size)
+    size_with_contingency = rint(calculated_size * sizing_continency)
+
+    # summary indexes are sized on the current size and the change per day
+    summary_shrinking = summary_index & (summary_change < 0.0)
+    summary_growing = summary_index & logical_not(summary_change < 0.0)
+    size_with_contingency = where(summary_shrinking, trunc(disk_usage * sizing_continency),
+        where(summary_growing, trunc(disk_usage + (sizing_continency * summary_change * frozen_days)), size_with_contingency))
+    estimated_total_data_size = where(summary_shrinking, trunc(disk_usage),
+        where(summary_growing, trunc(disk_usage + (summary_change * frozen_days)), estimated_total_data_size))
+
+    # within 2 buckets worth of the max data size the index is assumed 100% full
+    full = (disk_usage + (2 * col["max_data_size"])) > max_total_data_size_mb
+    perc_utilised = where(full, 100, rint(divide(disk_usage, max_total_data_size_mb) * 100))
+
+    days_until_full_disk_calculation = where(comp_ratio * avg_license * rep_factor_multiplier == 0.0, frozen_days,
+        rint(divide(max_total_data_size_mb - disk_usage, ingest_per_indexer)))
+    days_until_full_disk_calculation = where(days_until_full_disk_calculation > frozen_days, frozen_days, days_until_full_disk_calculation)
+
+    days_until_full = frozen_days - trunc(col["oldest_data_found"])
+    days_until_full_negative = logical_not(full) & (days_until_full < 0)
+    days_until_full = where(days_until_full < 0, 0, days_until_full)
+
+    no_disk_usage = disk_usage == 0.0
+    estimate_ratio = divide(estimated_total_data_size, disk_usage)
+    days_until_full_on_estimate = where(no_disk_usage, frozen_days, frozen_days - rint(estimate_ratio * frozen_days))
+    perc_utilised_on_estimate = where(no_disk_usage, 0, rint(estimate_ratio * 100))
+
+    days_until_full = where(full, 0, days_until_full)
+    days_until_full_disk_calculation = where(full, 0, days_until_full_disk_calculation)
+    days_until_full_on_estimate = where(full, 0, days_until_full_on_estimate)
+    perc_utilised_on_estimate = where(full, 100, perc_utilised_on_estimate)
+
+    # Bucket explosion occurs if we undersize an index too much so cap at the lower size limit and at least max_hot_buckets buckets
+    size = where(size_with_contingency < lower_index_size_limit, lower_index_size_limit, size_with_contingency)
+    min_req_size = trunc(col["max_hot_buckets"]) * col["max_data_size"]
+    min_size_override = size < min_req_size
+    size = where(min_size_override, min_req_size, size)
+    perc_est = divide(size, max_total_data_size_mb)
+
+    # The size based on the sizing comment (MB/day) rather than the license usage
+    commented_size = (sizing_comment * comp_ratio * frozen_days * rep_factor_multiplier) / num_of_indexers * sizing_continency
+    commented_size = rint(where(commented_size < lower_index_size_limit, lower_index_size_limit, commented_size))
+    commented_days_calculated = (comp_ratio != 0.0) & (avg_license != 0)
+    commented_days = rint(divide(max_total_data_size_mb, ingest_per_indexer * sizing_continency))
+
+    return { "calculated_size": calculated_size, "no_incoming_data": no_incoming_data, "zero_data_size": zero_data_size,
+             "days_is_frozen": days_is_frozen, "estimated_days": estimated_days, "estimated_total_data_size": estimated_total_data_size,
+             "estimated_total_data_size_with_contingency": size_with_contingency, "summary_shrinking": summary_shrinking,
+             "full": full, "perc_utilised": perc_utilised, "perc_utilised_on_estimate": perc_utilised_on_estimate,
+             "days_until_full": days_until_full, "days_until_full_negative": days_until_full_negative,
+             "days_until_full_disk_calculation": days_until_full_disk_calculation,
+             "days_until_full_disk_calculation_on_estimate": days_until_full_on_estimate, "size": size, "min_req_size": min_req_size,
+             "min_size_override": min_size_override, "perc_est": perc_est, "commented_size": commented_size,
+             "commented_days_calculated": commented_days_calculated, "commented_days": commented_days }
+
+
+def bucket_sizing(index_list, index_names, num_of_indexers, rep_factor_multiplier, bucket_contingency, min_size_to_calculate,
+    do_not_lose_data_flag, upper_comp_ratio_level):
+    rows = [ bucket_sizing_row(index_list[index_name], upper_comp_ratio_level) for index_name in index_names ]
+    logger.debug("Running bucket sizing calculations for index_count=%s numpy=%s" % (len(rows), numpy is not None))
+    return evaluate(bucket_sizing_core, rows, num_of_indexers, rep_factor_multiplier, bucket_contingency, min_size_to_calculate, do_not_lose_data_flag)
+
+
+def index_sizing(index_list, index_names, num_of_indexers, rep_factor_multiplier, sizing_continency, lower_index_size_limit, upper_comp_ratio_level):
+    rows = [ index_sizing_row(index_list[index_name], upper_comp_ratio_level) for index_name in index_names ]
+    logger.debug("Running index sizing calculations for index_count=%s numpy=%s" % (len(rows), numpy is not None))
+    return evaluate(index_sizing_core, rows, num_of_indexers, rep_factor_multiplier, sizing_continency, lower_index_size_limit)
@@ -0,0 +1,156 @@
+import json
+import os
+import logging
+from io import open
+
+logger = logging.getLogger()
+
+###############################
+#
+# Snapshot of the per-index metrics and recommendations of the last tuning run
+#   used by the -incremental mode, an index is only re-queried and re-sized if its license usage has moved beyond a
+#   threshold or its btool settings changed, all other indexes carry forward the metrics and recommendations from
+#   the previous run
+#
+###############################
+
+# btool settings (plus the sizing comment) which if changed require the index to be re-evaluated
+settings_attributes = [ "conf_file", "datatype", "frozen_time_period_in_secs", "max_data_size", "max_total_data_size_mb",
+    "max_hot_buckets", "homepath_max_data_size_mb", "coldpath_max_datasize_mb", "size_per_day_in_mb" ]
+
+# metrics found by index_tuning_presteps (and the dbinspect bucket size per hour from run_bucket_sizing), these are also
+# what indextuning_scenarios re-runs the sizing against
+metric_attributes = [ "avg_license_usage_per_day", "first_seen", "max_license_usage_per_day", "index_comp_ratio",
+    "splunk_max_disk_usage_mb", "oldest_data_found", "newest_data_found", "summary_index", "summary_usage_change_per_day",
+    "bucket_size_per_hour" ]
+
+# recommendations found by run_bucket_sizing and run_index_sizing
+result_attributes = [ "recommended_bucket_size", "number_recommended_bucket_size", "max_data_size", "calc_max_total_data_size_mb",
+    "estimated_total_data_size", "estimated_total_data_size_with_contingency", "perc_utilised", "perc_utilised_on_estimate",
+    "days_until_full", "days_until_full_disk_calculation", "days_until_full_disk_calculation_on_estimate",
+    "homepath_max_data_size_mb", "cold_path_max_data_size_mb", "change_comment", "checked" ]
+
+
+def copy_attributes(an_index, attributes):
+    return dict((attribute, getattr(an_index, attribute)) for attribute in attributes)
+
+
+# Record the btool settings of an index before the sizing functions modify the index object
+def capture_settings(an_index):
+    return copy_attributes(an_index, settings_attributes)
+
+
+# Load the previous snapshot, if the sizing parameters differ the previous recommendations cannot be re-used
+def load_snapshot(path, sizing_parameters):
+    if not os.path.isfile(path):
+        logger.info("No previous snapshot file=%s found, all indexes will be evaluated" % (path))
+        return False
+
+    try:
+        with open(path, encoding='utf-8') as snapshot_file:
+            snapshot = json.load(snapshot_file)
+    except (IOError, ValueError) as e:
+        logger.warn("Unable to read snapshot file=%s, all indexes will be evaluated, error=\"%s\"" % (path, e))
+        return False
+
+    if snapshot.get("sizing_parameters") != sizing_parameters:
+        logger.info("Sizing parameters have changed since the previous snapshot previous=\"%s\" current=\"%s\", all indexes will be evaluated"
+                    % (snapshot.get("sizing_parameters"), sizing_parameters))
+        return False
+
+    logger.info("Loaded snapshot file=%s created=%s with index_count=%s" % (path, snapshot["created"], len(snapshot["indexes"])))
+    return snapshot
+
+
+def license_changed(previous, current, threshold):
+    if previous == 0:
+        return current != 0
+    return abs(current - previous) / float(previous) > threshold
+
+
+# An index is unchanged if the btool settings are identical, the days of license data are identical and the average
+# license usage per day is within the threshold (0.1 is 10 percent) of the previous run
+def is_unchanged(snapshot, an_index, threshold):
+    if snapshot == False or an_index.name not in snapshot["indexes"]:
+        return False
+
+    previous = snapshot["indexes"][an_index.name]
+    if previous["settings"] != an_index.btool_settings:
+        logger.debug("index=%s settings changed since the previous snapshot previous=\"%s\" current=\"%s\"" % (an_index.name, previous["settings"], an_index.btool_settings))
+        return False
+
+    if "avg_license_usage_per_day" not in previous["metrics"] or previous["metrics"]["first_seen"] != an_index.first_seen:
+        return False
+
+    if license_changed(previous["metrics"]["avg_license_usage_per_day"], an_index.avg_license_usage_per_day, threshold):
+        logger.debug("index=%s license usage changed previous=%s current=%s threshold=%s" % (an_index.name, previous["metrics"]["avg_license_usage_per_day"],
+                     an_index.avg_license_usage_per_day, threshold))
+        return False
+
+    return True
+
+
+def restore_metrics(snapshot, an_index):
+    for attribute, value in snapshot["indexes"][an_index.name]["metrics"].items():
+        setattr(an_index, attribute, value)
+
+
+# Carry forward the recommendations of the previous run for the unchanged indexes
+def restore_results(snapshot, index_list, unchanged_index_names, indexes_requiring_changes, conf_files_requiring_changes):
+    for index_name in unchanged_index_names:
+        if index_name not in index_list:
+            continue
+        previous = snapshot["indexes"][index_name]
+        for attribute, value in previous["results"].items():
+            setattr(index_list[index_name], attribute, value)
+
+        if previous["requires_change"]:
+            indexes_requiring_changes[index_name] = previous["requires_change"]
+            conf_file = index_list[index_name].conf_file
+            if conf_file not in conf_files_requiring_changes:
+                conf_files_requiring_changes.append(conf_file)
+            logger.info("index=%s unchanged since the previous run, carrying forward requires_change=%s" % (index_name, previous["requires_change"]))
+
+
+# The indexes not evaluated in this run (-indexNameRestriction/-indexLimit) keep their entry from the previous snapshot so that
+# a restricted run does not lose the metrics and recommendations of every other index, if the sizing parameters changed the
+# previous entries cannot be kept and a restricted run does not replace the snapshot
+def save_snapshot(path, created, index_list, sizing_parameters, indexes_requiring_changes):
+    indexes = {}
+    for index_name in list(index_list.keys()):
+        an_index = index_list[index_name]
+        if an_index.btool_settings is None:
+            continue
+        indexes[index_name] = { "settings": an_index.btool_settings,
+                                "metrics": copy_attributes(an_index, metric_attributes),
+                                "results": copy_attributes(an_index, result_attributes),
+                                "requires_change": indexes_requiring_changes.get(index_name, False) }
+
+    not_evaluated = [ index_name for index_name in index_list if index_name not in indexes ]
+    if len(not_evaluated) > 0 and os.path.isfile(path):
+        try:
+            with open(path, encoding='utf-8') as snapshot_file:
+                previous = json.load(snapshot_file)
+        except (IOError, ValueError) as e:
+            logger.warn("Unable to read the previous snapshot file=%s, only the evaluated indexes are saved, error=\"%s\"" % (path, e))
+            previous = False
+
+        if previous != False and previous.get("sizing_parameters") != sizing_parameters:
+            logger.warn("Not saving snapshot file=%s as index_count=%s were not evaluated and the sizing parameters differ from the previous snapshot"
+                        % (path, len(not_evaluated)))
+            return
+
+        if previous != False:
+            carried_forward = 0
+            for index_name in not_evaluated:
+                if index_name in previous["indexes"]:
+                    indexes[index_name] = previous["indexes"][index_name]
+                    carried_forward = carried_forward + 1
+            logger.info("Snapshot keeps the previous entries of index_count=%s not evaluated in this run" % (carried_forward))
+
+    snapshot = { "created": created, "sizing_parameters": sizing_parameters, "indexes": indexes }
+    temp_path = path + ".tmp"
+    with open(temp_path, "w", encoding='utf-8') as snapshot_file:
+        snapshot_file.write(json.dumps(snapshot))
+    os.rename(temp_path, path)
+    logger.info("Saved snapshot file=%s with index_count=%s" % (path, len(indexes)))
@@ -1,28 +1,44 @@
 import six.moves.urllib.request, six.moves.urllib.parse, six.moves.urllib.error
 import requests
+from requests.adapters import HTTPAdapter
 from xml.dom import minidom
 import re
 from subprocess import Popen, PIPE, check_output
 import threading
+from concurrent.futures import ThreadPoolExecutor
 import six.moves.queue
-from time import sleep
+from time import sleep, time
 import sys
 import os
 import logging
 from io import open
+import indextuning_searchstats
 
-logger = logging.getLogger()
-
-# Splunk volume
-class volume:
-    def __init__(self, name):
-        self.name = name
+# index and volume are re-exported as they were previously defined here
+from indextuning_btool import index, volume
+import indextuning_btool
+import indextuning_confresolver
+import indextuning_catalogcache
+import indextuning_paths
 
+logger = logging.getLogger()
 
-# Splunk index
-class index:
-    def __init__(self, name):
-        self.name = name
+class search_error(Exception):
+    def __init__(self, url, search, status_code=None, reason=None, text=None, retryable=None):
+        self.url = url
+        self.search = search
+        self.status_code = status_code
+        self.reason = reason
+        self.text = text
+        # connection failures, timeouts, throttling and 5xx responses may work on a retry
+        # a 4xx response such as a bad search or failed login will not
+        if retryable is None:
+            retryable = status_code is None or status_code == 429 or status_code >= 500
+        self.retryable = retryable
+        # Splunk responds with a 503 once the role based concurrent search quota is reached
+        self.quota_exceeded = status_code == 503 and text is not None and text.find("maximum number of concurrent") != -1
+        Exception.__init__(self, "url=%s status_code=%s reason=%s text=%s"
+                           % (url, status_code, reason, text))
 
 
 # Index Tuning Utility Class
@@ -33,14 +49,39 @@ class utility:
     splunkrest = ""
     earliest_time = ""
 
-    def __init__(self, username, password, splunkrest, earliest_time):
+    def __init__(self, username, password, splunkrest, earliest_time, connect_timeout=10,
+                 read_timeout=600, max_retries=3, retry_backoff=2, max_concurrent_searches=4,
+                 max_quota_waits=10, search_cache=None):
         self.username = username
         self.password = password
         self.splunkrest = splunkrest
         self.earliest_time = earliest_time
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.max_concurrent_searches = max_concurrent_searches
+        self.max_quota_waits = max_quota_waits
+        # determined on first use of run_concurrently, None if the quota could not be determined
+        self.search_quota = None
+        self.search_quota_checked = False
+        # optional indextuning_searchcache.search_cache, consulted before any search is run
+        self.search_cache = search_cache
+        # cost of each search run (or read from the cache), reported at the end of the run
+        self.search_stats = indextuning_searchstats.search_stats()
+
+        # A single keep-alive session is re-used for every search, this avoids a new
+        # TCP/TLS handshake per query which adds minutes when we have hundreds of indexes
+        self.session = requests.Session()
+        self.session.auth = (username, password)
+        self.session.verify = False
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(10, max_concurrent_searches))
+        self.session.mount('https://', adapter)
 
     # Run a search query against the Splunk restful API
-    def run_search_query(self, searchQuery):
+    # phase and index_name tag the search in the search cost report, index_name is * for a search across all indexes
+    # raises search_error if the search fails after max_retries attempts
+    def run_search_query(self, searchQuery, phase="search", index_name="*"):
         baseurl = 'https://' + self.splunkrest
 
         # For troubleshooting
@@ -51,33 +92,233 @@ class utility:
         data = {'search': searchQuery, 'earliest_time': self.earliest_time,
                 'latest_time': 'now', 'output_mode': "json",
                 "exec_mode": "oneshot", "timeout": 0 }
-        logger.debug("Running against URL=%s with username=%s "\
+        stats = self.search_stats.new_record(phase, index_name, "oneshot", searchQuery)
+        start_time = time()
+        try:
+            if self.search_cache:
+                json_result = self.search_cache.get("oneshot", searchQuery, self.earliest_time, 'now')
+                if json_result is not None:
+                    stats["cached"] = True
+                    stats["result_count"] = len(json_result.get("results", []))
+                    return json_result
+
+            logger.debug("Running against URL=%s with username=%s "\
+                "with data_load=%s" % (url, self.username, data))
+
+            json_result = self.run_rest_request("post", url, searchQuery, data=data, require_body=True, stats=stats)
+            stats["result_count"] = len(json_result.get("results", []))
+        except search_error:
+            stats["failed"] = True
+            raise
+        finally:
+            stats["wall_time"] = time() - start_time
+            self.search_stats.add(stats)
+
+        if self.search_cache:
+            self.search_cache.set("oneshot", searchQuery, self.earliest_time, 'now', json_result)
+        return json_result
+
+    # Run a search query as a normal search job and yield the results one row at a time, the results are
+    # retrieved page_size rows at a time so the full result set is never held in memory and we are not
+    # capped by the oneshot result limits, used for searches that return one row per index
+    # phase and index_name tag the search in the search cost report, index_name is * for a search across all indexes
+    # raises search_error if the search fails after max_retries attempts
+    def run_search_query_stream(self, searchQuery, page_size=10000, phase="search", index_name="*"):
+        # For troubleshooting
+        logger.debug("SearchQuery=\n" + searchQuery)
+
+        # the wall time includes the time the caller spends on each row, this is negligible compared to the search
+        stats = self.search_stats.new_record(phase, index_name, "stream", searchQuery)
+        start_time = time()
+        try:
+            for result in self.run_search_job(searchQuery, page_size, stats):
+                yield result
+        except search_error:
+            stats["failed"] = True
+            raise
+        finally:
+            stats["wall_time"] = time() - start_time
+            self.search_stats.add(stats)
+
+    # Used by run_search_query_stream, runs the search job (or reads the cache) and records the job statistics in stats
+    def run_search_job(self, searchQuery, page_size, stats):
+        baseurl = 'https://' + self.splunkrest
+
+        # a cached result set is small enough to hold (one row per index), only keep a copy of the rows if we are caching
+        cached_results = False
+        if self.search_cache:
+            cached_results = self.search_cache.get("stream", searchQuery, self.earliest_time, 'now')
+            if cached_results is not None:
+                stats["cached"] = True
+                stats["result_count"] = len(cached_results)
+                for result in cached_results:
+                    yield result
+                return
+            cached_results = []
+
+        url = baseurl + '/services/search/jobs'
+        data = {'search': searchQuery, 'earliest_time': self.earliest_time,
+                'latest_time': 'now', 'output_mode': "json",
+                "exec_mode": "normal" }
+        logger.debug("Creating search job against URL=%s with username=%s "\
             "with data_load=%s" % (url, self.username, data))
-        res = requests.post(url, auth=(self.username, self.password),
-                            data=data, verify=False)
-
-        if res.status_code != requests.codes.ok:
-            logger.error("Failed to run search on URL=%s with username=%s "\
-            "response_code=%s, reason=%s, text=%s, payload=%s"
-                          % (url, self.username, res.status_code,
-                             res.reason, res.text, data))
-            sys.exit(-1)
-
-        if res.text != "":
-            logger.debug("Result from query=%s" % (res.text))
-        else:
-            logger.warn("Result from query=%s URL=%s with username=%s "\
-            "response_code=%s, reason=%s, text=%s, payload=%s"
-                          % (res.text, url, self.username, res.status_code,
-                             res.reason, res.text, data))
-            res = requests.post(url, auth=(self.username, self.password),
-                            data=data, verify=False)
-            if res.text != "":
-                logger.info("Query retry suceeded")
+        sid = self.run_rest_request("post", url, searchQuery, data=data, require_body=True)["sid"]
+        stats["sid"] = sid
+        job_url = url + "/" + six.moves.urllib.parse.quote(sid)
+
+        try:
+            # Poll the job until it completes, backing off to a maximum of 5 seconds between checks
+            poll_delay = 0.5
+            while True:
+                content = self.run_rest_request("get", job_url, searchQuery, params={'output_mode': 'json'})["entry"][0]["content"]
+                # a failed job is also done, it must be raised (and not cached) rather than treated as an empty result set
+                if content.get("isFailed") or content.get("dispatchState") == "FAILED":
+                    raise search_error(job_url, searchQuery, reason="search job sid=%s failed messages=%s" % (sid, content.get("messages")),
+                                       retryable=False)
+                if content["isDone"]:
+                    break
+                sleep(poll_delay)
+                poll_delay = min(poll_delay * 2, 5)
+
+            logger.debug("sid=%s completed with resultCount=%s runDuration=%s" % (sid, content.get("resultCount"), content.get("runDuration")))
+            stats["run_duration"] = float(content.get("runDuration", 0))
+            stats["scan_count"] = int(content.get("scanCount", 0))
+            stats["event_count"] = int(content.get("eventCount", 0))
+
+            offset = 0
+            while True:
+                page = self.run_rest_request("get", job_url + "/results", searchQuery,
+                                             params={'output_mode': 'json', 'count': page_size, 'offset': offset}, stats=stats)
+                results = page.get("results", [])
+                stats["result_count"] = stats["result_count"] + len(results)
+                logger.debug("sid=%s offset=%s returned result_count=%s" % (sid, offset, len(results)))
+                if cached_results != False:
+                    cached_results.extend(results)
+                for result in results:
+                    yield result
+                if len(results) < page_size:
+                    break
+                offset = offset + page_size
+
+            if cached_results != False:
+                self.search_cache.set("stream", searchQuery, self.earliest_time, 'now', cached_results)
+        finally:
+            # The job would expire on its own but there is no reason to keep the results around
+            try:
+                self.run_rest_request("delete", job_url, searchQuery, params={'output_mode': 'json'})
+            except search_error as e:
+                logger.debug("Unable to delete search job sid=%s error=\"%s\"" % (sid, e))
+
+    # Send a request to the Splunk restful API on the shared session and return the JSON response
+    # connection failures, throttling and 5xx responses are retried with backoff, require_body
+    # also retries an empty response (the oneshot endpoint sometimes returns an empty body)
+    # if a search_stats record is passed the attempts and the bytes returned are added to it
+    # raises search_error if the request fails after max_retries attempts
+    def run_rest_request(self, method, url, searchQuery, data=None, params=None, require_body=False, stats=None):
+        attempt = 0
+        quota_waits = 0
+        while True:
+            attempt = attempt + 1
+            if stats:
+                stats["attempts"] = stats["attempts"] + 1
+            try:
+                res = self.session.request(method, url, data=data, params=params, timeout=(self.connect_timeout, self.read_timeout))
+            except requests.exceptions.RequestException as e:
+                error = search_error(url, searchQuery, reason=str(e))
             else:
-                logger.warn("Query retry failed")
+                if stats:
+                    stats["result_bytes"] = stats["result_bytes"] + len(res.content)
+                if res.status_code not in (requests.codes.ok, requests.codes.created):
+                    error = search_error(url, searchQuery, res.status_code, res.reason, res.text)
+                elif res.text == "" and require_body:
+                    error = search_error(url, searchQuery, res.status_code, res.reason, res.text, retryable=True)
+                else:
+                    logger.debug("Result from query=%s" % (res.text))
+                    try:
+                        return res.json()
+                    except ValueError as e:
+                        error = search_error(url, searchQuery, res.status_code, "invalid json %s" % (e), res.text, retryable=False)
+
+            # Hitting the concurrent search quota is expected while running searches in parallel, wait for a
+            # slot to free up without using up the retries
+            if error.quota_exceeded and quota_waits < self.max_quota_waits:
+                quota_waits = quota_waits + 1
+                attempt = attempt - 1
+                delay = min(self.retry_backoff * (2 ** (quota_waits - 1)), 60)
+                logger.info("Concurrent search quota reached on URL=%s with username=%s, quota_wait=%s of max_quota_waits=%s, "\
+                    "retrying in delay=%s seconds" % (url, self.username, quota_waits, self.max_quota_waits, delay))
+                sleep(delay)
+                continue
 
-        return res.json()
+            if not error.retryable or attempt > self.max_retries:
+                logger.error("Failed to run search on URL=%s with username=%s "\
+                    "response_code=%s, reason=%s, text=%s, payload=%s, params=%s, attempts=%s"
+                    % (url, self.username, error.status_code, error.reason, error.text, data, params, attempt))
+                raise error
+
+            delay = self.retry_backoff * (2 ** (attempt - 1))
+            logger.warn("Query failed on URL=%s with username=%s response_code=%s, reason=%s, "\
+                "attempt=%s of max_retries=%s, retrying in delay=%s seconds"
+                % (url, self.username, error.status_code, error.reason, attempt, self.max_retries, delay))
+            sleep(delay)
+
+    # Determine the concurrent search quota (srchJobsQuota) of the user we are logged in as, this is the
+    # largest quota of any role the user holds, returns None if it cannot be determined
+    def determine_search_quota(self):
+        baseurl = 'https://' + self.splunkrest
+        try:
+            json_result = self.run_rest_request("get", baseurl + '/services/authentication/current-context', None, params={'output_mode': 'json'})
+            roles = json_result["entry"][0]["content"]["roles"]
+
+            search_quota = None
+            for role in roles:
+                json_result = self.run_rest_request("get", baseurl + '/services/authorization/roles/' + six.moves.urllib.parse.quote(role),
+                                                    None, params={'output_mode': 'json'})
+                role_quota = int(json_result["entry"][0]["content"]["srchJobsQuota"])
+                logger.debug("role=%s srchJobsQuota=%s" % (role, role_quota))
+                if search_quota is None or role_quota > search_quota:
+                    search_quota = role_quota
+        except (search_error, ValueError, KeyError, IndexError) as e:
+            logger.warn("Unable to determine the search quota for username=%s, error=\"%s\"" % (self.username, e))
+            return None
+
+        logger.info("username=%s has search_quota=%s" % (self.username, search_quota))
+        return search_quota
+
+    # Run func(item) for each item in a bounded thread pool, the number of threads is kept below the
+    # search quota of the user so that other searches (scheduled or otherwise) can still run
+    # results are returned as a dictionary keyed by item, func should not modify shared objects
+    def run_concurrently(self, func, items):
+        if not self.search_quota_checked:
+            self.search_quota = self.determine_search_quota()
+            self.search_quota_checked = True
+
+        # a quota of 0 allows no concurrent searches, the items are then run one at a time
+        max_workers = self.max_concurrent_searches
+        if self.search_quota is not None and max_workers >= self.search_quota:
+            max_workers = self.search_quota - 1
+        if max_workers < 1:
+            max_workers = 1
+
+        results = {}
+        if max_workers == 1 or len(items) <= 1:
+            for item in items:
+                results[item] = func(item)
+            return results
+
+        logger.info("Running item_count=%s with max_workers=%s search_quota=%s" % (len(items), max_workers, self.search_quota))
+        executor = ThreadPoolExecutor(max_workers=max_workers)
+        try:
+            futures = {}
+            for item in items:
+                futures[item] = executor.submit(func, item)
+            # wait in the original order so the results do not depend on which thread finished first
+            for item in items:
+                results[item] = futures[item].result()
+        finally:
+            executor.shutdown(wait=True)
+
+        return results
 
     ##############
     #
@@ -85,125 +326,25 @@ class utility:
     #
     ##############
     # Run the btool command and parse the output
-    def parse_btool_output(self):
-        #  Keep a large dictionary of the indexes and associated information
-        indexes = {}
-        volumes = {}
-
-        # Run python btool and read the output, use debug switch to obtain
-        # file names
-        logger.debug("Running /opt/splunk/bin/splunk btool indexes list --debug")
-        output = check_output(["/opt/splunk/bin/splunk", "btool", "indexes",
-                              "list", "--debug"])
-        output = output.split("\n")
-
-        # If we are currently inside a [volume...] stanza or not...
-        disabled = False
-
-        # Work line by line on the btool output
-        for line in output:
-            # don't attempt to parse empty lines
-            if line == "":
-                continue
-
-            logger.debug("Working with line=" + line)
-            # Search for the [<indexname>]
-            # Split the string /opt/splunk/etc/slave-apps/_cluster/local/indexes.conf                [_internal]
-            # into 2 pieces
-            regex = re.compile(r"^([^ ]+) +(.*)")
-            result = regex.match(line)
-            conf_file = result.group(1)
-            string_res = result.group(2)
-            logger.debug("conf_file=%s, string_res=%s" % (conf_file, string_res))
-            # Further split a line such as:
-            # homePath.maxDataSizeMB = 0
-            # into 2 pieces...
-            # we utilise this later in the code
-            regex2 = re.compile(r"^([^= ]+)\s*=\s*(.*)")
-
-            stanza = ""
-            value = ""
-            if string_res[0] == "[":
-                # Skip volume entries
-                if string_res.find("[volume") == -1:
-                    # Slice it out of the string
-                    index_name = string_res[1:len(string_res)-1]
-                    cur_index = index(index_name)
-                    cur_index.conf_file = conf_file
-                    in_index_mode = True
-                    logger.debug("Working with index=" + str(cur_index))
-                else:
-                    # skip the volume:... part and the ] at the end
-                    vol_name = string_res[8:len(string_res)-1]
-                    vol = volume(vol_name)
-                    vol.conf_file = conf_file
-                    in_index_mode = False
-                    logger.debug("Working with volume=" + vol_name)
-                # We are done with this round of the loop
-                continue
-            else:
-                result2 = regex2.match(string_res)
-                stanza = result2.group(1)
-                value = result2.group(2)
-
-            logger.debug("Working with stanza=%s and value=%s" % (stanza, value))
-            if stanza == "disabled":
-                if value == "1":
-                    disabled = True
-            # Path exists only within volumes
-            elif stanza == "path" and not in_index_mode:
-                vol.path = value
-            elif stanza == "coldPath.maxDataSizeMB" and in_index_mode:
-                cur_index.coldpath_max_datasize_mb = int(value)
-            elif stanza == "coldToFrozenDir" and in_index_mode:
-                if value != "":
-                    cur_index.cold_to_frozen_dir = value
-            elif stanza == "datatype" and in_index_mode:
-                cur_index.datatype = value
-            elif stanza == "frozenTimePeriodInSecs" and in_index_mode:
-                cur_index.frozen_time_period_in_secs = int(value)
-            elif stanza == "homePath.maxDataSizeMB" and in_index_mode:
-                cur_index.homepath_max_data_size_mb = int(value)
-            elif stanza == "homePath" and in_index_mode:
-                cur_index.home_path = value
-            elif stanza == "coldPath" and in_index_mode:
-                cur_index.cold_path = value
-            elif stanza == "maxDataSize" and in_index_mode:
-                cur_index.max_data_size = value
-                if cur_index.max_data_size.find("auto_high_volume") != -1:
-                    cur_index.max_data_size = "10240_auto"
-                elif cur_index.max_data_size.find("auto") != -1:
-                    cur_index.max_data_size = "750_auto"
-            elif stanza == "maxHotBuckets" and in_index_mode:
-                cur_index.max_hot_buckets = float(value)
-            # This setting only appears in volumes
-            elif stanza == "maxVolumeDataSizeMB" and not in_index_mode:
-                vol.max_vol_data_size_mb = int(value)
-            elif stanza == "maxTotalDataSizeMB" and in_index_mode:
-                cur_index.max_total_data_size_mb = int(value)
-            elif stanza == "thawedPath" and in_index_mode:
-                cur_index.thawed_path = value
-
-            if not hasattr(cur_index, "home_path"):
-                    logger.warn("index=%s does not have a homePath, not recording this index" % index_name)
-                    continue                
-            # btool prints in lexicographical order so therefore we can assume
-            # tstatsHomePath is last for an index
-            elif stanza == "tstatsHomePath" and in_index_mode:
-                # Do not record disabled indexes
-                if disabled:
-                    disabled = False
-                    continue
-                cur_index.tstats_home_path = value
-                # btool uses alphabetical order so this is the last entry in
-                # the list
-                indexes[cur_index.name] = cur_index
-                logger.debug("Recording index=%s into indexes dict" % (cur_index.name))
-            elif stanza == "warmToColdScript" and not in_index_mode:
-                logger.debug("Recording vol=%s into volumes dict" % (vol.name))
-                volumes[vol.name] = vol
+    # native_resolver reads the indexes.conf files directly (indextuning_confresolver) rather than running btool
+    # cache_file re-uses the previously parsed indexes/volumes while the indexes.conf files are unchanged (indextuning_catalogcache)
+    def parse_btool_output(self, native_resolver=False, cache_file=False):
+        # the same SPLUNK_HOME is used for btool, the native resolver and the catalog cache fingerprint
+        splunk_home = indextuning_confresolver.default_splunk_home()
+        if native_resolver:
+            resolver = "native"
+            parse_function = lambda: indextuning_confresolver.parse_indexes_conf(splunk_home)
+        else:
+            resolver = "btool"
+            parse_function = lambda: indextuning_btool.parse_btool_output(os.path.join(splunk_home, "bin", "splunk"))
 
-        return indexes, volumes
+        if cache_file:
+            index_list, vol_list = indextuning_catalogcache.cached_catalog(cache_file, parse_function, resolver, splunk_home)
+        else:
+            index_list, vol_list = parse_function()
+        # the paths depend on $SPLUNK_DB as well as the settings so they are resolved after the catalog is loaded
+        indextuning_paths.resolve_index_paths(index_list, vol_list)
+        return index_list, vol_list
 
     #####################
     #
@@ -253,7 +394,7 @@ class utility:
 
                         # Record the size in MB
                         logger.debug("index=%s found size=%s, unit=%s, calculated=%s" % (index_name, size, unit, calc_size))
-                        if hasattr(indexes[index_name], "size_per_day_in_mb"):
+                        if indexes[index_name].size_per_day_in_mb is not None:
                             logger.info("index=%s found size=%s, unit=%s, calculated=%s, but this index already has calculated size of calculated=%s, not changing it"
                                         % (index_name, size, unit, calc_size, indexes[index_name].size_per_day_in_mb))
                         else:
@@ -276,12 +417,16 @@ class utility:
         # added rawSize>0 as streaming hot buckets appear to show 0 rawSize but
         # a sizeOnDiskMB is measured so this results in an unusually large
         # MB/hour number!
-        json_result = self.run_search_query(
-            " | dbinspect index=%s | eval hours=(endEpoch-startEpoch)/60/60 "\
-            " | where hours>1 AND rawSize>0 | eval sizePerHour=sizeOnDiskMB/hours " \
-            " | stats avg(sizePerHour) AS averageSizePerHour " \
-            " | eval bucket_size=averageSizePerHour*%s " \
-            " | fields bucket_size" % (index_name, num_hours_per_bucket))
+        try:
+            json_result = self.run_search_query(
+                " | dbinspect index=%s | eval hours=(endEpoch-startEpoch)/60/60 "\
+                " | where hours>1 AND rawSize>0 | eval sizePerHour=sizeOnDiskMB/hours " \
+                " | stats avg(sizePerHour) AS averageSizePerHour " \
+                " | eval bucket_size=averageSizePerHour*%s " \
+                " | fields bucket_size" % (index_name, num_hours_per_bucket), phase="bucket_size", index_name=index_name)
+        except search_error as e:
+            logger.error("index=%s dbinspect search failed, error=\"%s\"" % (index_name, e))
+            json_result = {}
 
 
         logger.debug("Bucket size json_result=%s" % (json_result))
@@ -295,23 +440,49 @@ class utility:
 
         return bucket_size
 
+    # Bulk version of determine_recommended_bucket_size, dbinspect fans out to every indexer so a single
+    # dbinspect across all indexes is much cheaper than one dbinspect per index
+    # returns a dictionary of index name to bucket_size, or False if the search failed
+    def determine_recommended_bucket_size_bulk(self, num_hours_per_bucket):
+        bucket_sizes = {}
+        # index=* does not include the internal indexes so they are requested separately
+        try:
+            for result in self.run_search_query_stream(
+                " | dbinspect index=* index=_* | eval hours=(endEpoch-startEpoch)/60/60 "\
+                " | where hours>1 AND rawSize>0 | eval sizePerHour=sizeOnDiskMB/hours " \
+                " | stats avg(sizePerHour) AS averageSizePerHour by index " \
+                " | eval bucket_size=averageSizePerHour*%s " \
+                " | fields index, bucket_size" % (num_hours_per_bucket), phase="bucket_size"):
+                bucket_sizes[result["index"]] = float(result["bucket_size"])
+                logger.debug("index=%s bucket_size=%s" % (result["index"], result["bucket_size"]))
+        except search_error as e:
+            logger.error("Bulk dbinspect search failed, falling back to per-index searches, error=\"%s\"" % (e))
+            return False
+
+        logger.info("Bulk dbinspect query found bucket sizing for index_count=%s" % (len(bucket_sizes)))
+        return bucket_sizes
+
     # Over a time period determine how much license was used on average per day,
     # maxmimum during the period and also return number of days of license data
     def determine_license_usage_per_day(self, index_name, earliest_license,
                                     latest_license):
         # Generic query
-        json_result = self.run_search_query(
-            "search index=_internal source=*license_usage.log sourcetype=splunkd "\
-            "earliest=%s latest=%s idx=%s "\
-            "| bin _time span=1d "\
-            "| stats sum(b) AS totalBytes by idx, _time "\
-            "| stats avg(totalBytes) AS avgBytesPerDay, "\
-            "  max(totalBytes) AS maxBytesPerDay, earliest(_time) AS firstSeen "\
-            "| eval avgMBPerDay=round(avgBytesPerDay/1024/1024), "\
-            "  maxMBPerDay=round(maxBytesPerDay/1024/1024), "\
-            "  firstSeen=(now()-firstSeen)/60/60/24 "\
-            "| fields avgMBPerDay, maxMBPerDay, firstSeen" \
-            % (earliest_license, latest_license, index_name))
+        try:
+            json_result = self.run_search_query(
+                "search index=_internal source=*license_usage.log sourcetype=splunkd "\
+                "earliest=%s latest=%s idx=%s "\
+                "| bin _time span=1d "\
+                "| stats sum(b) AS totalBytes by idx, _time "\
+                "| stats avg(totalBytes) AS avgBytesPerDay, "\
+                "  max(totalBytes) AS maxBytesPerDay, earliest(_time) AS firstSeen "\
+                "| eval avgMBPerDay=round(avgBytesPerDay/1024/1024), "\
+                "  maxMBPerDay=round(maxBytesPerDay/1024/1024), "\
+                "  firstSeen=(now()-firstSeen)/60/60/24 "\
+                "| fields avgMBPerDay, maxMBPerDay, firstSeen" \
+                % (earliest_license, latest_license, index_name), phase="license_usage", index_name=index_name)
+        except search_error as e:
+            logger.error("index=%s license usage search failed, error=\"%s\"" % (index_name, e))
+            json_result = {}
 
         logger.debug("index=%s earliest_time=%s latest_time=%s json_result=%s" % (index_name, earliest_license, latest_license, json_result))
 
@@ -328,6 +499,122 @@ class utility:
         # We return the average MB per day, days of license usage available and the max, all as the int type
         return int(avg_mb_per_day), int(float(days_of_license_usage)), int(max_mb_per_day)
 
+    # Bulk version of determine_license_usage_per_day, one search over the license logs
+    # grouped by idx rather than one search per index (each one scanning the same license data)
+    # returns a dictionary of index name to (avg_mb_per_day, days_of_license_usage, max_mb_per_day), or False if the search failed
+    def determine_license_usage_per_day_bulk(self, earliest_license, latest_license):
+        license_usage = {}
+        try:
+            for result in self.run_search_query_stream(
+                "search index=_internal source=*license_usage.log sourcetype=splunkd "\
+                "earliest=%s latest=%s "\
+                "| bin _time span=1d "\
+                "| stats sum(b) AS totalBytes by idx, _time "\
+                "| stats avg(totalBytes) AS avgBytesPerDay, "\
+                "  max(totalBytes) AS maxBytesPerDay, earliest(_time) AS firstSeen by idx "\
+                "| eval avgMBPerDay=round(avgBytesPerDay/1024/1024), "\
+                "  maxMBPerDay=round(maxBytesPerDay/1024/1024), "\
+                "  firstSeen=(now()-firstSeen)/60/60/24 "\
+                "| fields idx, avgMBPerDay, maxMBPerDay, firstSeen" \
+                % (earliest_license, latest_license), phase="license_usage"):
+                index_name = result["idx"]
+                avg_mb_per_day = int(result["avgMBPerDay"])
+                days_of_license_usage = int(float(result["firstSeen"]))
+                max_mb_per_day = int(result["maxMBPerDay"])
+                logger.debug("determine_license_usage_per_day_bulk recording index=%s avg_mb_per_day=%s days_of_license_usage=%s max_mb_per_day=%s" % (index_name, avg_mb_per_day, days_of_license_usage, max_mb_per_day))
+                license_usage[index_name] = (avg_mb_per_day, days_of_license_usage, max_mb_per_day)
+        except search_error as e:
+            logger.error("Bulk license usage search failed, falling back to per-index searches, error=\"%s\"" % (e))
+            return False
+
+        logger.info("Bulk license query earliest_time=%s latest_time=%s found license usage for index_count=%s" % (earliest_license, latest_license, len(license_usage)))
+        return license_usage
+
+    # An index with no license usage that only contains the stash sourcetype is a summary index, for summary indexes
+    # the average daily growth (from the introspection logs) is used instead of license usage for sizing
+    # returns summary_index (True/False) and the average change per day or None if it could not be found
+    def determine_summary_index(self, index_name):
+        try:
+            json_result = self.run_search_query("| metadata index=%s type=sourcetypes | table sourcetype" % (index_name),
+                                                phase="summary_index", index_name=index_name)
+        except search_error as e:
+            logger.error("index=%s metadata search failed, assuming this is not a summary index, error=\"%s\"" % (index_name, e))
+            json_result = {}
+
+        # If we get no results back assume its not a summary index
+        if not ("results" in json_result and len(json_result["results"]) == 1 and json_result["results"][0]["sourcetype"] == "stash"):
+            logger.debug("No stash only metadata found for index=%s, please ensure the username can see this index to check for stash sourcetype..." % (index_name))
+            return False, None
+
+        # At this point we know its a summary index
+        # So we can use the average growth rate to determine if any sizing changes are required
+        try:
+            json_result = self.run_search_query(""" search index=_introspection \"data.name\"=\"%s\"
+            | bin _time span=1d
+            | stats max(data.total_size) AS total_size by host, _time
+            | streamstats current=f window=1 max(total_size) AS prev_total by host
+            | eval diff=total_size - prev_total
+            | stats avg(diff) AS avgchange by host
+            | stats avg(avgchange) AS overallavg""" % (index_name), phase="summary_growth", index_name=index_name)
+        except search_error as e:
+            logger.error("index=%s summary index growth search failed, error=\"%s\"" % (index_name, e))
+            json_result = {}
+
+        summary_usage_change_per_day = None
+        if "results" in json_result and len(json_result["results"]) == 1:
+            summary_usage_change_per_day = float(json_result["results"][0]["overallavg"])
+            logger.info("index=%s is a summary index, average_change_per_day=%s from introspection logs" % (index_name, summary_usage_change_per_day))
+        return True, summary_usage_change_per_day
+
+    # Bulk version of determine_summary_index, one tstats search finds the sourcetypes of all the requested indexes
+    # and one introspection search finds the growth rate of all summary indexes found
+    # returns a dictionary of index name to (summary_index, summary_usage_change_per_day), or False if a search failed
+    def determine_summary_indexes_bulk(self, index_names):
+        summary_indexes = {}
+        if len(index_names) == 0:
+            return summary_indexes
+
+        for index_name in index_names:
+            summary_indexes[index_name] = (False, None)
+
+        index_filter = " OR ".join(["index=\"%s\"" % (index_name) for index_name in index_names])
+        stash_indexes = []
+        try:
+            for result in self.run_search_query_stream("| tstats count where (%s) by index, sourcetype "\
+                "| stats dc(sourcetype) AS sourcetype_count, values(sourcetype) AS sourcetype by index "\
+                "| where sourcetype_count=1 AND sourcetype=\"stash\" "\
+                "| fields index" % (index_filter), phase="summary_index"):
+                stash_indexes.append(result["index"])
+        except search_error as e:
+            logger.error("Bulk summary index tstats search failed, falling back to per-index searches, error=\"%s\"" % (e))
+            return False
+
+        if len(stash_indexes) == 0:
+            return summary_indexes
+
+        for index_name in stash_indexes:
+            summary_indexes[index_name] = (True, None)
+
+        name_filter = " OR ".join(["\"data.name\"=\"%s\"" % (index_name) for index_name in stash_indexes])
+        try:
+            for result in self.run_search_query_stream(""" search index=_introspection (%s)
+                | bin _time span=1d
+                | stats max(data.total_size) AS total_size by data.name, host, _time
+                | streamstats current=f window=1 max(total_size) AS prev_total by data.name, host
+                | eval diff=total_size - prev_total
+                | stats avg(diff) AS avgchange by data.name, host
+                | stats avg(avgchange) AS overallavg by data.name""" % (name_filter), phase="summary_growth"):
+                if "overallavg" not in result:
+                    continue
+                summary_usage_change_per_day = float(result["overallavg"])
+                logger.info("index=%s is a summary index, average_change_per_day=%s from introspection logs" % (result["data.name"], summary_usage_change_per_day))
+                summary_indexes[result["data.name"]] = (True, summary_usage_change_per_day)
+        except search_error as e:
+            logger.error("Bulk summary index growth search failed, falling back to per-index searches, error=\"%s\"" % (e))
+            return False
+
+        return summary_indexes
+
     """
      There are many potential ways to determine the index compression ratio,
      multiple options were considered
@@ -353,8 +640,7 @@ class utility:
         # earliest time, therefore it's a trade off in terms of
         # which one we choose
         if use_introspection_data:
-            json_result = self.run_search_query(
-                "search earliest=-10m index=_introspection component=Indexes host=%s data.name=%s "\
+            search = "search earliest=-10m index=_introspection component=Indexes host=%s data.name=%s "\
                 "| eval minTime=coalesce('data.bucket_dirs.cold.event_min_time', 'data.bucket_dirs.home.event_min_time'), "\
                 " maxTime=coalesce('data.bucket_dirs.home.event_max_time', 'data.bucket_dirs.cold.event_max_time') "\
                 "| stats first(data.total_size) AS total_size, "\
@@ -371,8 +657,8 @@ class utility:
                 "  newest_time = floor((now() - newest_time) / 86400)" \
                 "| eval earliest_time = if(isnotnull(earliest_time), "\
                 "  earliest_time, 0) "\
-                "| fields ratio, max_total_size, earliest_time, newest_time"
-                % (indexerhostnamefilter, index_name))
+                "| fields ratio, max_total_size, earliest_time, newest_time" \
+                % (indexerhostnamefilter, index_name)
         else:
             search = "| rest /services/data/indexes/%s splunk_server=%s "\
                     "| join title splunk_server type=outer "\
@@ -389,7 +675,12 @@ class utility:
                       newest_time = floor((now() - newest_time) / 86400)
                     | eval earliest_time = if(isnotnull(earliest_time), earliest_time, 0)
                     | fields ratio, max_total_size, earliest_time, newest_time"""
-            json_result = self.run_search_query(search)
+
+        try:
+            json_result = self.run_search_query(search, phase="compression_ratio", index_name=index_name)
+        except search_error as e:
+            logger.error("index=%s compression ratio search failed, error=\"%s\"" % (index_name, e))
+            json_result = {}
 
         logger.debug("determine_compression_ratio index_name=%s use_introspection_data=%s json_result=%s"% (index_name, use_introspection_data, json_result))
 
@@ -415,6 +706,74 @@ class utility:
 
         return ratio, maxtotalsize, earliest_time, newest_time
 
+    # Bulk version of determine_compression_ratio, a single introspection search grouped by data.name
+    # or a single REST call across all indexes/indexers rather than a search (and join) per index
+    # returns a dictionary of index name to (ratio, max_total_size, earliest_time, newest_time), or False if the search failed
+    def determine_compression_ratio_bulk(self, indexerhostnamefilter, use_introspection_data):
+        if use_introspection_data:
+            name_field = "data.name"
+            search = "search earliest=-10m index=_introspection component=Indexes host=%s "\
+                "| eval minTime=coalesce('data.bucket_dirs.cold.event_min_time', 'data.bucket_dirs.home.event_min_time'), "\
+                " maxTime=coalesce('data.bucket_dirs.home.event_max_time', 'data.bucket_dirs.cold.event_max_time') "\
+                "| stats first(data.total_size) AS total_size, "\
+                "  first(data.total_raw_size) AS total_raw_size, "\
+                "  min(minTime) AS earliest_time, "\
+                "  max(maxTime) AS newest_time by data.name, host "\
+                "| stats sum(total_size) AS total_size, "\
+                "  sum(total_raw_size) AS total_raw_size, "\
+                "  max(total_size) AS max_total_size, "\
+                "  min(earliest_time) AS earliest_time, "\
+                "  max(newest_time) AS newest_time by data.name "\
+                "| eval ratio=total_size/total_raw_size, "\
+                "  earliest_time = ceiling((now() - earliest_time) / 86400) , "\
+                "  newest_time = floor((now() - newest_time) / 86400)" \
+                "| eval earliest_time = if(isnotnull(earliest_time), "\
+                "  earliest_time, 0) "\
+                "| fields data.name, ratio, max_total_size, earliest_time, newest_time" \
+                % (indexerhostnamefilter)
+        else:
+            name_field = "title"
+            # count=0 as the REST endpoint otherwise returns the first 30 indexes only
+            search = "| rest /services/data/indexes splunk_server=%s count=0 datatype=all "\
+                    "| join title splunk_server type=outer "\
+                    "[| rest /services/data/indexes-extended splunk_server=%s count=0 datatype=all]" % (indexerhostnamefilter, indexerhostnamefilter)
+
+            search = search + """| eval minTime=strptime(minTime,"%Y-%m-%dT%H:%M:%S%z"), maxTime=strptime(maxTime,"%Y-%m-%dT%H:%M:%S%z")
+                    | stats sum(currentDBSizeMB) AS total_size,
+                     max(currentDBSizeMB) AS max_total_size,
+                     sum(total_raw_size) AS total_raw_size,
+                     min(minTime) AS earliest_time
+                     max(maxTime) AS newest_time by title
+                    | eval ratio=total_size/total_raw_size,
+                      earliest_time = ceiling((now() - earliest_time) / 86400),
+                      newest_time = floor((now() - newest_time) / 86400)
+                    | eval earliest_time = if(isnotnull(earliest_time), earliest_time, 0)
+                    | fields title, ratio, max_total_size, earliest_time, newest_time"""
+
+        comp_ratios = {}
+        try:
+            for result in self.run_search_query_stream(search, phase="compression_ratio"):
+                index_name = result[name_field]
+                # ratio is null when the raw size is zero, same as the single index query use 0.5 as a guess
+                if len(result) != 5:
+                    logger.error("Unexpected results, expected 5 fields and got result='%s' "\
+                        "from bulk compression ratio query with indexhostnamefilter=%s" % (result, indexerhostnamefilter))
+                    comp_ratios[index_name] = (float(0.5), float(0), int(0), int(0))
+                    continue
+
+                ratio = float(result["ratio"])
+                maxtotalsize = float(result["max_total_size"])
+                earliest_time = result["earliest_time"]
+                newest_time = result["newest_time"]
+                logger.debug("determine_compression_ratio_bulk index=%s ratio=%s maxtotalsize=%s earliest_time=%s newest_time=%s" % (index_name, ratio, maxtotalsize, earliest_time, newest_time))
+                comp_ratios[index_name] = (ratio, maxtotalsize, earliest_time, newest_time)
+        except search_error as e:
+            logger.error("Bulk compression ratio search failed, falling back to per-index searches, error=\"%s\"" % (e))
+            return False
+
+        logger.info("Bulk compression ratio query use_introspection_data=%s found index_count=%s" % (use_introspection_data, len(comp_ratios)))
+        return comp_ratios
+
     # List only directories and not files under a particular directory
     def listdirs(self, dir):
         return [d for d in os.listdir(dir) if os.path.isdir(os.path.join(dir, d))]